@@ -0,0 +1,51 @@
+"""
+    Throughput of shared counters updated by all slaves: atomic
+    fetch_add and add_at of AtomicInt64Array, compared with
+    increments in a critical section.
+"""
+import numpy
+
+from common import record, timeit, nps, sharedmem
+
+def bench_counter(quick):
+    """ increments per second of a single contended counter. """
+    n = 200 if quick else 2000
+    m = 100
+    counter = sharedmem.empty((), dtype='i8')
+    atomic = sharedmem.AtomicInt64Array(1)
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            def work(i):
+                for j in range(m):
+                    with pool.critical:
+                        counter[...] += 1
+            t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+            def work(i):
+                for j in range(m):
+                    atomic.fetch_add(0)
+            t2 = timeit(lambda: pool.map(work, range(n)), repeat=1)
+        yield record('counter.critical', n * m / t, 'add/s', True, np=np)
+        yield record('counter.fetch_add', n * m / t2, 'add/s', True,
+                np=np, lockfree=atomic.lockfree)
+
+def bench_histogram(quick):
+    """ samples per second binned into a shared histogram. """
+    n = 20 if quick else 200
+    m = 10000
+    nbins = 64
+    hist = sharedmem.empty(nbins, dtype='i8')
+    atomic = sharedmem.AtomicInt64Array(nbins)
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            def work(i):
+                bins = numpy.random.randint(nbins, size=m)
+                with pool.critical:
+                    numpy.add.at(hist, bins, 1)
+            t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+            def work(i):
+                bins = numpy.random.randint(nbins, size=m)
+                atomic.add_at(bins)
+            t2 = timeit(lambda: pool.map(work, range(n)), repeat=1)
+        yield record('histogram.critical', n * m / t, 'sample/s', True, np=np)
+        yield record('histogram.add_at', n * m / t2, 'sample/s', True,
+                np=np, lockfree=atomic.lockfree)
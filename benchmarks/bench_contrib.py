@@ -0,0 +1,23 @@
+"""
+    Speedup of contrib/array.py over numpy.
+"""
+import numpy
+
+from common import record, timeit, load_contrib
+
+def bench_argsort(quick):
+    array = load_contrib('array')
+    a = numpy.random.random(1024 * 1024 * (1 if quick else 16))
+    t0 = timeit(lambda: a.argsort(), repeat=1)
+    t = timeit(lambda: array.argsort(a), repeat=1)
+    yield record('contrib.argsort.speedup', t0 / t, 'x', True, size=len(a))
+
+def bench_pufunc(quick):
+    array = load_contrib('array')
+    a = numpy.random.random(1024 * 1024 * (4 if quick else 64))
+    t0 = timeit(lambda: numpy.sin(a))
+    t = timeit(lambda: array.sin(a))
+    yield record('contrib.pufunc.sin.speedup', t0 / t, 'x', True, size=len(a))
+    t0 = timeit(lambda: numpy.add.reduce(a))
+    t = timeit(lambda: array.add.reduce(a))
+    yield record('contrib.pufunc.add.reduce.speedup', t0 / t, 'x', True, size=len(a))
@@ -0,0 +1,48 @@
+"""
+    Throughput of a small shared table read and updated by all slaves,
+    protected by critical, RWLock and SeqLock, at read:write ratios
+    from 99:1 to 50:50.
+"""
+
+from common import record, timeit, nps, sharedmem
+
+RATIOS = [99, 90, 50]
+
+def bench_rwlock(quick):
+    """ operations per second at each percentage of reads. """
+    n = 100 if quick else 1000
+    m = 100
+    table = sharedmem.empty(16, dtype='f8')
+    table[...] = 0
+    rwlock = sharedmem.RWLock()
+    seqlock = sharedmem.SeqLock(16, dtype='f8')
+    for np in nps(quick):
+        for reads in RATIOS:
+            with sharedmem.MapReduce(np=np) as pool:
+                def critical(i):
+                    for j in range(m):
+                        with pool.critical:
+                            if j % 100 < reads:
+                                table.sum()
+                            else:
+                                table[...] += 1
+                def rw(i):
+                    for j in range(m):
+                        if j % 100 < reads:
+                            with rwlock.read:
+                                table.sum()
+                        else:
+                            with rwlock.write:
+                                table[...] += 1
+                def seq(i):
+                    for j in range(m):
+                        if j % 100 < reads:
+                            seqlock.read().sum()
+                        else:
+                            with seqlock as data:
+                                data[...] += 1
+                for name, work in [('critical', critical),
+                        ('rwlock', rw), ('seqlock', seq)]:
+                    t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+                    yield record('locks.' + name, n * m / t, 'op/s', True,
+                            np=np, reads=reads)
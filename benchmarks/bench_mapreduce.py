@@ -0,0 +1,151 @@
+"""
+    Dispatch overhead and scaling of MapReduce.map, compared with
+    multiprocessing.Pool on the same workloads; throughput of critical
+    and ordered sections; histograms accumulated under critical and in
+    reduction buffers; startup of background; teardown of the slaves.
+"""
+import time
+import multiprocessing
+
+import numpy
+
+from common import record, timeit, nps, sharedmem
+
+def _noop(i):
+    return i
+
+def _spin(i):
+    # about 1 ms of python work
+    t0 = time.time()
+    while time.time() - t0 < 1e-3:
+        pass
+    return i
+
+def bench_dispatch(quick):
+    """ per-item latency of a trivial work function. """
+    n = 2000 if quick else 20000
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            t = timeit(lambda: pool.map(_noop, range(n)))
+        yield record('mapreduce.dispatch', t / n, 's/item', np=np)
+
+        pool = multiprocessing.Pool(np)
+        try:
+            t = timeit(lambda: pool.map(_noop, range(n), chunksize=1))
+        finally:
+            pool.terminate()
+            pool.join()
+        yield record('multiprocessing.dispatch', t / n, 's/item', np=np)
+
+def bench_chunked(quick):
+    """ per-item latency of a trivial work function with
+        chunksize='auto', compared with multiprocessing.Pool's default. """
+    n = 20000 if quick else 200000
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            t = timeit(lambda: pool.map(_noop, range(n), chunksize='auto'))
+        yield record('mapreduce.dispatch.auto', t / n, 's/item', np=np)
+
+        pool = multiprocessing.Pool(np)
+        try:
+            t = timeit(lambda: pool.map(_noop, range(n)))
+        finally:
+            pool.terminate()
+            pool.join()
+        yield record('multiprocessing.dispatch.auto', t / n, 's/item', np=np)
+
+def bench_throughput(quick):
+    """ items per second of 1 ms work items. """
+    n = 200 if quick else 2000
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            t = timeit(lambda: pool.map(_spin, range(n)), repeat=1)
+        yield record('mapreduce.throughput', n / t, 'item/s', True, np=np)
+
+        pool = multiprocessing.Pool(np)
+        try:
+            t = timeit(lambda: pool.map(_spin, range(n), chunksize=1), repeat=1)
+        finally:
+            pool.terminate()
+            pool.join()
+        yield record('multiprocessing.throughput', n / t, 'item/s', True, np=np)
+
+def bench_critical(quick):
+    """ critical sections entered per second, all slaves contending. """
+    n = 200 if quick else 2000
+    m = 100
+    counter = sharedmem.empty((), dtype='i8')
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            def work(i):
+                for j in range(m):
+                    with pool.critical:
+                        counter[...] += 1
+            t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+        yield record('mapreduce.critical', n * m / t, 'enter/s', True, np=np)
+
+def bench_striped(quick):
+    """ sections entered per second, all slaves updating 16 unrelated
+        counters under the global lock and under the lock stripes. """
+    n = 200 if quick else 2000
+    m = 100
+    counters = sharedmem.empty(16, dtype='i8')
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            def work(i):
+                for j in range(m):
+                    with pool.critical:
+                        counters[j % 16] += 1
+            t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+            def work(i):
+                for j in range(m):
+                    with pool.critical[j % 16]:
+                        counters[j % 16] += 1
+            t2 = timeit(lambda: pool.map(work, range(n)), repeat=1)
+        yield record('mapreduce.striped.global', n * m / t, 'enter/s', True, np=np)
+        yield record('mapreduce.striped', n * m / t2, 'enter/s', True, np=np)
+
+def bench_reduction(quick):
+    """ tasks per second adding into a large histogram, under critical
+        and into the private buffers of pool.reduction. """
+    n = 100 if quick else 1000
+    nbins = 1000000
+    m = 100000
+    hist = sharedmem.empty(nbins, dtype='i8')
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            def work(i):
+                h = numpy.bincount(numpy.random.randint(nbins, size=m), minlength=nbins)
+                with pool.critical:
+                    hist[...] += h
+            t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+            reduction = pool.reduction(nbins, dtype='i8')
+            def work(i):
+                h = numpy.bincount(numpy.random.randint(nbins, size=m), minlength=nbins)
+                reduction.local[...] += h
+            t2 = timeit(lambda: pool.map(work, range(n)), repeat=1)
+        yield record('mapreduce.histogram.critical', n / t, 'task/s', True, np=np)
+        yield record('mapreduce.histogram.reduction', n / t2, 'task/s', True, np=np)
+
+def bench_ordered(quick):
+    """ ordered sections entered per second. """
+    n = 1000 if quick else 10000
+    for np in nps(quick):
+        with sharedmem.MapReduce(np=np) as pool:
+            def work(i):
+                with pool.ordered:
+                    pass
+            t = timeit(lambda: pool.map(work, range(n)), repeat=1)
+        yield record('mapreduce.ordered', n / t, 'enter/s', True, np=np)
+
+def bench_background(quick):
+    """ time to start, run a trivial function and join a background job. """
+    t = timeit(lambda: sharedmem.background(_noop, 1).wait(), repeat=10)
+    yield record('background.startup', t, 's')
+
+def bench_teardown(quick):
+    """ time of a map with one trivial item per slave; dominated by fork and join. """
+    for np in ([8, 16] if quick else [8, 64, 128]):
+        with sharedmem.MapReduce(np=np) as pool:
+            t = timeit(lambda: pool.map(_noop, range(np)))
+        yield record('mapreduce.teardown', t, 's', np=np)
@@ -0,0 +1,22 @@
+"""
+    Allocation and copy bandwidth of shared memory arrays.
+"""
+import numpy
+
+from common import record, timeit, sharedmem
+
+def bench_empty(quick):
+    """ time to allocate and touch every page of a shared array. """
+    n = 1024 * 1024 * (16 if quick else 128)
+    def work():
+        a = sharedmem.empty(n, dtype='u1')
+        a[::4096] = 1
+    t = timeit(work)
+    yield record('sharedmem.empty', n / t / 1e9, 'GB/s', True, bytes=n)
+
+def bench_copy(quick):
+    """ bandwidth of copying a private array to shared memory. """
+    n = 1024 * 1024 * (16 if quick else 128)
+    a = numpy.ones(n, dtype='u1')
+    t = timeit(lambda: sharedmem.copy(a))
+    yield record('sharedmem.copy', n / t / 1e9, 'GB/s', True, bytes=n)
@@ -0,0 +1,61 @@
+"""
+    Speedup of sharedmem.ops over numpy.
+"""
+import numpy
+
+from common import record, timeit, sharedmem
+
+from sharedmem import ops
+
+def bench_ufunc(quick):
+    """ speedup of the call, reduce and accumulate of a ufunc """
+    a = numpy.random.random(1024 * 1024 * (4 if quick else 64))
+    out = numpy.empty_like(a)
+    for name, f0, f in [
+        ('sin', lambda: numpy.sin(a, out=out), lambda: ops.sin(a, out=out)),
+        ('add', lambda: numpy.add(a, 1.0, out=out), lambda: ops.add(a, 1.0, out=out)),
+        ('add.reduce', lambda: numpy.add.reduce(a), lambda: ops.add.reduce(a)),
+        ('add.accumulate', lambda: numpy.add.accumulate(a, out=out),
+            lambda: ops.add.accumulate(a, out=out)),
+        ]:
+        f()
+        t0 = timeit(f0)
+        t = timeit(f)
+        yield record('ops.%s.speedup' % name, t0 / t, 'x', True, size=len(a))
+
+def bench_small(quick):
+    """ seconds per call on arrays of a few blocks; no fork is paid """
+    a = numpy.random.random(1024 * 256)
+    ops.sin(a)
+    n = 100 if quick else 1000
+    t = timeit(lambda: ops.sin(a), number=n)
+    yield record('ops.sin.small', t, 's', size=len(a))
+
+def bench_reductions(quick):
+    """ speedup of the deterministic reductions over numpy """
+    a = numpy.random.random(1024 * 1024 * (4 if quick else 64))
+    for name, f0, f in [
+        ('sum', lambda: numpy.sum(a), lambda: ops.sum(a)),
+        ('sum.compensated', lambda: numpy.sum(a), lambda: ops.sum(a, compensated=True)),
+        ('var', lambda: numpy.var(a), lambda: ops.var(a)),
+        ('argmin', lambda: numpy.argmin(a), lambda: ops.argmin(a)),
+        ]:
+        t0 = timeit(f0)
+        t = timeit(f)
+        yield record('ops.%s.speedup' % name, t0 / t, 'x', True, size=len(a))
+
+def bench_sort(quick):
+    """ speedup of the sample sort over numpy, on uniform, Zipf and
+        sorted inputs """
+    n = 1024 * 1024 * (4 if quick else 64)
+    for name, a in [
+        ('uniform', numpy.random.random(n)),
+        ('zipf', numpy.random.zipf(1.5, n)),
+        ('sorted', numpy.arange(n, dtype='f8')),
+        ]:
+        t0 = timeit(lambda: numpy.sort(a), repeat=1)
+        t = timeit(lambda: ops.sort(a), repeat=1)
+        yield record('ops.sort.speedup', t0 / t, 'x', True, input=name, size=n)
+        t0 = timeit(lambda: numpy.argsort(a, kind='mergesort'), repeat=1)
+        t = timeit(lambda: ops.argsort(a, kind='mergesort'), repeat=1)
+        yield record('ops.argsort.speedup', t0 / t, 'x', True, input=name, size=n)
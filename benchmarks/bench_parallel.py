@@ -0,0 +1,86 @@
+"""
+    Loop schedules and barriers of sharedmem.parallel.Parallel.
+"""
+import numpy
+
+from common import record, timeit, nps, sharedmem
+from sharedmem.parallel import Parallel, Reduction
+
+def bench_forloop(quick):
+    """ iterations per second of an empty loop body. """
+    n = 20000 if quick else 200000
+    for np in nps(quick):
+        for schedule, chunk in [('static', 1), ('dynamic', 1), ('dynamic', 16),
+                ('guided', 1)]:
+            def work():
+                with Parallel(num_threads=np) as p:
+                    for i in p.forloop(range(n), schedule=(schedule, chunk)):
+                        pass
+            t = timeit(work, repeat=1)
+            yield record('parallel.forloop', n / t, 'iter/s', True,
+                    np=np, schedule=schedule, chunk=chunk)
+
+def bench_forblocks(quick):
+    """ elements per second of a vectorized loop body, per block of
+        the schedule; compare with parallel.forloop. """
+    n = 2000000 if quick else 20000000
+    x = sharedmem.empty(n)
+    x[...] = 1.0
+    for np in nps(quick):
+        for schedule, chunk in [('static', None), ('dynamic', None),
+                ('dynamic', 4096), ('guided', None)]:
+            def work():
+                with Parallel(num_threads=np) as p:
+                    for sl in p.forblocks(n, schedule=(schedule, chunk)):
+                        numpy.sqrt(x[sl], out=x[sl])
+            t = timeit(work, repeat=1)
+            yield record('parallel.forblocks', n / t, 'element/s', True,
+                    np=np, schedule=schedule, chunk=chunk)
+
+def bench_ordered(quick):
+    """ iterations per second of an ordered loop; beyond cpu_count the
+        ranks waiting for their turn block instead of spinning. """
+    n = 2000 if quick else 20000
+    ranks = nps(quick)
+    ranks = sorted(set(ranks + [2 * ranks[-1]] + ([] if quick else [64])))
+    for np in ranks:
+        for schedule in ['static', 'dynamic']:
+            def work():
+                with Parallel(num_threads=np) as p:
+                    for i, ordered in p.forloop(range(n), ordered=True,
+                            schedule=schedule):
+                        with ordered:
+                            pass
+            t = timeit(work, repeat=1)
+            yield record('parallel.ordered', n / t, 'iter/s', True,
+                    np=np, schedule=schedule)
+
+def bench_barrier(quick):
+    """ seconds per barrier, for each algorithm and number of ranks;
+        beyond cpu_count the ranks block instead of spinning. """
+    n = 200 if quick else 2000
+    ranks = nps(quick)
+    ranks = sorted(set(ranks + [2 * ranks[-1]] + ([] if quick else [64])))
+    for np in ranks:
+        for barrier in ['turnstile', 'sense', 'dissemination']:
+            def work():
+                with Parallel(num_threads=np, barrier=barrier) as p:
+                    for i in range(n):
+                        p.barrier()
+            t = timeit(work, repeat=1)
+            yield record('parallel.barrier', t / n, 's', np=np, barrier=barrier)
+
+def bench_reduction(quick):
+    """ seconds of a section accumulating a large Reduction variable,
+        such as a histogram; the copies of the ranks are reduced by
+        all ranks, or accumulated inplace. """
+    n = 1000000 if quick else 100000000
+    for np in nps(quick):
+        for inplace in [False, True]:
+            def work():
+                with Parallel(Reduction(numpy.add, h=numpy.zeros(n),
+                            inplace=inplace), num_threads=np) as p:
+                    p.var.h += 1.0
+            t = timeit(work, repeat=1)
+            yield record('parallel.reduction', t, 's', np=np, size=n,
+                    inplace=inplace)
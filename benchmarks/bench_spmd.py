@@ -0,0 +1,56 @@
+"""
+    Latency of the collectives of MapReduce.spmd, and the time per step of
+    an iterative computation in spmd, compared with a map per step.
+"""
+import numpy
+
+from common import record, timeit, nps, sharedmem
+
+def bench_collectives(quick):
+    """ seconds per barrier, bcast and allreduce. """
+    n = 200 if quick else 2000
+    for np in nps(quick):
+        for size in [1, 100000]:
+            with sharedmem.MapReduce(np=np) as pool:
+                a = numpy.ones(size)
+                def barrier(rank):
+                    for i in range(n):
+                        pool.barrier()
+                def bcast(rank):
+                    for i in range(n):
+                        pool.bcast(a)
+                def allreduce(rank):
+                    for i in range(n):
+                        pool.allreduce(a)
+                for name, work in [('barrier', barrier), ('bcast', bcast),
+                        ('allreduce', allreduce)]:
+                    if name == 'barrier' and size != 1: continue
+                    t = timeit(lambda: pool.spmd(work), repeat=1)
+                    yield record('spmd.' + name, t / n, 's', np=np, size=size)
+
+def bench_iterate(quick):
+    """ seconds per step of a Jacobi-like iteration on a shared vector. """
+    n = 20 if quick else 200
+    size = 100000
+    for np in nps(quick):
+        x = sharedmem.empty(size)
+        with sharedmem.MapReduce(np=np) as pool:
+            def spmd(rank):
+                sl = slice(size * rank // np, size * (rank + 1) // np)
+                for step in range(n):
+                    x[sl] = 0.5 * x[sl] + 1
+                    norm = pool.allreduce([numpy.square(x[sl]).sum()])
+                    pool.barrier()
+            x[...] = 0
+            t = timeit(lambda: pool.spmd(spmd), repeat=1)
+            def work(rank):
+                sl = slice(size * rank // np, size * (rank + 1) // np)
+                x[sl] = 0.5 * x[sl] + 1
+                return numpy.square(x[sl]).sum()
+            def steps():
+                for step in range(n):
+                    norm = sum(pool.map(work, range(np)))
+            x[...] = 0
+            t2 = timeit(steps, repeat=1)
+        yield record('spmd.step', t / n, 's', np=np)
+        yield record('map.step', t2 / n, 's', np=np)
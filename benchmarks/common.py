@@ -0,0 +1,63 @@
+"""
+    Helpers shared by the benchmark modules.
+
+    A benchmark is a function named bench_* in a bench_*.py module of this
+    directory. It takes one argument, quick (boolean, use smaller problems),
+    and yields records made by :py:func:`record`.
+"""
+import os
+import sys
+import time
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import sharedmem
+
+def record(name, value, unit, higher_is_better=False, **params):
+    """ a benchmark result.
+
+        name : str, the quantity measured
+        value : float
+        unit : str
+        higher_is_better : boolean, True for rates, False for times
+        params : the parameters of the measurement, e.g. np=4
+    """
+    return dict(name=name, value=float(value), unit=unit,
+            higher_is_better=higher_is_better, params=params)
+
+def timeit(func, repeat=3, number=1):
+    """ best wall clock time of func() in seconds, over repeat runs
+        of number calls each. """
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        for j in range(number):
+            func()
+        t = (time.time() - t0) / number
+        if best is None or t < best:
+            best = t
+    return best
+
+def nps(quick):
+    """ the numbers of slaves to scan; powers of two up to cpu_count """
+    ncpu = sharedmem.cpu_count()
+    r = [1]
+    while r[-1] * 2 <= ncpu:
+        r.append(r[-1] * 2)
+    if r[-1] != ncpu:
+        r.append(ncpu)
+    if quick:
+        r = sorted(set([1, r[-1]]))
+    return r
+
+def load_contrib(name):
+    """ import contrib/name.py; contrib is not a package. """
+    path = os.path.join(ROOT, 'contrib', name + '.py')
+    spec = importlib.util.spec_from_file_location('contrib_' + name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,139 @@
+"""
+    Run the benchmarks and write the results as JSON.
+
+    Usage:
+
+        python benchmarks/run.py [--quick] [-o results.json] [-k pattern]
+                                 [--compare baseline.json] [--threshold 0.2]
+
+    Each result is identified by its name and parameters, such that results
+    from different commits can be compared with --compare; a result that is
+    worse than the baseline by more than the threshold is reported as
+    a regression, and the exit status is 1.
+
+    Benchmarks are functions named bench_* in the bench_*.py modules of
+    this directory; see common.py.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import platform
+import argparse
+import subprocess
+import importlib
+import traceback
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import numpy
+from common import ROOT, sharedmem
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                cwd=ROOT, stderr=subprocess.STDOUT).decode().strip()
+    except Exception:
+        return None
+
+def key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+def discover(pattern):
+    for path in sorted(glob.glob(os.path.join(HERE, 'bench_*.py'))):
+        module = importlib.import_module(os.path.basename(path)[:-3])
+        for name in sorted(dir(module)):
+            if not name.startswith('bench_'):
+                continue
+            fullname = module.__name__ + '.' + name
+            if pattern is not None and pattern not in fullname:
+                continue
+            yield fullname, getattr(module, name)
+
+def compare(results, baseline, threshold):
+    """ print the changes relative to baseline; returns the regressions """
+    old = dict((key(r), r) for r in baseline['results'])
+    regressions = []
+    for r in results:
+        b = old.get(key(r))
+        if b is None or b['value'] == 0 or r['value'] == 0:
+            continue
+        if r['higher_is_better']:
+            change = b['value'] / r['value'] - 1
+        else:
+            change = r['value'] / b['value'] - 1
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(r)
+        print('%-40s %-30s %12.4g %12.4g %+7.1f%% %s' % (r['name'],
+            json.dumps(r['params'], sort_keys=True),
+            b['value'], r['value'], -100 * change, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true',
+            help='use small problems')
+    parser.add_argument('-o', '--output', default=None,
+            help='write the JSON results to this file; default is stdout')
+    parser.add_argument('-k', dest='pattern', default=None,
+            help='only run benchmarks whose name contains pattern')
+    parser.add_argument('--compare', default=None,
+            help='a JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+            help='relative slow down that counts as a regression')
+    ns = parser.parse_args(argv)
+
+    results = []
+    errors = []
+    for name, bench in discover(ns.pattern):
+        sys.stderr.write('%s ...\n' % name)
+        t0 = time.time()
+        try:
+            for r in bench(ns.quick):
+                r['benchmark'] = name
+                results.append(r)
+                sys.stderr.write('    %s %s %.4g %s\n' % (r['name'],
+                    json.dumps(r['params'], sort_keys=True), r['value'], r['unit']))
+        except Exception:
+            errors.append(dict(benchmark=name, traceback=traceback.format_exc()))
+            sys.stderr.write(errors[-1]['traceback'])
+        sys.stderr.write('    %.1f s\n' % (time.time() - t0))
+
+    output = dict(
+        commit=commit(),
+        time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        quick=ns.quick,
+        machine=dict(
+            platform=platform.platform(),
+            python=platform.python_version(),
+            numpy=numpy.__version__,
+            cpu_count=sharedmem.cpu_count(),
+            ),
+        results=results,
+        errors=errors,
+        )
+
+    if ns.output is None:
+        json.dump(output, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(ns.output, 'w') as f:
+            json.dump(output, f, indent=1, sort_keys=True)
+
+    status = 0
+    if ns.compare is not None:
+        with open(ns.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, ns.threshold):
+            status = 1
+    if errors:
+        status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
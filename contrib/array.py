@@ -25,6 +25,19 @@ _funcs2 = [
     ]
 
 
+def _padded(a, b):
+    """ zero-pad a and b to the same length, e.g. the bincounts of
+        two chunks of different maxima. """
+    a, b = numpy.asarray(a), numpy.asarray(b)
+    if a.ndim == 0 or b.ndim == 0 or len(a) == len(b):
+        return a, b
+    n = max(len(a), len(b))
+    def pad(x):
+        y = numpy.zeros((n, ) + x.shape[1:], dtype=x.dtype)
+        y[:len(x)] = x
+        return y
+    return pad(a), pad(b)
+
 class pufunc(object):
     def __init__(self, func, ins=None, outdtype=None, altreduce=None):
         """ if func is not ufunc, a bit complicated:
@@ -50,18 +63,20 @@ class pufunc(object):
         if self.nout != 1:
             raise TypeError("only support 1 out ufunc")
 
-    def reduce(self, a, axis=0, dtype=None, chunksize=1024 * 1024):
+    def reduce(self, a, axis=0, dtype=None, chunksize='auto'):
+        """ chunksize is the number of elements along axis per task;
+            'auto' adapts it to the speed of the ufunc.
+        """
         rt = [None]
         if axis != 0:
             a = numpy.rollaxis(a, axis)
 
         with sharedmem.MapReduce() as pool:
-            def work(i):
-                sl = slice(i, i+chunksize)
+            def work(sl):
                 if len(a[sl]) == 0:
                     return self.ufunc.identity
                 else:
-                    return self.ufunc.reduce(a[sl], axis, dtype)
+                    return self.ufunc.reduce(a[sl], 0, dtype)
             def reduce(r):
                 if rt[0] is None:
                     rt[0] = r
@@ -69,19 +84,19 @@ class pufunc(object):
                     pass
                 else:
                     rt[0] = self.ufunc(rt[0], r, dtype=dtype)
-            pool.map(work, 
-                    range(0, len(a), chunksize),
-                    reduce=reduce)
+            pool.mapslices(work, len(a), reduce=reduce, chunksize=chunksize)
         return rt[0]
 
     def __call__(self, *args, **kwargs):
         return self.call(list(args), **kwargs)
 
-    def call(self, args, axis=0, out=None, chunksize=1024 * 1024, **kwargs):
+    def call(self, args, axis=0, out=None, chunksize='auto', **kwargs):
         """ axis is the axis to chop it off.
             if self.altreduce is set, the results will
             be reduced with altreduce and returned
             otherwise will be saved to out, then return out.
+            chunksize is the number of elements along axis per task;
+            'auto' adapts it to the speed of the ufunc.
         """
         if self.altreduce is not None:
             ret = [None]
@@ -103,8 +118,7 @@ class pufunc(object):
             out = numpy.rollaxis(out, axis)
         size = numpy.max([len(args[i]) for i in self.ins])
         with sharedmem.MapReduce() as pool:
-            def work(i):
-                sl = slice(i, i+chunksize)
+            def work(sl):
                 myargs = args[:]
                 for j in self.ins:
                     try: 
@@ -112,8 +126,6 @@ class pufunc(object):
                         a, b, c = sl.indices(len(args[j]))
                         myargs[j] = tmp
                     except Exception as e:
-                        print tmp
-                        print j, e
                         pass
                 if b == a: return None
                 rt = self.ufunc(*myargs, **kwargs)
@@ -127,9 +139,10 @@ class pufunc(object):
                 if ret[0] is None:
                     ret[0] = rt
                 elif rt is not None:
-                    ret[0] = self.altreduce(ret[0], rt)
+                    ret[0] = self.altreduce(*_padded(ret[0], rt))
 
-            pool.map(work, range(0, size, chunksize), reduce=reduce)
+            pool.mapslices(work, size, reduce=reduce, chunksize=chunksize,
+                    chunkkey=self.ufunc)
 
         if self.altreduce is None:
             if axis != 0:
@@ -138,38 +151,35 @@ class pufunc(object):
         else:
             return ret[0]
 
+class _opsfunc(sharedmem.ops.pufunc):
+    """ a ufunc parallelized by sharedmem.ops, taking the arguments
+        of pufunc as well. An element-wise call does not depend on
+        the axis it is chopped along; axis and chunksize of a call
+        are ignored, and so is chunksize of reduce.
+    """
+    def __call__(self, *args, **kwargs):
+        kwargs.pop('axis', None)
+        kwargs.pop('chunksize', None)
+        return sharedmem.ops.pufunc.__call__(self, *args, **kwargs)
+
+    def call(self, args, axis=0, out=None, chunksize='auto', **kwargs):
+        return self(*args, out=out, **kwargs)
+
+    def reduce(self, a, axis=0, dtype=None, chunksize='auto', **kwargs):
+        return sharedmem.ops.pufunc.reduce(self, a, axis=axis, dtype=dtype,
+                **kwargs)
+
+# the ufuncs are parallelized by sharedmem.ops.
 for _f in _funcs:
-    globals()[_f] = pufunc(getattr(numpy, _f))
+    globals()[_f] = _opsfunc(getattr(numpy, _f))
     __all__ .append(_f)
 for _f,_ins,_out,_altr in _funcs2:
     globals()[_f] = pufunc(getattr(numpy, _f), _ins, _out, _altr)
     __all__ .append(_f)
 
 def argsort(ar):
-    min = minimum.reduce(ar)
-    max = maximum.reduce(ar)
-    nchunk = sharedmem.cpu_count() * 2
-    #bins = numpy.linspace(min, max, nchunk, endpoint=True)
-    step = 1.0 * (max - min) / nchunk
-    bins = numpy.array(
-            1.0 * numpy.arange(nchunk + 1) * (max - min) / nchunk + min,
-            min.dtype)
-
-    dig = digitize(ar, bins)
-    binlength = bincount(dig, minlength=len(bins) + 1)
-    binoffset = numpy.cumsum(binlength)
-    out = sharedmem.empty(len(ar), dtype='intp')
-
-    with sharedmem.MapReduce() as pool:
-        def work(i):
-            # we can do this a lot faster
-            # but already having pretty good speed.
-            ind = numpy.nonzero(dig == i + 1)[0]
-            myar = ar[ind]
-            out[binoffset[i]:binoffset[i+1]] = ind[myar.argsort()]
-        pool.map(work, range(nchunk)) 
-
-    return out
+    """ the indices that sort ar; see sharedmem.ops.argsort. """
+    return sharedmem.ops.argsort(ar)
 
 class packarray(numpy.ndarray):
   """ A packarray packs/copies several arrays into the same memory chunk.
@@ -1,4 +1,9 @@
-from setuptools import setup
+from setuptools import setup, Extension
+
+# a plain C library loaded with ctypes by sharedmem/atomic.py;
+# without it the atomic operations fall back to a lock.
+atomic = Extension('sharedmem._atomic', ['sharedmem/_atomic.c'], optional=True)
+
 setup(name="sharedmem", version="0.3.5",
       author="Yu Feng",
       author_email="rainwoodman@gmail.com",
@@ -9,6 +14,7 @@ setup(name="sharedmem", version="0.3.5",
       packages = [
         'sharedmem', 'sharedmem.tests'
       ],
+      ext_modules = [atomic],
       license="GPLv3",
       install_requires=['numpy'],
 )
@@ -1,4 +1,11 @@
 from .sharedmem import *
+from .atomic import AtomicInt64Array
+from .locks import RWLock, SeqLock
+from . import ops
+
+import sys
+if sys.version_info >= (3, 6):
+    from .aio import abackground
 
 Pool = MapReduce
 TPool = MapReduceByThread
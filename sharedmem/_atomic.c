@@ -0,0 +1,69 @@
+/*************
+ *
+ * Atomic operations on 64 bit integers in shared memory.
+ *
+ * This is a plain C library, loaded with ctypes by atomic.py.
+ * It relies on the __atomic builtins of GCC and clang;
+ * the operations are lock-free on all 64 bit platforms, and
+ * work across processes on memory shared by mmap.
+ *
+ ****************/
+#include <stdint.h>
+#include <stddef.h>
+
+int64_t sharedmem_atomic_load(int64_t * p) {
+    return __atomic_load_n(p, __ATOMIC_SEQ_CST);
+}
+
+void sharedmem_atomic_store(int64_t * p, int64_t value) {
+    __atomic_store_n(p, value, __ATOMIC_SEQ_CST);
+}
+
+int64_t sharedmem_atomic_fetch_add(int64_t * p, int64_t value) {
+    return __atomic_fetch_add(p, value, __ATOMIC_SEQ_CST);
+}
+
+/* returns the old value; the exchange happened if it equals expected. */
+int64_t sharedmem_atomic_compare_exchange(int64_t * p, int64_t expected, int64_t desired) {
+    __atomic_compare_exchange_n(p, &expected, desired, 0,
+            __ATOMIC_SEQ_CST, __ATOMIC_SEQ_CST);
+    return expected;
+}
+
+int64_t sharedmem_atomic_fetch_min(int64_t * p, int64_t value) {
+    int64_t old = __atomic_load_n(p, __ATOMIC_SEQ_CST);
+    while(value < old) {
+        if(__atomic_compare_exchange_n(p, &old, value, 1,
+            __ATOMIC_SEQ_CST, __ATOMIC_SEQ_CST)) break;
+    }
+    return old;
+}
+
+int64_t sharedmem_atomic_fetch_max(int64_t * p, int64_t value) {
+    int64_t old = __atomic_load_n(p, __ATOMIC_SEQ_CST);
+    while(value > old) {
+        if(__atomic_compare_exchange_n(p, &old, value, 1,
+            __ATOMIC_SEQ_CST, __ATOMIC_SEQ_CST)) break;
+    }
+    return old;
+}
+
+void sharedmem_atomic_fence(void) {
+    __atomic_thread_fence(__ATOMIC_SEQ_CST);
+}
+
+/* base[index[i]] += values[i] for i < n; or += value if values is NULL. */
+void sharedmem_atomic_add_at(int64_t * base, const int64_t * index,
+        const int64_t * values, int64_t value, ptrdiff_t n) {
+    ptrdiff_t i;
+    if(values == NULL) {
+        for(i = 0; i < n; i ++) {
+            __atomic_fetch_add(&base[index[i]], value, __ATOMIC_RELAXED);
+        }
+    } else {
+        for(i = 0; i < n; i ++) {
+            __atomic_fetch_add(&base[index[i]], values[i], __ATOMIC_RELAXED);
+        }
+    }
+    __atomic_thread_fence(__ATOMIC_SEQ_CST);
+}
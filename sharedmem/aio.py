@@ -0,0 +1,163 @@
+"""
+    asyncio integration of sharedmem.
+
+    The results and the errors of the slaves are collected from the queues
+    of the process group. The event loop watches the file descriptors of
+    these queues, such that the loop keeps serving other coroutines while
+    the slaves run.
+
+    Queues of the thread backend have no file descriptors; with the
+    thread backend the blocking calls run in the default executor of the loop.
+
+    Examples
+    --------
+
+    >>> async def main():
+    >>>     with sharedmem.MapReduce() as pool:
+    >>>         def work(i):
+    >>>             return i * 2
+    >>>         r = await pool.amap(work, range(10))
+    >>>         async for r in pool.aimap(work, range(10)):
+    >>>             print(r)
+    >>>     r = await sharedmem.abackground(work, 10)
+
+"""
+__author__ = "Yu Feng"
+__email__ = "rainwoodman@gmail.com"
+
+__all__ = ['abackground', 'amap', 'aimap']
+
+import asyncio
+import heapq
+import queue
+
+from .sharedmem import background, get_debug
+
+def _fileno(Q):
+    """ file descriptor that becomes readable when Q has an item;
+        None if Q is not a multiprocessing Queue.
+    """
+    reader = getattr(Q, '_reader', None)
+    if reader is None:
+        return None
+    return reader.fileno()
+
+async def _readable(*fds):
+    """ wait until any of fds becomes readable. """
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+    def callback():
+        if not future.done():
+            future.set_result(None)
+    for fd in fds:
+        loop.add_reader(fd, callback)
+    try:
+        await future
+    finally:
+        for fd in fds:
+            loop.remove_reader(fd)
+
+async def abackground(function, *args, **kwargs):
+    """ Awaitable version of :py:class:`sharedmem.background`.
+
+        The function is called in a background process; the coroutine
+        returns the return value of the function, or raises a
+        :py:class:`sharedmem.SlaveException`.
+
+        Examples
+        --------
+
+        >>> rt = await sharedmem.abackground(function, *args, **kwargs)
+
+    """
+    bg = background(function, *args, **kwargs)
+    fd = _fileno(bg.result)
+    if fd is None:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, bg.wait)
+
+    await _readable(fd)
+    e, r = bg.result.get()
+    # the slave exits right after posting the result
+    await _readable(bg.slave.sentinel)
+    return bg._join(e, r)
+
+async def aimap(pool, func, sequence, reduce=None, star=False):
+    """ Asynchronous iterator version of :py:meth:`MapReduce.map`.
+
+        The reduced results are yielded in the order of sequence, as soon
+        as they are available.
+    """
+    realfunc, realreduce = pool._prepare(func, reduce, star)
+
+    if len(sequence) <= 0 or pool.np == 0 or get_debug():
+        # Do this in serial
+        pool.local = lambda : None
+        pool.local.rank = 0
+        pool.local.process_rank = 0
+        pool.local.thread_rank = 0
+        pool.critical.reset()
+        pool.progress.start(len(sequence))
+        pool.progress.tls.rank = 0
+        try:
+            for i in sequence:
+                r = realreduce(realfunc(i))
+                pool.progress.add()
+                yield r
+        finally:
+            pool.local = None
+        pool._merge()
+        return
+
+    size = len(sequence)
+    pg, R, N, feeder = pool._start(realfunc, sequence)
+
+    fds = _fileno(R), _fileno(pg.Errors)
+    if None in fds:
+        loop = asyncio.get_event_loop()
+        rt = await loop.run_in_executor(None,
+                pool._collect, realreduce, size, pg, R, N, feeder)
+        pool._merge()
+        for r in rt:
+            yield r
+        return
+
+    L = []
+    count = 0
+    next = 0
+    try:
+        while count < size:
+            if not pg.Errors.empty():
+                raise pg.get_exception()
+            try:
+                capsule = R.get(block=False)
+            except queue.Empty:
+                await _readable(*fds)
+                continue
+            capsule = capsule[0], realreduce(capsule[1])
+            heapq.heappush(L, capsule)
+            count = count + 1
+            while len(L) > 0 and L[0][0] == next:
+                yield heapq.heappop(L)[1]
+                next = next + 1
+
+        # the slaves exit after the last item.
+        for p in pg.P:
+            await _readable(p.sentinel)
+        pg.join()
+        feeder.join()
+        assert N[0] == count
+        # the reductions are merged by the master; the slaves have exited.
+        pool._merge()
+    except BaseException as e:
+        # the teardown blocks; the feeder may wait for room in the work queue.
+        await asyncio.get_event_loop().run_in_executor(None,
+                pool._abort, pg, feeder)
+        raise
+
+async def amap(pool, func, sequence, reduce=None, star=False):
+    """ Awaitable version of :py:meth:`MapReduce.map`.
+
+        Returns the list of reduced results, in the order of sequence.
+    """
+    return [r async for r in aimap(pool, func, sequence, reduce=reduce, star=star)]
@@ -0,0 +1,218 @@
+"""
+    Atomic integers in shared memory.
+
+    A contended counter protected by :code:`pool.critical` takes a lock
+    shared by all slaves for every increment. The atomic operations here
+    update the counter in place with a single instruction of the CPU,
+    without locks, such that counters, work indices and histogram bins
+    scale to many slaves.
+
+    The operations are implemented in _atomic.c, a small C library built by
+    setup.py and loaded with ctypes. If the library is not built (or the
+    compiler does not support the __atomic builtins), the operations fall
+    back to a lock per array; check :py:attr:`AtomicInt64Array.lockfree`.
+
+    Examples
+    --------
+
+    >>> counter = sharedmem.AtomicInt64Array(1)
+    >>> with sharedmem.MapReduce() as pool:
+    >>>     def work(i):
+    >>>         counter.fetch_add(0, i)
+    >>>     pool.map(work, range(10))
+    >>> print(counter[0])
+
+"""
+__author__ = "Yu Feng"
+__email__ = "rainwoodman@gmail.com"
+
+__all__ = ['AtomicInt64Array']
+
+import os
+import glob
+import ctypes
+import multiprocessing
+
+import numpy
+
+from .sharedmem import empty
+
+def _load():
+    """ load the C library; None if it is not built. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(here, '_atomic*.so'))
+                         + glob.glob(os.path.join(here, '_atomic*.pyd'))):
+        try:
+            lib = ctypes.CDLL(filename)
+        except OSError:
+            continue
+        p, i64 = ctypes.c_void_p, ctypes.c_int64
+        for name, restype, argtypes in [
+            ('load', i64, [p]),
+            ('store', None, [p, i64]),
+            ('fetch_add', i64, [p, i64]),
+            ('compare_exchange', i64, [p, i64, i64]),
+            ('fetch_min', i64, [p, i64]),
+            ('fetch_max', i64, [p, i64]),
+            ('add_at', None, [p, p, p, i64, ctypes.c_ssize_t]),
+            ('fence', None, []),
+            ]:
+            func = getattr(lib, 'sharedmem_atomic_' + name)
+            func.restype = restype
+            func.argtypes = argtypes
+        return lib
+    return None
+
+_lib = _load()
+
+def fence():
+    """ a full memory barrier: loads and stores before the fence are
+        not reordered with those after it. """
+    if _lib is not None:
+        _lib.sharedmem_atomic_fence()
+
+class AtomicInt64Array(object):
+    """ An array of 64 bit integers in shared memory, with atomic operations.
+
+        The array shall be created before the slaves are forked,
+        like all shared memory arrays. Reading an element
+        (:code:`a[i]`, or :py:attr:`array`) is not atomic with respect
+        to the operations; use :py:meth:`load`.
+
+        The operations take the flat index of an element,
+        or a tuple of indices for a multi-dimensional array;
+        the operations that modify an element return the old value.
+
+        Parameters
+        ----------
+        shape : int or tuple
+            shape of the array.
+        value : int
+            initial value of the elements.
+
+        Attributes
+        ----------
+        array : array_like
+            the underlying shared memory array of int64.
+        lockfree : boolean
+            True if the operations are atomic instructions; False if they
+            fall back to a lock.
+    """
+    def __init__(self, shape, value=0):
+        self.array = empty(shape, dtype='i8')
+        self.array[...] = value
+        self._flat = self.array.reshape(-1)
+        self._address = self.array.ctypes.data
+        self.lockfree = _lib is not None
+        if self.lockfree:
+            self._lock = None
+        else:
+            self._lock = multiprocessing.Lock()
+
+    def _index(self, index):
+        if isinstance(index, tuple):
+            index = numpy.ravel_multi_index(index, self.array.shape)
+        n = len(self._flat)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("index %d is out of bounds for size %d" % (index, n))
+        return index
+
+    def load(self, index):
+        """ the value of an element. """
+        index = self._index(index)
+        if self._lock is None:
+            return _lib.sharedmem_atomic_load(self._address + 8 * index)
+        with self._lock:
+            return int(self._flat[index])
+
+    def store(self, index, value):
+        """ set the value of an element. """
+        index = self._index(index)
+        if self._lock is None:
+            _lib.sharedmem_atomic_store(self._address + 8 * index, value)
+            return
+        with self._lock:
+            self._flat[index] = value
+
+    def fetch_add(self, index, value=1):
+        """ add value to an element; returns the old value. """
+        index = self._index(index)
+        if self._lock is None:
+            return _lib.sharedmem_atomic_fetch_add(self._address + 8 * index, value)
+        with self._lock:
+            old = int(self._flat[index])
+            self._flat[index] = old + value
+            return old
+
+    def compare_exchange(self, index, expected, desired):
+        """ set an element to desired if it equals expected; returns
+            the old value. The exchange happened if the old value is expected.
+        """
+        index = self._index(index)
+        if self._lock is None:
+            return _lib.sharedmem_atomic_compare_exchange(self._address + 8 * index,
+                    expected, desired)
+        with self._lock:
+            old = int(self._flat[index])
+            if old == expected:
+                self._flat[index] = desired
+            return old
+
+    def min(self, index, value):
+        """ set an element to the minimum of it and value; returns the old value. """
+        index = self._index(index)
+        if self._lock is None:
+            return _lib.sharedmem_atomic_fetch_min(self._address + 8 * index, value)
+        with self._lock:
+            old = int(self._flat[index])
+            if value < old:
+                self._flat[index] = value
+            return old
+
+    def max(self, index, value):
+        """ set an element to the maximum of it and value; returns the old value. """
+        index = self._index(index)
+        if self._lock is None:
+            return _lib.sharedmem_atomic_fetch_max(self._address + 8 * index, value)
+        with self._lock:
+            old = int(self._flat[index])
+            if value > old:
+                self._flat[index] = value
+            return old
+
+    def add_at(self, indices, values=1):
+        """ add values to the elements at the flat indices, like
+            :code:`numpy.add.at`; each addition is atomic. Use it to
+            fill a shared histogram.
+        """
+        indices = numpy.ascontiguousarray(indices, dtype='i8').reshape(-1)
+        n = len(self._flat)
+        indices = numpy.where(indices < 0, indices + n, indices)
+        if len(indices) > 0 and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("index is out of bounds for size %d" % n)
+        if self._lock is None:
+            if numpy.ndim(values) == 0:
+                _lib.sharedmem_atomic_add_at(self._address, indices.ctypes.data,
+                        None, int(values), len(indices))
+            else:
+                values = numpy.ascontiguousarray(
+                        numpy.broadcast_to(values, indices.shape), dtype='i8')
+                _lib.sharedmem_atomic_add_at(self._address, indices.ctypes.data,
+                        values.ctypes.data, 0, len(indices))
+            return
+        with self._lock:
+            numpy.add.at(self._flat, indices, values)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __array__(self, dtype=None):
+        return numpy.asarray(self.array, dtype=dtype)
+
+    def __repr__(self):
+        return 'AtomicInt64Array(%s)' % repr(numpy.asarray(self.array))
@@ -0,0 +1,199 @@
+"""
+    Reader-writer locks and sequence locks for shared data structures.
+
+    Workers that mostly read a shared table and occasionally update it
+    serialize on :code:`pool.critical`, even though the readers do not
+    conflict with each other. :py:class:`RWLock` admits many readers at
+    once and a single writer; :py:class:`SeqLock` lets readers of a small
+    record proceed without taking any lock at all, retrying if a writer
+    intervened.
+
+    Like :code:`pool.critical`, the locks shall be created before the
+    slaves are forked: before :code:`pool.map` or the :code:`with Parallel()`
+    statement.
+
+    Examples
+    --------
+
+    >>> table = sharedmem.empty(1024)
+    >>> rwlock = sharedmem.RWLock()
+    >>> with sharedmem.MapReduce() as pool:
+    >>>     def work(i):
+    >>>         with rwlock.read:
+    >>>             x = table[i % 1024]
+    >>>         if x < 0:
+    >>>             with rwlock.write:
+    >>>                 table[i % 1024] = 0
+    >>>     pool.map(work, range(10000))
+
+"""
+__author__ = "Yu Feng"
+__email__ = "rainwoodman@gmail.com"
+
+__all__ = ['RWLock', 'SeqLock']
+
+import time
+
+from .sharedmem import empty, ProcessBackend, _scalars
+from .atomic import AtomicInt64Array, fence
+
+class _LightSwitch(object):
+    """ The first to enter acquires the semaphore,
+        the last to leave releases it.
+        Excerpt from the Semaphore book by Downey 08
+    """
+    def __init__(self, backend):
+        self.mutex = backend.LockFactory()
+        self.counter = empty(1, dtype='i8')
+        self.counter[...] = 0
+        self._counter = _scalars(self.counter)
+
+    def lock(self, semaphore):
+        with self.mutex:
+            self._counter[0] += 1
+            if self._counter[0] == 1:
+                semaphore.acquire()
+
+    def unlock(self, semaphore):
+        with self.mutex:
+            self._counter[0] -= 1
+            if self._counter[0] == 0:
+                semaphore.release()
+
+class RWLock(object):
+    """ A reader-writer lock shared by the slaves.
+
+        Many readers may hold the lock at the same time; a writer holds it
+        alone. Writers are preferred: once a writer is waiting, new readers
+        wait until all waiting writers are done, such that the writers are
+        not starved by a steady stream of readers.
+
+        Use :py:attr:`read` and :py:attr:`write` in a with statement.
+
+        Parameters
+        ----------
+        backend : ProcessBackend or ThreadBackend
+            the backend of the slaves; the default,
+            ProcessBackend, works for all backends.
+
+        Attributes
+        ----------
+        read : context manager
+            hold the lock for reading.
+        write : context manager
+            hold the lock for writing.
+    """
+    def __init__(self, backend=ProcessBackend):
+        self.readers = _LightSwitch(backend)
+        self.writers = _LightSwitch(backend)
+        self.noReaders = backend.SemaphoreFactory(1)
+        self.noWriters = backend.SemaphoreFactory(1)
+        self.read = _Reading(self)
+        self.write = _Writing(self)
+
+    def acquire_read(self):
+        self.noReaders.acquire()
+        self.readers.lock(self.noWriters)
+        self.noReaders.release()
+
+    def release_read(self):
+        self.readers.unlock(self.noWriters)
+
+    def acquire_write(self):
+        self.writers.lock(self.noReaders)
+        self.noWriters.acquire()
+
+    def release_write(self):
+        self.noWriters.release()
+        self.writers.unlock(self.noReaders)
+
+class _Reading(object):
+    def __init__(self, rwlock):
+        self.rwlock = rwlock
+
+    def __enter__(self):
+        self.rwlock.acquire_read()
+
+    def __exit__(self, *args):
+        self.rwlock.release_read()
+
+class _Writing(object):
+    def __init__(self, rwlock):
+        self.rwlock = rwlock
+
+    def __enter__(self):
+        self.rwlock.acquire_write()
+
+    def __exit__(self, *args):
+        self.rwlock.release_write()
+
+class SeqLock(object):
+    """ A small record shared by the slaves, protected by a sequence lock.
+
+        Readers do not take a lock: :py:meth:`read` copies the record and
+        retries if a writer modified it in the meanwhile. Writers take a
+        lock and increment the sequence number before and after modifying
+        the record. Readers never block writers; use a SeqLock for small
+        records that are read much more often than written, and a
+        :py:class:`RWLock` for large tables.
+
+        Parameters
+        ----------
+        shape : int or tuple
+            shape of the record.
+        dtype : dtype
+            dtype of the record.
+        backend : ProcessBackend or ThreadBackend
+            the backend of the slaves.
+
+        Attributes
+        ----------
+        data : array_like
+            the record, in shared memory. Modify it only
+            in a with statement on the SeqLock.
+
+        Examples
+        --------
+        >>> box = sharedmem.SeqLock(4, dtype='f8')
+        >>> with box as data:
+        >>>     data[...] = [0, 1, 2, 3]
+        >>> box.read()
+
+    """
+    def __init__(self, shape, dtype='f8', backend=ProcessBackend):
+        self.data = empty(shape, dtype=dtype)
+        self.data[...] = 0
+        self.sequence = AtomicInt64Array(1)
+        self.lock = backend.LockFactory()
+
+    def read(self):
+        """ returns a consistent copy of the record. """
+        sequence = self.sequence
+        while True:
+            s0 = sequence.load(0)
+            if s0 & 1:
+                # a writer is active; let it finish.
+                time.sleep(0)
+                continue
+            value = self.data.copy()
+            fence()
+            if sequence.load(0) == s0:
+                return value
+
+    def write(self, value):
+        """ replaces the record with value. """
+        with self as data:
+            data[...] = value
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.sequence.fetch_add(0)
+        # the odd sequence is seen before any write of the record
+        fence()
+        return self.data
+
+    def __exit__(self, *args):
+        # all writes of the record are seen before the even sequence
+        fence()
+        self.sequence.fetch_add(0)
+        self.lock.release()
@@ -0,0 +1,767 @@
+"""
+    Parallel numpy ufuncs.
+
+    :py:class:`pufunc` applies a numpy ufunc to large arrays in parallel:
+    the arrays are split into blocks that fit the cache of a core, and the
+    blocks are processed by a persistent pool of threads (numpy releases
+    the GIL in the inner loops of the ufuncs). The pool is created at the
+    first call and reused, such that a call costs no fork; small calls
+    are applied directly.
+
+    Every numpy ufunc is available as a pufunc in this module, e.g.
+    :code:`sharedmem.ops.sin`, :code:`sharedmem.ops.add.reduce`.
+    The arrays can be shared memory arrays, or any numpy arrays.
+
+    :py:func:`sum`, :py:func:`mean`, :py:func:`var`, :py:func:`min`,
+    :py:func:`max`, :py:func:`argmin` and :py:func:`argmax` reduce over
+    any axes in parallel, with results that do not depend on the number of
+    threads or the order they finish in; :py:func:`sum` and
+    :py:func:`mean` optionally compensate the rounding errors.
+    :py:func:`sort` and :py:func:`argsort` sort long arrays with a
+    parallel sample sort.
+
+    Examples
+    --------
+
+    >>> x = sharedmem.empty(1024 * 1024 * 64)
+    >>> x[...] = 1.0
+    >>> y = sharedmem.ops.sin(x)
+    >>> sharedmem.ops.exp(x, out=x, where=x > 0)
+    >>> s = sharedmem.ops.add.reduce(x)
+    >>> s = sharedmem.ops.sum(x, compensated=True)
+
+"""
+__author__ = "Yu Feng"
+__email__ = "rainwoodman@gmail.com"
+
+__all__ = ['pufunc', 'executor',
+        'sum', 'mean', 'var', 'min', 'max', 'argmin', 'argmax',
+        'sort', 'argsort']
+
+import os
+import threading
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+import numpy
+
+from .sharedmem import Executor, ThreadBackend, SlaveException
+from .sharedmem import cpu_count, get_debug
+
+# bytes of the operands of a block; about the L2 cache of a core.
+CACHEBYTES = 2 ** 18
+
+# reductions of at least this many results split the results, not the rows;
+# a constant, such that the result does not depend on the machine.
+_MINROWS = 64
+
+# ufuncs that combine partial results of blocks correctly
+_ASSOCIATIVE = set([numpy.add, numpy.multiply,
+    numpy.minimum, numpy.maximum, numpy.fmin, numpy.fmax,
+    numpy.logical_and, numpy.logical_or, numpy.logical_xor,
+    numpy.bitwise_and, numpy.bitwise_or, numpy.bitwise_xor])
+
+_executor = None
+_pid = None
+_lock = threading.Lock()
+_tls = threading.local()
+
+def executor():
+    """ the persistent pool of threads of the ops, an :py:class:`Executor`
+        with the thread backend; created at the first call, and again in
+        a forked child process.
+    """
+    global _executor, _pid
+    with _lock:
+        if _executor is None or _pid != os.getpid():
+            _executor = Executor(backend=ThreadBackend)
+            _pid = os.getpid()
+        return _executor
+
+def _task(work, blocks, errstate):
+    _tls.inside = True
+    try:
+        with numpy.errstate(**errstate):
+            return [work(block) for block in blocks]
+    finally:
+        _tls.inside = False
+
+def _run(work, blocks):
+    """ apply work to the blocks on the pool; returns the results in
+        the order of the blocks. """
+    if len(blocks) <= 1 or get_debug() or getattr(_tls, 'inside', False):
+        return [work(block) for block in blocks]
+    pool = executor()
+    ntasks = builtins.min(len(blocks), 4 * pool.np)
+    # the errstate of numpy is per thread.
+    errstate = numpy.geterr()
+    fs = [pool.submit(_task, work,
+            blocks[i * len(blocks) // ntasks:(i + 1) * len(blocks) // ntasks],
+            errstate)
+          for i in range(ntasks)]
+    results = []
+    error = None
+    # wait for all blocks, such that none is written after we return.
+    for f in fs:
+        try:
+            results.extend(f.result())
+        except SlaveException as e:
+            if error is None:
+                error = e.reason
+    if error is not None:
+        raise error
+    return results
+
+def _blocks(shape, size):
+    """ split an array of shape into blocks of about size elements;
+        returns the index of each block. """
+    if len(shape) == 0:
+        return [()]
+    # the blocks are slices of axis k, covering the axes after k
+    k = len(shape) - 1
+    inner = 1
+    while k > 0 and inner * shape[k] <= size:
+        inner *= shape[k]
+        k -= 1
+    step = builtins.max(size // inner, 1)
+    return [index + (slice(i, builtins.min(i + step, shape[k])), )
+            for index in numpy.ndindex(*shape[:k])
+            for i in range(0, shape[k], step)]
+
+def _normalize_axis(axis, ndim):
+    if axis is None:
+        return tuple(range(ndim))
+    if numpy.isscalar(axis):
+        axis = (axis, )
+    return tuple(sorted(set(a + ndim if a < 0 else a for a in axis)))
+
+class pufunc(object):
+    """ A numpy ufunc, applied in parallel by the threads of :py:func:`executor`.
+
+        Calling a pufunc is the same as calling the ufunc, including
+        :code:`out=`, :code:`where=`, broadcasting, and ufuncs of
+        several outputs. :py:meth:`reduce`, :py:meth:`accumulate` and
+        :py:meth:`reduceat` are parallel as well. The output arrays are
+        allocated with numpy, unless given by out.
+
+        Parameters
+        ----------
+        ufunc : numpy.ufunc
+            the ufunc.
+        cachebytes : int
+            bytes of the operands of a block; calls on no more than
+            a block are applied directly.
+
+        Notes
+        -----
+        The blocks of a reduction or an accumulation along a long axis are
+        combined in the order of the blocks; this requires the ufunc to be
+        associative (e.g. add, multiply, minimum, maximum). Other ufuncs
+        are reduced along the axis without splitting it.
+        Floating point results may differ from numpy in the last bits,
+        as the order of the additions differs.
+    """
+    def __init__(self, ufunc, cachebytes=None):
+        if not isinstance(ufunc, numpy.ufunc):
+            raise TypeError("ufunc must be a numpy.ufunc")
+        if cachebytes is None:
+            cachebytes = CACHEBYTES
+        self.ufunc = ufunc
+        self.cachebytes = cachebytes
+        self.__name__ = ufunc.__name__
+        self.__doc__ = ufunc.__doc__
+
+    def __getattr__(self, name):
+        # nin, nout, identity, types, ...
+        return getattr(self.ufunc, name)
+
+    def __repr__(self):
+        return "<pufunc '%s'>" % self.ufunc.__name__
+
+    def _blocksize(self, *dtypes):
+        nbytes = builtins.sum(numpy.dtype(dtype).itemsize for dtype in dtypes)
+        return builtins.max(self.cachebytes // builtins.max(nbytes, 1), 1)
+
+    def __call__(self, *args, **kwargs):
+        ufunc = self.ufunc
+        out = kwargs.pop('out', None)
+        if len(args) > ufunc.nin:
+            args, out = args[:ufunc.nin], args[ufunc.nin:]
+        if out is None:
+            out = (None, ) * ufunc.nout
+        elif not isinstance(out, tuple):
+            out = (out, )
+        where = kwargs.pop('where', True)
+
+        inputs = [numpy.asanyarray(a) for a in args]
+        operands = inputs + [o for o in out if o is not None]
+        if where is not True:
+            where = numpy.asanyarray(where)
+            operands.append(where)
+        shape = numpy.broadcast(*operands).shape if len(operands) > 1 else operands[0].shape
+        size = self._blocksize(*[a.dtype for a in operands])
+        blocks = _blocks(shape, size)
+        if len(blocks) <= 1 or any(o is not None and o.shape != shape for o in out):
+            # small, or let numpy complain.
+            return ufunc(*args, out=out, where=where, **kwargs)
+
+        # the dtypes of the outputs, from empty slices of the inputs;
+        # scalars stay scalars for the casting rules.
+        probe = ufunc(*[a if a.ndim == 0 else a[(0, ) * (a.ndim - 1) + (slice(0, 0), )]
+                        for a in inputs], **kwargs)
+        if ufunc.nout == 1:
+            probe = (probe, )
+        out = tuple(numpy.empty(shape, dtype=p.dtype) if o is None else o
+                    for o, p in zip(out, probe))
+
+        inputs = [numpy.broadcast_to(a, shape) for a in inputs]
+        if where is not True:
+            where = numpy.broadcast_to(where, shape)
+        def work(index):
+            ufunc(*[a[index] for a in inputs],
+                  out=tuple(o[index] for o in out),
+                  where=True if where is True else where[index],
+                  **kwargs)
+        _run(work, blocks)
+
+        if ufunc.nout == 1:
+            return out[0]
+        return out
+
+    def reduce(self, a, axis=0, dtype=None, out=None, keepdims=False, **kwargs):
+        """ ufunc.reduce, in parallel; takes also initial and where. """
+        ufunc = self.ufunc
+        a = numpy.asanyarray(a)
+        where = kwargs.get('where', True)
+        size = self._blocksize(a.dtype)
+        if a.ndim == 0 or a.size <= size:
+            return ufunc.reduce(a, axis=axis, dtype=dtype, out=out,
+                    keepdims=keepdims, **kwargs)
+        axes = _normalize_axis(axis, a.ndim)
+        kept = tuple(i for i in range(a.ndim) if i not in axes)
+        keptshape = tuple(a.shape[i] for i in kept)
+        nkept = int(numpy.prod(keptshape))
+        nreduced = a.size // builtins.max(nkept, 1)
+        if nkept < _MINROWS and ufunc not in _ASSOCIATIVE:
+            return ufunc.reduce(a, axis=axis, dtype=dtype, out=out,
+                    keepdims=keepdims, **kwargs)
+
+        if where is not True:
+            where = numpy.broadcast_to(where, a.shape)
+        given = out is not None
+        # the dtype of the result, from the first element
+        probe = ufunc.reduce(a[(slice(0, 1), ) * a.ndim], axis=axes, dtype=dtype)
+        fullshape = tuple(1 if i in axes else a.shape[i] for i in range(a.ndim))
+        if out is None:
+            out = numpy.empty(fullshape if keepdims else keptshape, dtype=probe.dtype)
+        if out.ndim == a.ndim:
+            # the reduced axes are kept; see through them.
+            result = out[tuple(0 if i in axes else slice(None)
+                                for i in range(a.ndim)) + (Ellipsis, )]
+        else:
+            result = out
+
+        if nkept >= _MINROWS:
+            # many results; each block reduces whole rows.
+            b = a.transpose(kept + axes)
+            w = where if where is True else where.transpose(kept + axes)
+            raxes = tuple(range(-len(axes), 0))
+            def work(index):
+                kw = dict(kwargs)
+                if w is not True:
+                    kw['where'] = w[index]
+                ufunc.reduce(b[index], axis=raxes, dtype=dtype,
+                        out=result[index], **kw)
+            _run(work, _blocks(keptshape, builtins.max(size // nreduced, 1)))
+        else:
+            # few results; each block reduces a part of the rows,
+            # and the parts are combined in order.
+            b = a.transpose(axes + kept)
+            w = where if where is True else where.transpose(axes + kept)
+            reducedshape = tuple(a.shape[i] for i in axes)
+            blocks = _blocks(reducedshape, builtins.max(size // builtins.max(nkept, 1), 1))
+            def work(index):
+                kw = dict(kwargs)
+                if w is not True:
+                    kw['where'] = w[index]
+                if 'initial' in kw and ufunc.identity is not None and index != blocks[0]:
+                    # count initial once; the ufuncs without an
+                    # identity (minimum, maximum) are idempotent.
+                    del kw['initial']
+                raxes = tuple(range(len(reducedshape) - len(index) + 1))
+                return ufunc.reduce(b[index], axis=raxes, dtype=dtype, **kw)
+            partials = _run(work, blocks)
+            r = partials[0]
+            for p in partials[1:]:
+                r = ufunc(r, p, dtype=dtype)
+            result[...] = r
+
+        if not given and out.ndim == 0:
+            return out[()]
+        return out
+
+    def accumulate(self, a, axis=0, dtype=None, out=None):
+        """ ufunc.accumulate, in parallel. """
+        ufunc = self.ufunc
+        a = numpy.asanyarray(a)
+        size = self._blocksize(a.dtype)
+        if a.ndim == 0 or a.size <= size:
+            return ufunc.accumulate(a, axis=axis, dtype=dtype, out=out)
+        if axis < 0:
+            axis += a.ndim
+        n = a.shape[axis]
+        nothers = a.size // n
+        if nothers < _MINROWS and ufunc not in _ASSOCIATIVE:
+            return ufunc.accumulate(a, axis=axis, dtype=dtype, out=out)
+        if out is None:
+            probe = ufunc.accumulate(a[(slice(0, 1), ) * a.ndim], axis=axis, dtype=dtype)
+            out = numpy.empty(a.shape, dtype=probe.dtype)
+
+        if nothers >= _MINROWS:
+            # many rows; each block accumulates whole rows.
+            b = numpy.rollaxis(a, axis, a.ndim)
+            o = numpy.rollaxis(out, axis, out.ndim)
+            def work(index):
+                ufunc.accumulate(b[index], axis=-1, dtype=dtype, out=o[index])
+            _run(work, _blocks(b.shape[:-1], builtins.max(size // n, 1)))
+            return out
+
+        # few rows; accumulate the parts of the rows, then add the
+        # accumulation of the previous parts.
+        b = numpy.rollaxis(a, axis)
+        o = numpy.rollaxis(out, axis)
+        step = builtins.max(size // nothers, 1)
+        blocks = [slice(i, builtins.min(i + step, n)) for i in range(0, n, step)]
+        def work(index):
+            ufunc.accumulate(b[index], axis=0, dtype=dtype, out=o[index])
+        _run(work, blocks)
+        carries = [None]
+        carry = o[blocks[0].stop - 1].copy()
+        for index in blocks[1:]:
+            carries.append(carry)
+            carry = ufunc(carry, o[index.stop - 1])
+        def work(k):
+            index = blocks[k]
+            ufunc(carries[k], o[index], out=o[index])
+        _run(work, list(range(1, len(blocks))))
+        return out
+
+    def reduceat(self, a, indices, axis=0, dtype=None, out=None):
+        """ ufunc.reduceat, in parallel; nondecreasing indices are
+            split, others are reduced directly. """
+        ufunc = self.ufunc
+        a = numpy.asanyarray(a)
+        indices = numpy.asarray(indices, dtype='intp')
+        size = self._blocksize(a.dtype)
+        if (a.ndim == 0 or a.size <= size or indices.ndim != 1
+                or len(indices) <= 1
+                or (numpy.diff(indices) < 0).any()
+                or indices[0] < 0 or indices[-1] >= a.shape[axis]):
+            return ufunc.reduceat(a, indices, axis=axis, dtype=dtype, out=out)
+        if axis < 0:
+            axis += a.ndim
+        b = numpy.rollaxis(a, axis)
+        n = len(b)
+        if out is None:
+            probe = ufunc.reduceat(b[:1], [0], axis=0, dtype=dtype)
+            shape = list(a.shape)
+            shape[axis] = len(indices)
+            out = numpy.empty(shape, dtype=probe.dtype)
+        o = numpy.rollaxis(out, axis)
+
+        # groups of the indices covering about a block of the rows.
+        step = builtins.max(size // (a.size // n), 1)
+        starts = numpy.unique(numpy.searchsorted(indices, numpy.arange(0, n, step)))
+        starts = list(starts[starts < len(indices)])
+        if starts[0] != 0:
+            starts.insert(0, 0)
+        groups = list(zip(starts, starts[1:] + [len(indices)]))
+        def work(group):
+            j0, j1 = group
+            lo = indices[j0]
+            if j1 == len(indices):
+                hi = n
+            elif indices[j1] > indices[j1 - 1]:
+                hi = indices[j1]
+            else:
+                # the last of the group is a single row
+                hi = indices[j1 - 1] + 1
+            ufunc.reduceat(b[lo:hi], indices[j0:j1] - lo, axis=0,
+                    dtype=dtype, out=o[j0:j1])
+        _run(work, groups)
+        return out
+
+def _pairwise(partials, combine):
+    """ combine the partials as a balanced tree, in their order. """
+    while len(partials) > 1:
+        partials = [combine(partials[i], partials[i + 1])
+                    if i + 1 < len(partials) else partials[i]
+                    for i in range(0, len(partials), 2)]
+    return partials[0]
+
+def _reduction(a, axis, keepdims, partial, combine, finish):
+    """ reduce a over axis in blocks of a fixed order.
+
+        partial(x, nk, offset) reduces the trailing axes of a block x after
+        the first nk (the kept axes), offset being the flat index of the block
+        in the reduced axes; combine merges two partials in order;
+        finish makes the result from a partial.
+    """
+    a = numpy.asanyarray(a)
+    axes = _normalize_axis(axis, a.ndim)
+    kept = tuple(i for i in range(a.ndim) if i not in axes)
+    keptshape = tuple(a.shape[i] for i in kept)
+    reducedshape = tuple(a.shape[i] for i in axes)
+    nkept = int(numpy.prod(keptshape))
+    nreduced = int(numpy.prod(reducedshape))
+    nk = len(kept)
+    b = a.transpose(kept + axes)
+    size = builtins.max(CACHEBYTES // a.dtype.itemsize, 1)
+
+    def offset(index):
+        if len(index) == 0:
+            return 0
+        start = tuple(index[:-1]) + (index[-1].start, ) + (0, ) * (len(reducedshape) - len(index))
+        return numpy.ravel_multi_index(start, reducedshape)
+
+    def reduce(x, nrows):
+        """ x is a block of rows; reduce the rows in parts. """
+        nkx = x.ndim - len(reducedshape)
+        if nreduced == 0:
+            return finish(partial(x, nkx, 0))
+        parts = _blocks(reducedshape, builtins.max(size // builtins.max(nrows, 1), 1))
+        return finish(_pairwise(
+                [partial(x[(slice(None), ) * nkx + index], nkx, offset(index))
+                 for index in parts], combine))
+
+    if nkept >= _MINROWS:
+        # many results; each block reduces whole rows
+        blocks = _blocks(keptshape, builtins.max(size // builtins.max(nreduced, 1), 1))
+        def work(index):
+            x = b[index]
+            return reduce(x, x.size // builtins.max(nreduced, 1))
+        results = _run(work, blocks)
+        result = numpy.empty(keptshape, dtype=numpy.asarray(results[0]).dtype)
+        for index, r in zip(blocks, results):
+            result[index] = r
+    elif nreduced == 0:
+        result = numpy.asarray(reduce(b, nkept))
+    else:
+        # few results; each block reduces a part of all rows
+        blocks = _blocks(reducedshape, builtins.max(size // builtins.max(nkept, 1), 1))
+        def work(index):
+            return partial(b[(slice(None), ) * nk + index], nk, offset(index))
+        result = numpy.asarray(finish(_pairwise(_run(work, blocks), combine)))
+
+    if keepdims:
+        return result.reshape(tuple(1 if i in axes else a.shape[i] for i in range(a.ndim)))
+    if result.ndim == 0:
+        return result[()]
+    return result
+
+def _twosum(a, b):
+    """ s, e such that s + e == a + b exactly, s = fl(a + b). """
+    s = a + b
+    bb = s - a
+    return s, (a - (s - bb)) + (b - bb)
+
+def _sum(x, nk, dtype, compensated):
+    """ the sum of the trailing axes of x, and its rounding error
+        (None if not compensated). """
+    axes = tuple(range(nk, x.ndim))
+    if not compensated:
+        return numpy.sum(x, axis=axes, dtype=dtype), None
+    x = numpy.asarray(x, dtype=dtype)
+    x = x.reshape(x.shape[:nk] + (-1, ))
+    error = numpy.zeros(x.shape[:nk], dtype=x.dtype)
+    # halve the rows with the exact TwoSum, collecting the errors;
+    # the errors are small, and summed plainly.
+    while x.shape[-1] > 1:
+        n = x.shape[-1] // 2 * 2
+        s, e = _twosum(x[..., 0:n:2], x[..., 1:n:2])
+        error += e.sum(axis=-1)
+        if n < x.shape[-1]:
+            s = numpy.concatenate([s, x[..., n:]], axis=-1)
+        x = s
+    return x.sum(axis=-1), error
+
+def _summation(a, axis, dtype, keepdims, compensated, count):
+    if not numpy.issubdtype(numpy.dtype(dtype), numpy.inexact):
+        compensated = False
+    def partial(x, nk, offset):
+        s, e = _sum(x, nk, dtype, compensated)
+        return s, e, int(numpy.prod(x.shape[nk:]))
+    def combine(p, q):
+        if compensated:
+            s, e = _twosum(p[0], q[0])
+            return s, p[1] + q[1] + e, p[2] + q[2]
+        return p[0] + q[0], None, p[2] + q[2]
+    def finish(p):
+        s = p[0] if p[1] is None else p[0] + p[1]
+        if count:
+            return numpy.true_divide(s, p[2], dtype=dtype)
+        return s
+    return _reduction(a, axis, keepdims, partial, combine, finish)
+
+def sum(a, axis=None, dtype=None, keepdims=False, compensated=False):
+    """ Sum of array elements over the axes, in parallel.
+
+        The array is reduced in blocks whose partial sums are combined
+        pairwise in the order of the blocks; the blocks depend only on the
+        shape and the dtype, such that the result is the same for any
+        number of threads and in any order of completion.
+
+        Parameters
+        ----------
+        a : array_like
+        axis : None, int or tuple of ints
+            axes to sum over; None for all.
+        dtype : dtype
+            dtype of the accumulation, as in numpy.sum.
+        keepdims : boolean
+        compensated : boolean
+            if True, compensate the rounding errors: the elements are
+            added with the exact TwoSum of Kahan-Neumaier summation, and
+            the errors are added to the result, which is about as accurate
+            as summing in twice the precision.
+    """
+    a = numpy.asanyarray(a)
+    if dtype is None:
+        dtype = numpy.sum(a[(slice(0, 0), ) * a.ndim]).dtype
+    return _summation(a, axis, dtype, keepdims, compensated, False)
+
+def mean(a, axis=None, dtype=None, keepdims=False, compensated=False):
+    """ Arithmetic mean over the axes, in parallel; see :py:func:`sum`.
+
+        Integers are averaged in float64, float16 in float32, as numpy.mean.
+    """
+    a = numpy.asanyarray(a)
+    if dtype is None:
+        if numpy.issubdtype(a.dtype, numpy.inexact):
+            dtype = a.dtype
+        else:
+            dtype = numpy.dtype('f8')
+    acc = numpy.dtype('f4') if numpy.dtype(dtype) == numpy.dtype('f2') else dtype
+    r = _summation(a, axis, acc, keepdims, compensated, True)
+    return numpy.asarray(r, dtype=dtype)[()] if numpy.ndim(r) == 0 else r.astype(dtype, copy=False)
+
+def var(a, axis=None, dtype=None, ddof=0, keepdims=False):
+    """ Variance over the axes, in parallel.
+
+        Each block computes its count, mean and sum of squared deviations,
+        which are combined pairwise in the order of the blocks with the
+        formula of Chan et al.; see :py:func:`sum` for the order.
+    """
+    a = numpy.asanyarray(a)
+    if dtype is None:
+        if numpy.issubdtype(a.dtype, numpy.inexact):
+            dtype = a.dtype
+        else:
+            dtype = numpy.dtype('f8')
+    def sqr(d):
+        if numpy.iscomplexobj(d):
+            return d.real ** 2 + d.imag ** 2
+        return d * d
+    def partial(x, nk, offset):
+        axes = tuple(range(nk, x.ndim))
+        n = int(numpy.prod(x.shape[nk:]))
+        m = numpy.mean(x, axis=axes, dtype=dtype, keepdims=True)
+        m2 = numpy.sum(sqr(x - m), axis=axes)
+        return n, m.reshape(m.shape[:nk]), m2
+    def combine(p, q):
+        na, ma, m2a = p
+        nb, mb, m2b = q
+        n = na + nb
+        delta = mb - ma
+        return n, ma + delta * (nb * 1.0 / n), m2a + m2b + sqr(delta) * (na * nb * 1.0 / n)
+    real = numpy.empty(0, dtype=dtype).real.dtype
+    def finish(p):
+        n, m, m2 = p
+        return numpy.true_divide(m2, builtins.max(n - ddof, 0), dtype=real)
+    return _reduction(a, axis, keepdims, partial, combine, finish)
+
+def _extreme(a, axis, keepdims, ufunc):
+    def partial(x, nk, offset):
+        return ufunc.reduce(x, axis=tuple(range(nk, x.ndim)))
+    return _reduction(a, axis, keepdims, partial, ufunc, lambda p: p)
+
+def min(a, axis=None, keepdims=False):
+    """ Minimum over the axes, in parallel. NaN propagates, as numpy.min. """
+    return _extreme(a, axis, keepdims, numpy.minimum)
+
+def max(a, axis=None, keepdims=False):
+    """ Maximum over the axes, in parallel. NaN propagates, as numpy.max. """
+    return _extreme(a, axis, keepdims, numpy.maximum)
+
+def _argextreme(a, axis, keepdims, argfunc, better):
+    a = numpy.asanyarray(a)
+    hasnan = a.dtype.kind in 'fc'
+    def partial(x, nk, offset):
+        x = x.reshape(x.shape[:nk] + (-1, ))
+        i = numpy.asarray(argfunc(x, axis=-1))
+        flat = x.reshape(-1, x.shape[-1])
+        v = flat[numpy.arange(len(flat)), i.ravel()].reshape(i.shape)
+        return v, i + offset
+    def combine(p, q):
+        # the first occurrence wins; p is before q.
+        take = better(q[0], p[0])
+        if hasnan:
+            take = take | (numpy.isnan(q[0]) & ~numpy.isnan(p[0]))
+        return numpy.where(take, q[0], p[0]), numpy.where(take, q[1], p[1])
+    return _reduction(a, axis, keepdims, partial, combine, lambda p: p[1])
+
+def argmin(a, axis=None, keepdims=False):
+    """ Indices of the minimum over the axes, in parallel.
+
+        For several axes (a tuple), the index is flat
+        in the C order of the axes; the first occurrence is returned,
+        the first NaN if any, as numpy.argmin.
+    """
+    return _argextreme(a, axis, keepdims, numpy.argmin, numpy.less)
+
+def argmax(a, axis=None, keepdims=False):
+    """ Indices of the maximum over the axes, in parallel; see :py:func:`argmin`. """
+    return _argextreme(a, axis, keepdims, numpy.argmax, numpy.greater)
+
+# arrays shorter than this are sorted by numpy directly
+_MINSORT = 2 ** 16
+# samples per bucket for the splitters
+_OVERSAMPLING = 16
+
+def _samplesort(a, kind, order, indices):
+    """ sample sort of the 1-d array a; returns the sorted array,
+        or the indices that sort a if indices is True.
+
+        a is cut into chunks; splitters taken from a regular sample
+        define the buckets. Each chunk is labelled and scattered stably
+        into the buckets, then the buckets are sorted. Keys equal to a
+        splitter get a bucket of their own which needs no sorting,
+        such that a few frequent keys do not overload a bucket.
+    """
+    n = len(a)
+    if order is None:
+        keys = a
+    else:
+        if not isinstance(order, (list, tuple)):
+            order = [order]
+        # compare as numpy: by the fields of order, then by the others
+        keys = a[list(order) + [name for name in a.dtype.names if name not in order]]
+
+    p = builtins.max(builtins.min(4 * executor().np, n // 4096), 2)
+    sample = numpy.sort(keys[numpy.linspace(0, n - 1, p * _OVERSAMPLING).astype('intp')])
+    splitters = sample[_OVERSAMPLING * numpy.arange(1, p)]
+    # bucket 2 * j holds the keys between splitter j - 1 and j,
+    # bucket 2 * j + 1 the keys equal to splitter j.
+    nbuckets = 2 * p - 1
+    labels = numpy.empty(n, dtype='i2' if nbuckets < 2 ** 15 else 'i4')
+    chunks = [slice(c * n // p, (c + 1) * n // p) for c in range(p)]
+
+    def label(chunk):
+        k = keys[chunk]
+        j = numpy.searchsorted(splitters, k, side='left')
+        equal = splitters[numpy.minimum(j, p - 2)] == k
+        equal &= j < p - 1
+        labels[chunk] = 2 * j + equal
+        return numpy.bincount(labels[chunk], minlength=nbuckets)
+    counts = numpy.array(_run(label, chunks))
+
+    # where each chunk writes into each bucket
+    sizes = counts.sum(axis=0)
+    starts = numpy.concatenate([[0], numpy.cumsum(sizes)[:-1]])
+    offsets = starts[None, :] + numpy.cumsum(counts, axis=0) - counts
+
+    out = numpy.empty(n, dtype=a.dtype)
+    if indices:
+        index = numpy.empty(n, dtype='intp')
+    def scatter(c):
+        chunk = chunks[c]
+        # the labels are small integers; stable and fast
+        o = numpy.argsort(labels[chunk], kind='mergesort')
+        l = labels[chunk][o]
+        first = numpy.cumsum(counts[c]) - counts[c]
+        position = offsets[c][l] + (numpy.arange(len(o)) - first[l])
+        out[position] = a[chunk][o]
+        if indices:
+            index[position] = o + chunk.start
+    _run(scatter, list(range(p)))
+
+    def sort(b):
+        start, end = starts[b], starts[b] + sizes[b]
+        if b % 2 == 1 or end - start <= 1:
+            # equal keys, in the order of a
+            return
+        if indices:
+            o = numpy.argsort(out[start:end], kind=kind, order=order)
+            index[start:end] = index[start:end][o]
+        else:
+            out[start:end].sort(kind=kind, order=order)
+    # the largest buckets first
+    _run(sort, list(numpy.argsort(-sizes, kind='mergesort')))
+    if indices:
+        return index
+    return out
+
+def _sort(a, axis, kind, order, indices):
+    a = numpy.asanyarray(a)
+    if axis is None:
+        a = a.reshape(-1)
+        axis = -1
+    # numpy before 1.15 knows neither None nor 'stable'
+    if kind is None:
+        kind = 'quicksort'
+    elif kind == 'stable':
+        kind = 'mergesort'
+    if a.ndim == 0 or a.shape[axis] < _MINSORT:
+        if indices:
+            return numpy.argsort(a, axis=axis, kind=kind, order=order)
+        return numpy.sort(a, axis=axis, kind=kind, order=order)
+    if a.ndim == 1:
+        return _samplesort(a, kind, order, indices)
+
+    if axis < 0:
+        axis += a.ndim
+    b = numpy.rollaxis(a, axis, a.ndim)
+    out = numpy.empty(b.shape, dtype='intp' if indices else a.dtype)
+    rows = list(numpy.ndindex(*b.shape[:-1]))
+    if len(rows) < 4 * cpu_count():
+        # few long rows; sort each in parallel
+        for row in rows:
+            out[row] = _samplesort(b[row], kind, order, indices)
+    else:
+        func = numpy.argsort if indices else numpy.sort
+        def work(index):
+            out[index] = func(b[index], axis=-1, kind=kind, order=order)
+        _run(work, _blocks(b.shape[:-1], 1))
+    return numpy.rollaxis(out, -1, axis)
+
+def sort(a, axis=-1, kind=None, order=None):
+    """ A sorted copy of an array, sorted in parallel, as numpy.sort.
+
+        Long arrays are sorted with a sample sort: splitters from a regular
+        sample cut the keys into buckets; the array is scattered into the
+        buckets and the buckets are sorted, both in parallel.
+
+        Parameters
+        ----------
+        a : array_like
+        axis : int or None
+            the axis to sort along; None to sort the flattened array.
+        kind : None, 'quicksort', 'heapsort', 'stable' or 'mergesort'
+            the sort of the buckets. 'stable' (or 'mergesort') keeps the order
+            of equal keys.
+        order : str or list of str
+            the fields to compare first, for structured arrays.
+    """
+    return _sort(a, axis, kind, order, False)
+
+def argsort(a, axis=-1, kind=None, order=None):
+    """ The indices that sort an array, computed in parallel,
+        as numpy.argsort; see :py:func:`sort`. """
+    return _sort(a, axis, kind, order, True)
+
+for _name in dir(numpy):
+    if isinstance(getattr(numpy, _name), numpy.ufunc):
+        globals()[_name] = pufunc(getattr(numpy, _name))
+del _name
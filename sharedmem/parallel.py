@@ -25,6 +25,10 @@
      forloop returns the iterator variable and an Ordered object if
      ordered==True.
 
+     forblocks yields a slice of iterations per chunk instead of single
+     iterations, such that the body of the loop works on whole blocks
+     with numpy, avoiding the slow Python loop of note 3.
+
    5 DeadLocks: 
         Tested pretty extensively, but 
         there still may be some corner cases. 
@@ -58,6 +62,8 @@
                 xxxx
             for i in p.forloop():           omp for
                 xxxxj 
+            for sl in p.forblocks(n):       omp for, vectorized
+                x[sl] = xxxx
 
             p.barrier()                       omp barrier
 
@@ -79,13 +85,22 @@ import time
 import os 
 import pickle
 import signal
+import cProfile
+import shutil
+import tempfile
 
 from multiprocessing import Lock
-from multiprocessing.synchronize import Semaphore
-from multiprocessing.queues import SimpleQueue
+from multiprocessing import Semaphore
+try:
+    # python 3; the class in multiprocessing.queues needs a context.
+    from multiprocessing import SimpleQueue
+except ImportError:
+    from multiprocessing.queues import SimpleQueue
 from threading import Thread
+from threading import Event
 
 from . import sharedmem
+from .atomic import AtomicInt64Array, fence
 
 __all__ = ['Parallel', 'ParallelException']
 
@@ -195,12 +210,16 @@ class ErrorMonitor:
     def __init__(self):
         self.pipe = SimpleQueue()
         self.message = None
+        # set once the master listens to LongJump
+        self.listening = Event()
 
     def main(self):
         while True:
             message = self.pipe.get()
             if message != 'Q':
                 self.message = message[1:]
+                # a slave may fail before the master enters the section
+                self.listening.wait()
                 LongJump.longjump()
                 break
             else:
@@ -227,7 +246,7 @@ class ErrorMonitor:
 
     def slaveraise(self, type, error, traceback):
         """ slave only """
-        message = 'E' * 1 + pickle.dumps((type,
+        message = b'E' * 1 + pickle.dumps((type,
             ''.join(tb.format_exception(type, error, traceback))))
         if self.pipe is not None:
             self.pipe.put(message)
@@ -238,11 +257,28 @@ class Parallel(object):
 
         **kwargs: 
              num_threads: number of processes (default to OMP_NUM_THREADS)
+             trace: if True, record a timeline into p.tracer, a
+                    sharedmem.Tracer; if a file name, also write the timeline
+                    to the file as a Chrome trace when the section exits.
+             progress: a callable, called with p.progress, a
+                    sharedmem.Progress, every interval seconds on the master;
+                    True to print the progress to stderr.
+             interval: seconds between the calls to progress (default 1.0)
+             profile: if True, run each rank under cProfile; the profiles
+                    are merged into p.profile, a pstats.Stats, and
+                    p.profiles, a pstats.Stats per rank, when the section exits.
+             barrier: the algorithm of p.barrier(); 'sense' (a centralized
+                    sense-reversing barrier), 'dissemination', 'turnstile'
+                    (semaphores only) or 'auto' (default): 'dissemination'
+                    for more than 8 threads, up to the number of cores;
+                    otherwise 'sense'. The first two spin on shared memory,
+                    then block; they need the atomic operations of
+                    sharedmem.atomic, otherwise 'turnstile'.
 
         *args:
             Private(name=value, ....)
             Shared(name=value, ....)
-            Reduction(ufunc, name=value, ....)
+            Reduction(ufunc, name=value, ...., inplace=False)
 
     """
     def __init__(self, *args, **kwargs):
@@ -252,6 +288,17 @@ class Parallel(object):
         self.master = True
         self._variables = args
         self._children = []
+        self.trace = kwargs.get('trace', False)
+        self.tracer = None
+        self._watch = kwargs.get('progress', None)
+        if self._watch is True:
+            self._watch = sharedmem._printprogress
+        self._interval = kwargs.get('interval', 1.0)
+        self._stopwatch = None
+        self.profiling = kwargs.get('profile', False)
+        self.profile = None
+        self.profiles = {}
+        self._barriertype = kwargs.get('barrier', 'auto')
 
 
     def _fork(self):
@@ -265,39 +312,78 @@ class Parallel(object):
             else:
                 self.rank = i + 1
                 self.master = False
+                # the master of an earlier section may have muted SIGTRAP;
+                # a slave shall die of it.
+                signal.signal(signal.SIGTRAP, signal.SIG_DFL)
 
     def _cleanup(self):
         self._barrier.abort()
-        self.critical.release()
+        self._critical.release()
         self._StaticForLoop.abort()
         self._DynamicForLoop.abort()
         self._Ordered.abort()
 
     def __enter__(self):
-        self.critical = Semaphore(1)
+        self._critical = Semaphore(1)
+        if self.trace:
+            self.tracer = sharedmem.Tracer(self.num_threads)
+            self.critical = TracedSemaphore(self, self._critical)
+        else:
+            self.tracer = None
+            self.critical = self._critical
         self._errormon = ErrorMonitor() 
         self._slavemon = SlaveMonitor(self._errormon) 
         shared = sharedmem.empty((),
                 dtype=[
-                    ('ordered', 'intp'),
                     ('barrier', 'intp'),
-                    ('dynamic', 'intp'),
                     ])
 
-        self._barrier = Barrier(self.num_threads, shared['barrier'][...])
-        self._Ordered = MetaOrdered(self, shared['ordered'] [...], Semaphore(1))
+        barrier = self._barriertype
+        if barrier == 'auto':
+            if not AtomicInt64Array(1).lockfree:
+                barrier = 'turnstile'
+            elif 8 < self.num_threads <= sharedmem.cpu_count():
+                barrier = 'dissemination'
+            else:
+                # with more ranks than cores the ranks block; waking
+                # all at once costs fewer switches than log2(n) rounds.
+                barrier = 'sense'
+        if barrier == 'turnstile':
+            self._barrier = Barrier(self.num_threads, shared['barrier'][...])
+        elif barrier == 'sense':
+            self._barrier = SenseBarrier(self.num_threads)
+        elif barrier == 'dissemination':
+            self._barrier = DisseminationBarrier(self.num_threads)
+        else:
+            raise ValueError("barrier unknown: %s" % barrier)
+        self._Ordered = MetaOrdered(self, OrderedTurn(self.num_threads))
         self._StaticForLoop = MetaStaticForLoop(self) 
-        self._DynamicForLoop = MetaDynamicForLoop(self, Semaphore(1), shared['dynamic'][...]) 
+        # the next iteration of a dynamic loop; claimed by fetch-and-add
+        self._DynamicForLoop = MetaDynamicForLoop(self, AtomicInt64Array(1))
 
+        self.progress = sharedmem.Progress(self.num_threads)
+        if self.profiling:
+            self._profiledir = tempfile.mkdtemp(prefix='sharedmem-profile-')
         for param in self._variables:
             param.beforefork(self)
+        if self.tracer is not None:
+            self.tracer.begin(self.tracer.MASTER, 'fork')
         self._fork()
+        if self.tracer is not None and self.master:
+            self.tracer.end(self.tracer.MASTER, 'fork')
         for param in self._variables:
             param.afterfork(self)
+        self.progress.tls.rank = self.rank
+        if self.profiling:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
         if self.master:
             self._errormon.start()
             self._slavemon.start()
+            if self._watch:
+                self._stopwatch = self.progress.watch(self._watch, self._interval)
             LongJump.listen(self)
+            self._errormon.listening.set()
         return self
 
     def __exitmaster__(self, type, exception, traceback):
@@ -305,7 +391,11 @@ class Parallel(object):
             # if any slaves raise error
             # _erromon will kill them
             # but master won't receive the LongJump signal
+            if self.tracer is not None:
+                self.tracer.begin(self.tracer.MASTER, 'join')
             self._slavemon.join()
+            if self.tracer is not None:
+                self.tracer.end(self.tracer.MASTER, 'join')
             self._errormon.join()
             if self._errormon.message is not None:
                 type, msg = pickle.loads(self._errormon.message)
@@ -322,6 +412,9 @@ class Parallel(object):
             if isinstance(param, Reduction):
                 param.reduce(self)
 
+        if self.tracer is not None and not isinstance(self.trace, bool):
+            self.tracer.save(self.trace)
+
     def __exit__(self, type, exception, traceback):
         try:
             # since we are already here,
@@ -332,24 +425,73 @@ class Parallel(object):
             # if Thread.join() is inproperly
             # break by a async exception
             # next call to Thread.start() may block
-            LongJump.mute()
+            # the slaves are not muted: they shall die of SIGTRAP
+            # while reducing.
+            if self.master:
+                LongJump.mute()
             # if LongJump is raised 
             # we simply try again
         except LongJump as e:
             LongJump.mute()
 
+        if self.profiling:
+            self._dumpprofile()
+
+        if type is None:
+            self._reduce()
+
         if self.master: 
-            self.__exitmaster__(type, exception, traceback)
+            try:
+                self.__exitmaster__(type, exception, traceback)
+            finally:
+                if self._stopwatch is not None:
+                    self._stopwatch()
+                    self._stopwatch = None
+                if self.profiling:
+                    self.profile = sharedmem._loadprofiles(self._profiledir,
+                            self.profiles)
+                    shutil.rmtree(self._profiledir, ignore_errors=True)
         else:
             # put error to the pipe
             if type is not None:
                 # need to make sure each (per) message 
                 # won't block the pipe!
+                # do not die of the longjump with the lock of the pipe held;
+                # we exit right after.
+                signal.signal(signal.SIGTRAP, signal.SIG_IGN)
                 self._errormon.slaveraise(type, exception, traceback)
             os._exit(0)
         
+    def _reduce(self):
+        """ reduce the Reduction variables; all ranks take part. """
+        reductions = [param for param in self._variables
+                if isinstance(param, Reduction)]
+        if len(reductions) == 0: return
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.begin(self.rank, 'reduce')
+        self._barrier.wait(self.rank)
+        # the barrier of the master is released if a slave died;
+        # then nothing is reduced.
+        if not self.master or not self._errormon.haserror():
+            for param in reductions:
+                param.reducelocal(self)
+            self._barrier.wait(self.rank)
+        if tracer is not None:
+            tracer.end(self.rank, 'reduce')
+
+    def _dumpprofile(self):
+        self._profiler.disable()
+        self._profiler.dump_stats(os.path.join(self._profiledir,
+            'rank-%d.prof' % self.rank))
+
     def barrier(self):
-        self._barrier.wait()
+        if self.tracer is None:
+            self._barrier.wait(self.rank)
+        else:
+            self.tracer.begin(self.rank, 'barrier')
+            self._barrier.wait(self.rank)
+            self.tracer.end(self.rank, 'barrier')
 
     def forloop(self, range, ordered=False, schedule=('static', 1)):
         """ schedule can be
@@ -365,6 +507,8 @@ class Parallel(object):
             schedule, chunk = schedule
         else:
             chunk = None
+        if self.master:
+            self.progress.total += len(range)
         if schedule == 'static':
             return self._StaticForLoop(range, ordered, chunk)
         elif schedule == 'dynamic':
@@ -374,6 +518,77 @@ class Parallel(object):
         else:
             raise "schedule unknown"
 
+    def forblocks(self, n, ordered=False, schedule='static'):
+        """ A forloop yielding a block of iterations at a time, as a
+            slice of range(n), such that the body works on whole
+            arrays with numpy. If n is an array (e.g. of indices), yields
+            the blocks of the array instead.
+
+            schedule is (sch, chunk) or sch, as in forloop; chunk is the
+            number of iterations in a block. By default the static
+            schedule yields one block per rank, and the dynamic and guided
+            schedules claim blocks of 1/8 of the share of a rank.
+
+            if ordered, yields (block, ordered); every block shall enter
+            ordered once, and the blocks enter in the order of the
+            iterations. The errors of the other ranks are checked
+            between blocks.
+
+            Example:
+
+                with Parallel() as p:
+                    for sl in p.forblocks(len(x), schedule='dynamic'):
+                        y[sl] = numpy.sin(x[sl])
+        """
+        if isinstance(schedule, tuple):
+            schedule, chunk = schedule
+        else:
+            chunk = None
+        if numpy.ndim(n) == 0:
+            size, blocks = int(n), None
+        else:
+            size, blocks = len(n), n
+        if chunk is None and schedule != 'static':
+            chunk = max(size // (8 * self.num_threads), 1)
+        if self.master:
+            self.progress.total += size
+        if schedule == 'static':
+            loop = self._StaticForLoop(range(size), ordered, chunk, blocks=True)
+        elif schedule == 'dynamic':
+            loop = self._DynamicForLoop(range(size), ordered, chunk, guided=False, blocks=True)
+        elif schedule == 'guided':
+            loop = self._DynamicForLoop(range(size), ordered, chunk, guided=True, blocks=True)
+        else:
+            raise ValueError("schedule unknown: %s" % schedule)
+        # the loop yields the blocks of the array, if given
+        loop.array = blocks
+        return loop
+
+class TracedSemaphore(object):
+    """ A Semaphore recording the wait and the hold time
+        to the tracer of a Parallel section. """
+    def __init__(self, parallel, semaphore):
+        self.parallel = parallel
+        self.semaphore = semaphore
+
+    def acquire(self):
+        tracer = self.parallel.tracer
+        tracer.begin(self.parallel.rank, 'critical.wait')
+        self.semaphore.acquire()
+        tracer.end(self.parallel.rank, 'critical.wait')
+        tracer.begin(self.parallel.rank, 'critical')
+
+    def release(self):
+        self.parallel.tracer.end(self.parallel.rank, 'critical')
+        self.semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
 class Barrier:
     """ Excerpt from the Semaphore book by Downey 08 """
     def __init__(self, n, count):
@@ -410,28 +625,179 @@ class Barrier:
         finally:
             self.mutex.release()
         self.turnstile2.acquire()
-    def wait(self):
+    def wait(self, rank=None):
         if self.n == 0: return
         self.phase1()
         self.phase2()
 
-def MetaDynamicForLoop(parallel, mutex, dynamiciter):
+class _SpinWait(object):
+    """ Waiting for words of shared memory to take a value; spin, then block.
+
+        A rank spins on the word for a while, then announces the index of
+        the word it waits for in :code:`sleeping` and blocks on its own
+        semaphore. A rank setting a word wakes the rank sleeping on it.
+        Spinning is skipped if there are more ranks than cores.
+
+        A rank may announce a tag other than the index, e.g. the value it
+        waits for, such that setting the word wakes only the ranks waiting
+        for the new value.
+    """
+    SPIN = 200
+
+    def __init__(self, n, nwords):
+        self.n = n
+        self.words = AtomicInt64Array(nwords + 1)
+        # the spinning reads plain memory.
+        self._words = sharedmem._scalars(self.words.array)
+        self.ABORTED = nwords
+        # index + 1 of the word a rank is blocked on, or 0
+        self.sleeping = AtomicInt64Array(n)
+        self._sleeping = sharedmem._scalars(self.sleeping.array)
+        self.semaphores = [Semaphore(0) for i in range(n)]
+        if n <= sharedmem.cpu_count():
+            self.spin = self.SPIN
+        else:
+            self.spin = 0
+
+    def abort(self):
+        """ ensure the master exit from Barrier """
+        self.words.store(self.ABORTED, 1)
+        for semaphore in self.semaphores:
+            semaphore.release()
+
+    def _set(self, index, value, ranks, tag=None):
+        """ set a word, and wake the ranks blocked on it. """
+        if tag is None: tag = index + 1
+        self.words.store(index, value)
+        # order the reads of sleeping after the store
+        fence()
+        sleeping = self._sleeping
+        for rank in ranks:
+            if sleeping[rank] != tag:
+                continue
+            if self.sleeping.compare_exchange(rank, tag, 0) == tag:
+                self.semaphores[rank].release()
+
+    def _waitfor(self, rank, index, value, tag=None):
+        if tag is None: tag = index + 1
+        words = self._words
+        for i in range(self.spin):
+            if words[index] == value:
+                fence()
+                return
+        while True:
+            self.sleeping.store(rank, tag)
+            if self.words.load(index) == value or words[self.ABORTED]:
+                if self.sleeping.compare_exchange(rank, tag, 0) != tag:
+                    # woken in the meanwhile; take the token.
+                    self.semaphores[rank].acquire()
+                return
+            self.semaphores[rank].acquire()
+            if self.words.load(index) == value or words[self.ABORTED]:
+                return
+
+class SenseBarrier(_SpinWait):
+    """ A centralized sense-reversing barrier.
+
+        The last rank to arrive resets the counter and flips the sense;
+        the others wait for the sense to flip. The sense of a rank is
+        private to the rank, as the ranks are forked processes.
+    """
+    def __init__(self, n):
+        _SpinWait.__init__(self, n, 2)
+        self.sense = 0
+
+    def wait(self, rank):
+        if self.n <= 1: return
+        self.sense = sense = 1 - self.sense
+        if self.words.fetch_add(0) == self.n - 1:
+            self.words.store(0, 0)
+            self._set(1, sense, range(self.n))
+        else:
+            self._waitfor(rank, 1, sense)
+
+class DisseminationBarrier(_SpinWait):
+    """ A dissemination barrier (Hensgen, Finkel and Manber 88).
+
+        In round r, a rank notifies the rank 2 ** r after it and waits for
+        the rank 2 ** r before it; after log2(n) rounds every rank has
+        heard from all ranks. No word is written by more than one rank, and
+        each rank wakes one rank per round. The flags alternate between two
+        sets, and the sense flips every other barrier (Mellor-Crummey and
+        Scott 91).
+    """
+    def __init__(self, n):
+        self.rounds = 0
+        while (1 << self.rounds) < n:
+            self.rounds += 1
+        _SpinWait.__init__(self, n, 2 * self.rounds * n)
+        self.sense = 1
+        self.parity = 0
+
+    def wait(self, rank):
+        if self.n <= 1: return
+        n, sense, parity = self.n, self.sense, self.parity
+        for r in range(self.rounds):
+            offset = (parity * self.rounds + r) * n
+            partner = (rank + (1 << r)) % n
+            self._set(offset + partner, sense, (partner, ))
+            self._waitfor(rank, offset + rank, sense)
+        if parity == 1:
+            self.sense = 1 - sense
+        self.parity = 1 - parity
+
+class OrderedTurn(_SpinWait):
+    """ The turn of the ordered construct: the number of iterations done.
+
+        A rank waits until the turn reaches its iteration, spinning
+        briefly, then blocking on its semaphore with the iteration as
+        the tag; the rank leaving the ordered section wakes only the rank
+        of the next turn.
+    """
+    def __init__(self, n):
+        _SpinWait.__init__(self, n, 1)
+
+    def reset(self):
+        self.words.store(0, 0)
+
+    def wait(self, rank, turn):
+        self._waitfor(rank, 0, turn, tag=turn + 1)
+
+    def advance(self, step):
+        # only the rank holding the turn modifies it
+        turn = self._words[0] + step
+        self._set(0, turn, range(self.n), tag=turn + 1)
+
+def _block(array, start, end):
+    """ the block [start, end) of a forblocks loop. """
+    if array is None:
+        return slice(start, end)
+    return array[start:end]
+
+def MetaDynamicForLoop(parallel, dynamiciter):
     class DynamicForLoop:
-        def __init__(self, range, ordered, chunk, guided):
+        def __init__(self, range, ordered, chunk, guided, blocks=False):
             self.range = range
-            self.iter = numpy.empty((), dtype='intp')
-            self.iter[...] = 0
+            self.blocks = blocks
+            self.array = None
             self.guided = guided
             if chunk is None: chunk = 1
             self.chunk = chunk
+            # wait for all ranks to leave the previous loop,
+            # which still reads dynamiciter
+            parallel.barrier()
             if parallel.master:
-                dynamiciter[...] = 0
+                dynamiciter.store(0, 0)
                 self._haserror = parallel._errormon.haserror
             else:
                 self._haserror = lambda : False
             if ordered:
+                # Ordered watches the iteration of the rank
+                self.iter = numpy.empty((), dtype='intp')
+                self.iter[...] = 0
                 self.ordered = parallel._Ordered(self.iter)
             else:
+                self.iter = None
                 self.ordered = None
 
             # this is important, to
@@ -440,35 +806,54 @@ def MetaDynamicForLoop(parallel, mutex, dynamiciter):
 
         @classmethod
         def abort(self):
-            mutex.release()
+            # the chunks are claimed without locks.
+            pass
+
+        def _claim(self, N):
+            """ claim the next chunk; returns the start and the size. """
+            if not self.guided:
+                return dynamiciter.fetch_add(0, self.chunk), self.chunk
+            start = dynamiciter.load(0)
+            while True:
+                size = max((N - start) // parallel.num_threads, self.chunk)
+                old = dynamiciter.compare_exchange(0, start, start + size)
+                if old == start:
+                    return start, size
+                start = old
 
         def __iter__(self):
             N = len(self.range)
+            range_ = self.range
+            rank = parallel.rank
+            counts = parallel.progress._counts
+            tracer = parallel.tracer
             while True:
-                try:
-                    mutex.acquire()
-                    # get the unit of work
-                    if not self.guided:
-                        newchunk = self.chunk
-                    else:
-                        newchunk = (N - dynamiciter) // \
-                                parallel.num_threads
-                        if newchunk < self.chunk: 
-                            newchunk = self.chunk
-                    self.iter[...] = dynamiciter
-                    dynamiciter[...] += newchunk
-                finally:
-                    mutex.release()
-
-                if self.iter[...] >= N:
+                start, size = self._claim(N)
+                if start >= N:
                     break
-                for i in range(newchunk):
-                    if self.iter >= N: break
+                end = min(start + size, N)
+                if tracer is not None:
+                    tracer.begin(rank, 'task', start)
+                if self.blocks:
+                    block = _block(self.array, start, end)
                     if self.ordered is None:
-                        yield self.range[self.iter]
+                        yield block
                     else:
-                        yield self.range[self.iter], self.ordered
-                    self.iter[...] += 1
+                        self.iter[...] = start
+                        self.ordered.step = end - start
+                        yield block, self.ordered
+                    counts[rank] += end - start
+                elif self.ordered is None:
+                    for i in range(start, end):
+                        yield range_[i]
+                        counts[rank] += 1
+                else:
+                    for i in range(start, end):
+                        self.iter[...] = i
+                        yield range_[i], self.ordered
+                        counts[rank] += 1
+                if tracer is not None:
+                    tracer.end(rank, 'task', start)
                 if self._haserror():
                     break
             self._haserror = None
@@ -476,56 +861,96 @@ def MetaDynamicForLoop(parallel, mutex, dynamiciter):
 
 def MetaStaticForLoop(parallel):
     class ForLoop:
-        def __init__(self, range, ordered, chunk):
+        def __init__(self, range, ordered, chunk, blocks=False):
             self.start = parallel.rank * len(range) // parallel.num_threads
             self.end = (parallel.rank + 1)* len(range) // parallel.num_threads
             self.range = range
-            self.iter = numpy.empty((), dtype='intp')
-            self.iter[...] = 0
+            self.blocks = blocks
+            self.array = None
+            # the blocks split the share of the rank
+            if chunk is None:
+                chunk = max(self.end - self.start, 1)
+            self.chunk = chunk
             if parallel.master:
                 self._haserror = parallel._errormon.haserror
             else:
                 self._haserror = lambda : False
             if ordered:
+                # Ordered watches the iteration of the rank
+                self.iter = numpy.empty((), dtype='intp')
+                self.iter[...] = 0
                 self.ordered = parallel._Ordered(self.iter)
             else:
+                self.iter = None
                 self.ordered = None
         @classmethod
         def abort(kls):
             pass
         def __iter__(self):
+            counts = parallel.progress._counts
+            rank = parallel.rank
+            tracer = parallel.tracer
+            if tracer is not None:
+                tracer.begin(rank, 'task', self.start)
+            if self.blocks:
+                for start in range(self.start, self.end, self.chunk):
+                    if self._haserror():
+                        break
+                    end = min(start + self.chunk, self.end)
+                    block = _block(self.array, start, end)
+                    if self.ordered is None:
+                        yield block
+                    else:
+                        self.iter[...] = start
+                        self.ordered.step = end - start
+                        yield block, self.ordered
+                    counts[rank] += end - start
+                if tracer is not None:
+                    tracer.end(rank, 'task', self.start)
+                self._haserror = None
+                return
             for i in range(self.start, self.end):
                 if self._haserror():
                     break
-                self.iter[...] = i
                 if self.ordered is None:
                     yield self.range[i]
                 else:
+                    self.iter[...] = i
                     yield self.range[i], self.ordered
+                counts[rank] += 1
+            if tracer is not None:
+                tracer.end(rank, 'task', self.start)
             self._haserror = None
     return ForLoop
 
-def MetaOrdered(parallel, done, turnstile):
+def MetaOrdered(parallel, turn):
     """meta class for Ordered construct."""
     class Ordered:
         def __init__(self, iterref):
             if parallel.master:
-                done[...] = 0
+                turn.reset()
             self.iterref = iterref
+            # number of iterations in the turn; see forblocks
+            self.step = 1
             parallel.barrier()
 
         @classmethod
         def abort(self):
-            turnstile.release()
+            turn.abort()
 
         def __enter__(self):
-            while self.iterref != done:
-                pass
-            turnstile.acquire()
+            tracer = parallel.tracer
+            if tracer is not None:
+                tracer.begin(parallel.rank, 'ordered.wait', int(self.iterref))
+            turn.wait(parallel.rank, int(self.iterref))
+            if tracer is not None:
+                tracer.end(parallel.rank, 'ordered.wait', int(self.iterref))
+                tracer.begin(parallel.rank, 'ordered', int(self.iterref))
             return self
         def __exit__(self, *args):
-            done[...] += 1
-            turnstile.release()
+            if parallel.tracer is not None:
+                parallel.tracer.end(parallel.rank, 'ordered', int(self.iterref))
+            turn.advance(self.step)
     return Ordered
 
 class Var(object):
@@ -590,26 +1015,115 @@ class Private(VarSet):
 class Reduction(VarSet):
     """A set of reduction variables
         all variables will be reduced by the same ufunc
+
+        Reduction(ufunc, varname=value, ..., inplace=False)
+
+        Each rank accumulates into its own copy of the variables, starting
+        from value; when the section exits, the ranks reduce the copies
+        together, each rank a slice of the elements.
+
+        if inplace, the ranks accumulate into a single shared copy
+        instead, avoiding the num_threads copies of large variables; the
+        variable is then updated with p.var.name.update(value), or
+        p.var.name += value for numpy.add, which combines a slice of
+        the elements at a time under a lock per slice. value is counted
+        once, rather than once per rank.
     """
     def __init__(self, ufunc, **kwargs):
         self._ufunc = ufunc
+        self._inplace = kwargs.pop('inplace', False)
+        self._accumulators = None
         VarSet.__init__(self, **kwargs)
 
     def beforefork(self, parallel):
-        self._fulldata = sharedmem.empty(parallel.num_threads, self._dtype)
+        if self._inplace:
+            self.data = sharedmem.empty((), self._dtype)
+            for key, value in self._input:
+                self.data[key] = value
+            self._locks = [Semaphore(1) for i in range(parallel.num_threads)]
+        else:
+            self._fulldata = sharedmem.empty(parallel.num_threads, self._dtype)
 
     def afterfork(self, parallel):
-        self.data = self._fulldata[parallel.rank]
-        for key, value in self._input:
-            self.data[key] = value
+        if self._inplace:
+            self._accumulators = dict([
+                (key, Accumulator(self._ufunc, self.data[key], self._locks,
+                    parallel.rank))
+                for key, value in self._input])
+        else:
+            self.data = self._fulldata[parallel.rank, ...]
+            for key, value in self._input:
+                self.data[key] = value
         VarSet.afterfork(self, parallel)
 
+    def __getitem__(self, index):
+        if self._accumulators is not None:
+            return self._accumulators[index]
+        return self.data[index]
+
+    def __setitem__(self, index, value):
+        if self._accumulators is not None:
+            if value is not self._accumulators[index]:
+                raise TypeError("use update to modify an inplace Reduction")
+            # from +=
+            return
+        self.data[index][...] = value
+
+    def reducelocal(self, parallel):
+        """ reduce the slice of the elements of the rank
+            across the copies of all ranks into the copy of the master. """
+        if self._inplace:
+            return
+        for key in self:
+            full = self._fulldata[key].reshape(parallel.num_threads, -1)
+            size = full.shape[1]
+            start = parallel.rank * size // parallel.num_threads
+            end = (parallel.rank + 1) * size // parallel.num_threads
+            out = full[0, start:end]
+            for r in range(1, parallel.num_threads):
+                self._ufunc(out, full[r, start:end], out=out)
+
     def reduce(self, parallel):
-        if parallel.master:
-            for key in self:
-                self[key] = self._ufunc.reduce(self._fulldata[key], axis=0)
-        else:
-            self.data = self._fulldata[0].view(type=Shared)
+        self._accumulators = None
+        if not parallel.master:
+            if not self._inplace:
+                self.data = self._fulldata[0, ...].view(type=Shared)
+
+class Accumulator(object):
+    """ A variable of an inplace Reduction, in shared memory.
+
+        update combines a value into the variable with the ufunc
+        of the Reduction, one slice of the elements at a time, each under
+        its own lock. A rank starts from its own slice, such that
+        the ranks rarely wait for each other.
+    """
+    def __init__(self, ufunc, data, locks, rank):
+        self.ufunc = ufunc
+        self.data = data
+        self.locks = locks
+        self.rank = rank
+
+    def update(self, value):
+        data = self.data.reshape(-1)
+        value = numpy.broadcast_to(value, self.data.shape).reshape(-1)
+        n = len(self.locks)
+        for i in range(n):
+            s = (self.rank + i) % n
+            start = s * len(data) // n
+            end = (s + 1) * len(data) // n
+            if start == end: continue
+            with self.locks[s]:
+                self.ufunc(data[start:end], value[start:end],
+                        out=data[start:end])
+
+    def __iadd__(self, value):
+        if self.ufunc is not numpy.add:
+            raise TypeError("+= accumulates with numpy.add; use update")
+        self.update(value)
+        return self
+
+    def __array__(self, dtype=None):
+        return numpy.asarray(self.data, dtype=dtype)
 
 def testraiseordered():
     for schedule in ['static', 'dynamic', 'guided']:
@@ -651,6 +1165,25 @@ def testreduction():
                 p.var.a += numpy.array([i, i * 10])
         assert (p.var.a == [190, 1900]).all()
 
+def testreductionlarge():
+    for inplace in [False, True]:
+        with Parallel(
+                Reduction(numpy.add, a=numpy.zeros(100001), b=0, inplace=inplace),
+                Reduction(numpy.maximum, c=numpy.zeros((3, 7)), inplace=inplace),
+                ) as p:
+            for i in p.forloop(range(20), schedule='dynamic'):
+                if inplace:
+                    p.var.a += numpy.arange(100001) * i
+                    p.var.b += i
+                    p.var.c.update(i)
+                else:
+                    p.var.a += numpy.arange(100001) * i
+                    p.var.b += i
+                    p.var.c[...] = numpy.maximum(p.var.c, i)
+        assert (p.var.a == numpy.arange(100001) * 190).all()
+        assert p.var.b == 190
+        assert (p.var.c == 19).all()
+
 def testprivate():
     for schedule in ['static', 'dynamic', 'guided']:
         truevalue = numpy.zeros(2)
@@ -663,6 +1196,29 @@ def testprivate():
                     truevalue += numpy.array([i, i * 10])
         assert (p.var.a == truevalue).all()
 
+def testforblocks():
+    x = numpy.arange(1000)
+    for schedule in ['static', 'dynamic', 'guided',
+                     ('static', 7), ('dynamic', 7), ('guided', 7)]:
+        with Parallel(
+                Shared(y=numpy.zeros(1000)),
+                Reduction(numpy.add, a=[0])
+                ) as p:
+            for sl in p.forblocks(len(x), schedule=schedule):
+                p.var.y[sl] += x[sl]
+                p.var.a += x[sl].sum()
+        assert (p.var.y == x).all()
+        assert p.var.a[0] == x.sum()
+
+        with Parallel(
+                Shared(l=numpy.zeros(500, 'i8'), n=0)
+                ) as p:
+            for block, ordered in p.forblocks(x[::2], ordered=True, schedule=schedule):
+                with ordered:
+                    p.var.l[p.var.n:p.var.n + len(block)] = block
+                    p.var.n += len(block)
+        assert (p.var.l == x[::2]).all()
+
 def testshared():
     for schedule in ['static', 'dynamic', 'guided']:
         with Parallel(
@@ -685,7 +1241,93 @@ def testbarrier():
         #time.sleep(p.rank * 0.01)
         p.barrier()
         p.barrier()
+    for barrier in ['sense', 'dissemination', 'turnstile']:
+        with Parallel(Shared(a=numpy.zeros(8)), num_threads=5,
+                barrier=barrier) as p:
+            for i in range(20):
+                p.var.a[p.rank] = i
+                p.barrier()
+                assert (p.var.a[:5] == i).all()
+                p.barrier()
+        try:
+            with Parallel(num_threads=3, barrier=barrier) as p:
+                if p.rank == 1:
+                    raise ValueError('raised before the barrier')
+                p.barrier()
+            assert False
+        except ValueError as e:
+            pass
         
+def testrwlock():
+    from .locks import RWLock, SeqLock
+    rwlock = RWLock()
+    seqlock = SeqLock(2, dtype='i8')
+    with Parallel(
+            Shared(a=[0, 0])
+            ) as p:
+        for i in p.forloop(range(200), schedule='dynamic'):
+            if i % 10 == 0:
+                with rwlock.write:
+                    p.var.a[0] += 1
+                    p.var.a[1] -= 1
+                with seqlock as data:
+                    data += [1, -1]
+            else:
+                with rwlock.read:
+                    assert p.var.a[0] + p.var.a[1] == 0
+                assert seqlock.read().sum() == 0
+    assert (p.var.a == [20, -20]).all()
+    assert (seqlock.read() == [20, -20]).all()
+
+def testtrace():
+    with Parallel(
+            Reduction(numpy.add, a=[0, 0]),
+            trace=True
+            ) as p:
+        for i, ordered in p.forloop(range(20),
+                ordered=True, schedule='dynamic'):
+            with p.critical:
+                p.var.a += numpy.array([i, i * 10])
+            with ordered:
+                pass
+        p.barrier()
+    assert (p.var.a == [190, 1900]).all()
+    events = [e for e in p.tracer.events() if e['ph'] == 'B']
+    names = [e['name'] for e in events]
+    assert names.count('task') == 20
+    assert names.count('critical') == 20
+    assert names.count('ordered') == 20
+    assert names.count('barrier') >= p.num_threads
+    assert names.count('fork') == 1
+    assert names.count('join') == 1
+
+def testprogress():
+    seen = []
+    for schedule in ['static', 'dynamic', 'guided']:
+        with Parallel(progress=lambda progress: seen.append(progress.done),
+                interval=0.01) as p:
+            for i in p.forloop(range(100), schedule=schedule):
+                time.sleep(0.001)
+            for i in p.forloop(range(20), schedule=schedule):
+                pass
+        assert p.progress.total == 120
+        assert p.progress.done == 120
+        assert seen[-1] == 120
+
+def testprofile():
+    def inner(i):
+        return i * 2
+    with Parallel(
+            Reduction(numpy.add, a=[0, 0]),
+            profile=True
+            ) as p:
+        for i in p.forloop(range(100)):
+            p.var.a += inner(i)
+    assert len(p.profiles) == p.num_threads
+    calls = [key for key in p.profile.stats if key[2] == 'inner']
+    assert len(calls) == 1
+    assert p.profile.stats[calls[0]][1] == 100
+
 def testkill():
     try:
         with Parallel(
@@ -711,16 +1353,27 @@ def main():
     for i in range(100):
         print('run', i)
         testreduction()
+        testreductionlarge()
         print('private')
         testprivate()
         print('shared')
         testshared()
+        print('forblocks')
+        testforblocks()
         print('bairer')
         testbarrier()
         print('raisecritical')
         testraisecritical()
         print('raiseordered')
         testraiseordered()
+        print('rwlock')
+        testrwlock()
+        print('progress')
+        testprogress()
+        print('trace')
+        testtrace()
+        print('profile')
+        testprofile()
         print('done', i)
     print('all done')
 
@@ -17,6 +17,10 @@
     - MapReduce allows the use of critical sections and ordered execution in the work
       function.
 
+    :py:class:`Executor` implements the concurrent.futures interface over a
+    fixed group of slaves; use it for many small asynchronous calls instead
+    of :py:class:`background`, which forks per call.
+
     Shared memory segments can be accessed as numpy arrays, allocated via 
 
     - :py:meth:`sharedmem.empty`,
@@ -107,6 +111,11 @@
     >>>    pool.map(work, range(10))
     >>> print(counter)
 
+    Unrelated data can be protected by different locks, such that the
+    workers updating one do not wait for those updating the other:
+    :code:`with pool.critical[key]:`. Print :code:`pool.critical` after
+    map to find the contended locks.
+
     API References
     --------------
     
@@ -117,14 +126,18 @@ __email__ = "rainwoodman@gmail.com"
 __all__ = ['set_debug', 'get_debug', 
         'total_memory', 'cpu_count', 
         'SlaveException', 'StopProcessGroup',
+        'HybridBackend',
         'background',
-        'MapReduce', 'MapReduceByThread',
+        'Executor',
+        'MapReduce', 'MapReduceByThread', 'MapStats', 'Collectives', 'ReductionBuffer', 'Speculation', 'ChunkTuner', 'Tracer', 'Progress',
         'empty', 'empty_like', 
         'full', 'full_like',
         'copy',
         ]
 
 import os
+import sys
+import time
 import multiprocessing
 import threading
 try:
@@ -132,23 +145,122 @@ try:
 except ImportError:
     import queue
 
-from collections import deque
+from collections import deque, OrderedDict
 import traceback
 import warnings
 import gc
 import threading
 import heapq
 import os
+import cProfile
+import pstats
+import shutil
+import tempfile
+import weakref
 
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 
+try:
+    import resource
+except ImportError:
+    # not on unix; no fault counts.
+    resource = None
+
+try:
+    from concurrent import futures
+except ImportError:
+    # python 2 without the futures backport; Executor is unavailable.
+    futures = None
+
 import numpy
 from multiprocessing import RawArray
 import ctypes
 import mmap
+
+try:
+    _cputime = time.thread_time
+except AttributeError:
+    try:
+        _cputime = time.process_time
+    except AttributeError:
+        _cputime = time.clock
+
+def _scalars(array):
+    """ a view of array for fast access to its elements.
+
+        A memoryview indexes much faster than a numpy array on python 3;
+        on python 2 a memoryview indexes as bytes, so the array is returned.
+    """
+    if sys.version_info[0] < 3:
+        return array
+    return memoryview(array)
+
+def _funckey(func):
+    """ a hashable key of func that does not keep func alive.
+
+        Closures of the same def have different keys; bound methods of
+        the same function and object have the same key. Objects without
+        weak references, e.g. builtins and ufuncs, are their own key.
+    """
+    obj = getattr(func, '__self__', None)
+    func = getattr(func, '__func__', func)
+    try:
+        key = weakref.ref(func)
+    except TypeError:
+        key = func
+    try:
+        hash(key)
+    except TypeError:
+        # unhashable callables are keyed by identity
+        key = id(func)
+    if obj is None:
+        return key
+    return key, id(obj)
+
+def _rss():
+    """ resident memory of the process in bytes; 0 if unknown. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (IOError, OSError):
+        return 0
+
+def _rusage():
+    """ minor and major page faults of the process so far,
+        and the peak resident memory in bytes. """
+    if resource is None:
+        return 0, 0, 0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on linux.
+    return usage.ru_minflt, usage.ru_majflt, usage.ru_maxrss * 1024
+
+def _memory():
+    """ peak resident memory and private dirty memory of the
+        process in bytes; 0 if unknown.
+
+        Private dirty memory of a forked slave includes the pages
+        copied on write.
+    """
+    hwm, dirty = 0, 0
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    hwm = int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Private_Dirty:'):
+                    dirty += int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return hwm, dirty
+
 #logger = multiprocessing.log_to_stderr()
 #logger.setLevel(multiprocessing.SUBDEBUG)
 
@@ -260,8 +372,18 @@ class StopProcessGroup(Exception):
         Exception.__init__(self, "StopProcessGroup")
 
 class ProcessGroup(object):
-    """ Monitoring a group of worker processes """
-    def __init__(self, backend, main, np, args=()):
+    """ Monitoring a group of worker processes
+
+        If sample is True or memory_limit (bytes) is given, a thread in each
+        slave process samples the resident memory of the slave into
+        :code:`rss` every :code:`MEMORY_INTERVAL` seconds. A slave exceeding
+        memory_limit posts a MemoryError and exits, before the OOM killer of
+        the kernel intervenes.
+    """
+    MEMORY_INTERVAL = 0.1
+
+    def __init__(self, backend, main, np, args=(), memory_limit=None,
+            sample=False):
         self.Errors = backend.QueueFactory(1)
         self._tls = backend.StorageFactory()
         self.main = main
@@ -275,21 +397,75 @@ class ProcessGroup(object):
         # each dead child releases one sempahore
         # when all dead guard will proceed to set guarddead
         self.semaphore = threading.Semaphore(0)
-        self.JoinedProcesses = multiprocessing.RawValue('l')
+
+        # the exit token; a slave takes the token before exiting,
+        # and the guard of the slave passes it on after the slave
+        # is joined. See _slaveMain.
+        self.ExitToken = backend.SemaphoreFactory(1)
+
+        # ranks are grouped into slaves; each slave runs a thread per rank
+        # in the group. Only HybridBackend runs more than one thread.
+        threads = getattr(backend, 'threads', 1)
+        groups = [list(range(i, min(i + threads, np)))
+                for i in range(0, np, threads)]
+        self.groups = groups
         self.P = [
             backend.SlaveFactory(target=self._slaveMain,
-                args=(rank,)) \
-                for rank in range(np)
+                args=(rank, groups[rank])) \
+                for rank in range(len(groups))
             ]
         self.G = [
             threading.Thread(target=self._slaveGuard,
                 args=(rank, self.P[rank])) \
-                for rank in range(np)
+                for rank in range(len(groups))
             ]
+        # 1 if the slave has taken the exit token. A slave killed before
+        # that (killall, memory_limit, the OOM killer) has no token for
+        # its guard to pass on.
+        self.tokens = empty(len(groups), dtype='i1')
+        self.tokens[...] = 0
+        self.memory_limit = memory_limit
+        self.sample = sample or memory_limit is not None
+        # the last sampled resident memory of each slave, in bytes
+        self.rss = empty(len(groups), dtype='i8')
+        self.rss[...] = 0
         return
 
-    def _slaveMain(self, rank):
+    def _slaveMain(self, process_rank, ranks):
+        if self.sample and not isinstance(self.P[process_rank], threading.Thread):
+            guard = threading.Thread(target=self._memoryGuard,
+                    args=(process_rank,))
+            guard.daemon = True
+            guard.start()
+        try:
+            if len(ranks) == 1:
+                self._rankMain(ranks[0], process_rank, 0)
+            else:
+                threads = [
+                    threading.Thread(target=self._rankMain,
+                        args=(rank, process_rank, thread_rank))
+                    for thread_rank, rank in enumerate(ranks)
+                    ]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        finally:
+#            self.Errors.close()
+#            self.Errors.join_thread()
+            # making all slaves exit one after another
+            # on some Linuxes if many slaves (56+) access
+            # mmap randomly the termination of the slaves
+            # run into a deadlock.
+            # The token is released by _slaveGuard once this
+            # slave is joined; waiting slaves block without spinning.
+            self.ExitToken.acquire()
+            self.tokens[process_rank] = 1
+
+    def _rankMain(self, rank, process_rank, thread_rank):
         self._tls.rank = rank
+        self._tls.process_rank = process_rank
+        self._tls.thread_rank = thread_rank
         try:
             self.main(self, *self.args)
         except SlaveException as e:
@@ -312,26 +488,48 @@ class ProcessGroup(object):
                 self.Errors.put((e, tb), timeout=0)
             except queue.Full:
                 pass
-        finally:
-#            self.Errors.close()
-#            self.Errors.join_thread()
-            # making all slaves exit one after another
-            # on some Linuxes if many slaves (56+) access
-            # mmap randomly the termination of the slaves
-            # run into a deadlock.
-            while self.JoinedProcesses.value < rank:
-                continue
-            pass
+
+    def _memoryGuard(self, process_rank):
+        while True:
+            rss = _rss()
+            self.rss[process_rank] = rss
+            if self.memory_limit is not None and rss > self.memory_limit:
+                e = MemoryError("slave process %d uses %d bytes of memory, above the memory_limit of %d bytes"
+                        % (process_rank, rss, self.memory_limit))
+                try:
+                    self.Errors.put((e, ""), timeout=0)
+                except queue.Full:
+                    pass
+                # flush the error before exiting; the queue is not closed
+                # because the other ranks of a hybrid slave may still put.
+                deadline = time.time() + 1
+                while self.Errors.empty() and time.time() < deadline:
+                    time.sleep(0.01)
+                os.kill(os.getpid(), 5)
+                return
+            time.sleep(self.MEMORY_INTERVAL)
+
+    def _kill(self, p):
+        if not p.is_alive(): return
+        try:
+            if isinstance(p, threading.Thread): p.join()
+            else: os.kill(p._popen.pid, 5)
+        except Exception as e:
+            print(e)
 
     def killall(self):
         for p in self.P:
-            if not p.is_alive(): continue
-            try:
-                if isinstance(p, threading.Thread): p.join()
-                else: os.kill(p._popen.pid, 5)
-            except Exception as e:
-                print(e)
-                continue
+            self._kill(p)
+
+    def kill(self, ranks):
+        """ kill the slaves running any of ranks; returns the ranks
+            of the slaves killed. """
+        killed = []
+        for p, group in zip(self.P, self.groups):
+            if any(rank in ranks for rank in group):
+                self._kill(p)
+                killed.extend(group)
+        return killed
 
     def _errorGuard(self):
         # this guard will kill every child if
@@ -351,12 +549,18 @@ class ProcessGroup(object):
             pass
         else:
             if process.exitcode < 0 and process.exitcode != -5:
-                e = Exception("slave process %d killed by signal %d" % (rank, -
-                    process.exitcode))
+                msg = "slave process %d killed by signal %d" % (rank, -
+                    process.exitcode)
+                if self.rss[rank] > 0:
+                    msg += "; last resident memory %d bytes" % self.rss[rank]
+                e = Exception(msg)
                 try:
                     self.Errors.put((e, ""), timeout=0)
                 except queue.Full:
                     pass
+        # pass the exit token to the next slave, if the slave took it.
+        if self.tokens[rank]:
+            self.ExitToken.release()
         self.semaphore.release() 
 
     def _guardMain(self):
@@ -364,12 +568,10 @@ class ProcessGroup(object):
         # we then set the guardDead event
         for x in self.G:
             self.semaphore.acquire()
-            self.JoinedProcesses.value = self.JoinedProcesses.value + 1
 
         self.guardDead.set()
 
     def start(self):
-        self.JoinedProcesses.value = 0
         self.guardDead.clear()
 
         # collect the garbages before forking so that the left-over
@@ -401,7 +603,7 @@ class ProcessGroup(object):
         exp = self.Errors.get(timeout=1)
         return SlaveException(*exp)
 
-    def get(self, Q):
+    def get(self, Q, timeout=None):
         """ Protected get. Get an item from Q.
             Will block. but if the process group has errors,
             raise an StopProcessGroup exception.
@@ -409,10 +611,17 @@ class ProcessGroup(object):
             A slave process will terminate upon StopProcessGroup.
             The master process shall read the error from the process group.
 
+            If timeout is not None, raise queue.Empty if no item
+            arrives in timeout seconds.
         """
+        if timeout is not None:
+            deadline = time.time() + timeout
         while self.Errors.empty():
             try:
-                return Q.get(timeout=1)
+                if timeout is None:
+                    return Q.get(timeout=1)
+                else:
+                    return Q.get(timeout=max(min(1, deadline - time.time()), 0))
             except queue.Empty:
                 # check if the process group is dead
                 if not self.is_alive():
@@ -423,21 +632,24 @@ class ProcessGroup(object):
                         return Q.get(timeout=0)
                     except queue.Empty:
                         raise StopProcessGroup
+                elif timeout is not None and time.time() >= deadline:
+                    raise
                 else:
                     continue
         else:
             raise StopProcessGroup
 
     def put(self, Q, item):
-        while self.Errors.empty():
+        """ Protected put. Put an item to Q.
+            Will block. but if the process group has errors or
+            has died, raise an StopProcessGroup exception.
+        """
+        while self.Errors.empty() and self.is_alive():
             try:
                 Q.put(item, timeout=1)
                 return
             except queue.Full:
-                if not self.is_alive():
-                    raise StopProcessGroup
-                else:
-                    continue
+                continue
         else:
             raise StopProcessGroup
 
@@ -454,6 +666,162 @@ class ProcessGroup(object):
         if not self.Errors.empty():
             raise SlaveException(*self.Errors.get())
 
+class Critical(object):
+    """ A critical section. At most one slave is in the section at any time.
+
+        Use :code:`with pool.critical:` in the work function.
+
+        Sections guarding unrelated data need not wait for each other;
+        use :code:`with pool.critical[key]:` or :code:`with pool.lock(key):`
+        to enter one of the lock stripes, chosen by the hash of key.
+        The same key always maps to the same stripe; different keys may
+        share a stripe. The keys must hash the same in all slaves,
+        e.g. strings, integers or tuples of them.
+
+        Every acquisition is counted, and the time waited for the lock is
+        recorded in a histogram. The counters are in shared memory and
+        are updated while the lock is held. They are reset at the
+        beginning of each :py:meth:`MapReduce.map` call.
+
+        Parameters
+        ----------
+        backend : ProcessBackend, ThreadBackend or HybridBackend
+        stripes : int
+            number of lock stripes, in addition to the global lock.
+
+        Attributes
+        ----------
+        count : array_like
+            number of acquisitions of each lock. Lock 0 is
+            the global lock, lock i > 0 is stripe i - 1.
+        wait : array_like
+            total seconds waited for each lock.
+        histogram : array_like
+            number of acquisitions of each lock, binned by the wait:
+            bin 0 is below 1 micro-second, bin b is
+            between 2 ** (b - 1) and 2 ** b micro-seconds.
+    """
+    NBINS = 32
+
+    def __init__(self, backend, stripes=16):
+        self.backend = backend
+        self.stripes = stripes
+        self.locks = [backend.LockFactory() for i in range(stripes + 1)]
+        self.lock = self.locks[0]
+        self.tls = backend.StorageFactory()
+        # seconds blocked per rank; set by map(stats=True)
+        self.waits = None
+        # set during map if tracing
+        self.tracer = None
+
+        self.count = empty(stripes + 1, dtype='i8')
+        self.wait = empty(stripes + 1, dtype='f8')
+        self.histogram = empty((stripes + 1, self.NBINS), dtype='i8')
+        self.reset()
+        self._count = _scalars(self.count)
+        self._wait = _scalars(self.wait)
+        self._histogram = _scalars(self.histogram.reshape(-1))
+        self._stripes = [_Stripe(self, i + 1) for i in range(stripes)]
+
+    def reset(self):
+        """ zero the acquisition counters. """
+        self.count[...] = 0
+        self.wait[...] = 0
+        self.histogram[...] = 0
+
+    def renew(self):
+        """ new locks with the counters of this one; for after a slave
+            is killed, maybe holding a lock. """
+        critical = Critical(self.backend, self.stripes)
+        critical.count[...] = self.count
+        critical.wait[...] = self.wait
+        critical.histogram[...] = self.histogram
+        return critical
+
+    def index(self, key):
+        """ the lock used for key; see :py:attr:`count`. """
+        return hash(key) % self.stripes + 1
+
+    def __getitem__(self, key):
+        return self._stripes[self.index(key) - 1]
+
+    def _acquire(self, i, *args, **kwargs):
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.begin(self.tls.rank, 'critical.wait', i)
+        t0 = time.time()
+        r = self.locks[i].acquire(*args, **kwargs)
+        wait = time.time() - t0
+        if not r:
+            # non-blocking or timed out; the lock is not held.
+            if tracer is not None:
+                tracer.end(self.tls.rank, 'critical.wait', i)
+            return r
+        # the lock is held; no one else writes to its counters.
+        self._count[i] += 1
+        self._wait[i] += wait
+        b = min(int(wait * 1e6).bit_length(), self.NBINS - 1)
+        self._histogram[i * self.NBINS + b] += 1
+        if self.waits is not None:
+            self.waits[self.tls.rank] += wait
+        if tracer is not None:
+            tracer.end(self.tls.rank, 'critical.wait', i)
+            tracer.begin(self.tls.rank, 'critical', i)
+        return r
+
+    def _release(self, i):
+        if self.tracer is not None:
+            self.tracer.end(self.tls.rank, 'critical', i)
+        self.locks[i].release()
+
+    def acquire(self, *args, **kwargs):
+        """ acquire the global lock; the arguments are those of
+            :py:meth:`threading.Lock.acquire`. """
+        return self._acquire(0, *args, **kwargs)
+
+    def release(self):
+        self._release(0)
+
+    def __enter__(self):
+        self._acquire(0)
+        return self
+
+    def __exit__(self, *args):
+        self._release(0)
+
+    def __str__(self):
+        """ a table of the contended locks, the most waited first. """
+        lines = ['%-10s %10s %12s %12s' % ('lock', 'count', 'wait (s)', 'mean (us)')]
+        for i in numpy.argsort(-self.wait, kind='mergesort'):
+            if self.count[i] == 0:
+                continue
+            if i == 0:
+                name = 'critical'
+            else:
+                name = 'stripe %d' % (i - 1)
+            lines.append('%-10s %10d %12.6f %12.2f' % (name, self.count[i],
+                self.wait[i], 1e6 * self.wait[i] / self.count[i]))
+        return '\n'.join(lines)
+
+class _Stripe(object):
+    """ One lock stripe of a :py:class:`Critical`. """
+    def __init__(self, critical, i):
+        self.critical = critical
+        self.i = i
+
+    def acquire(self, *args, **kwargs):
+        return self.critical._acquire(self.i, *args, **kwargs)
+
+    def release(self):
+        self.critical._release(self.i)
+
+    def __enter__(self):
+        self.critical._acquire(self.i)
+        return self
+
+    def __exit__(self, *args):
+        self.critical._release(self.i)
+
 class Ordered(object):
     def __init__(self, backend):
       #  self.counter = lambda : None
@@ -461,6 +829,10 @@ class Ordered(object):
         self.event = backend.EventFactory()
         self.counter = multiprocessing.RawValue('l')
         self.tls = backend.StorageFactory()
+        # seconds blocked per rank; set by map(stats=True)
+        self.waits = None
+        # set during map if tracing
+        self.tracer = None
 
     def reset(self):
         self.counter.value = 0
@@ -470,22 +842,822 @@ class Ordered(object):
         self.tls.iter = iter
 
     def __enter__(self):
+        if self.tracer is not None:
+            self.tracer.begin(self.tls.rank, 'ordered.wait', self.tls.iter)
+        if self.waits is not None:
+            t0 = time.time()
         while self.counter.value != self.tls.iter:
             self.event.wait() 
         self.event.clear()
+        if self.waits is not None:
+            self.waits[self.tls.rank] += time.time() - t0
+        if self.tracer is not None:
+            self.tracer.end(self.tls.rank, 'ordered.wait', self.tls.iter)
+            self.tracer.begin(self.tls.rank, 'ordered', self.tls.iter)
         return self
 
     def __exit__(self, *args):
+        if self.tracer is not None:
+            self.tracer.end(self.tls.rank, 'ordered', self.tls.iter)
         # increase counter before releasing the value
         # so that the others waiting will see the new counter
         self.counter.value = self.counter.value + 1
         self.event.set()
 
+class Collectives(object):
+    """ The collective operations of the ranks of :py:meth:`MapReduce.spmd`,
+        over a buffer in shared memory.
+
+        The barrier is a counter and two turnstiles, used by alternate
+        barriers, such that a fast rank can not pass the next barrier with
+        the wake up of a slow rank from this one.
+
+        The collectives alternate between the two halves of the buffer: a
+        half is reused only after all ranks passed the barrier of the
+        following collective, thus have finished reading it, and a
+        collective needs only one barrier after writing to the buffer.
+        allreduce is a reduce-scatter followed by an allgather: each rank
+        reduces its share of the elements of the contributions of all ranks,
+        in the order of the ranks, such that all ranks obtain the same result.
+
+        Use :py:meth:`MapReduce.barrier`, :py:meth:`MapReduce.bcast`,
+        :py:meth:`MapReduce.allreduce` and :py:meth:`MapReduce.allgather`
+        instead of using the collectives directly.
+
+        Parameters
+        ----------
+        backend : ProcessBackend or ThreadBackend
+            the backend of the ranks.
+        np : int
+            number of ranks.
+        buffersize : int
+            size of each half of the buffer, in bytes; the largest message.
+            The pages of the buffer are only allocated as they are used.
+    """
+    def __init__(self, backend, np, buffersize=2**24):
+        self.np = np
+        self.buffersize = buffersize
+        self.buffer = empty((2, buffersize), dtype='u1')
+        self.mutex = backend.LockFactory()
+        self.turnstiles = [backend.SemaphoreFactory(0), backend.SemaphoreFactory(0)]
+        self.count = empty(2, dtype='i8')
+        self.count[...] = 0
+        self._count = _scalars(self.count[0:1])
+        self._aborted = _scalars(self.count[1:2])
+        self.tls = backend.StorageFactory()
+        # set by spmd
+        self.pg = None
+        self.tracer = None
+
+    def _start(self, rank):
+        self.tls.rank = rank
+        # number of barriers and collectives passed by the rank
+        self.tls.barriers = 0
+        self.tls.collectives = 0
+
+    def _acquire(self, semaphore):
+        if self.pg is None:
+            semaphore.acquire()
+            return
+        # do not wait forever for a rank that has failed.
+        while not semaphore.acquire(timeout=1):
+            if not self.pg.Errors.empty() or not self.pg.is_alive():
+                raise StopProcessGroup
+        if self._aborted[0]:
+            raise StopProcessGroup
+
+    def abort(self):
+        """ stop the ranks waiting in a barrier, and those that will. """
+        self._aborted[0] = 1
+        for turnstile in self.turnstiles:
+            for i in range(self.np):
+                turnstile.release()
+
+    def _half(self, nbytes):
+        """ the half of the buffer for the next collective. """
+        if nbytes > self.buffersize:
+            raise ValueError("the collective needs %d bytes, more than the buffersize of %d bytes"
+                    % (nbytes, self.buffersize))
+        buffer = self.buffer[self.tls.collectives % 2]
+        self.tls.collectives += 1
+        return buffer
+
+    def barrier(self):
+        """ wait until all ranks reach the barrier. """
+        tls = self.tls
+        if self.tracer is not None: self.tracer.begin(tls.rank, 'barrier')
+        turnstile = self.turnstiles[tls.barriers % 2]
+        tls.barriers += 1
+        with self.mutex:
+            self._count[0] += 1
+            last = self._count[0] == self.np
+            if last:
+                self._count[0] = 0
+        if last:
+            for i in range(self.np - 1):
+                turnstile.release()
+        else:
+            self._acquire(turnstile)
+        if self.tracer is not None: self.tracer.end(tls.rank, 'barrier')
+
+    def bcast(self, obj, root=0):
+        """ returns obj of the root rank on all ranks; obj is pickled. """
+        if self.tls.rank == root:
+            data = pickle.dumps(obj, -1)
+            buffer = self._half(len(data) + 8)
+            buffer[:8].view('i8')[0] = len(data)
+            buffer[8:8 + len(data)] = numpy.frombuffer(data, dtype='u1')
+        else:
+            buffer = self._half(0)
+        self.barrier()
+        if self.tls.rank == root:
+            return obj
+        n = buffer[:8].view('i8')[0]
+        return pickle.loads(buffer[8:8 + n].tobytes())
+
+    def allgather(self, array):
+        """ returns the arrays of all ranks, stacked in the order of the ranks.
+            The arrays shall be of the same shape and dtype on all ranks. """
+        array = numpy.asarray(array)
+        buffer = self._half(array.nbytes * self.np)
+        out = buffer[:array.nbytes * self.np].view(array.dtype).reshape(
+                (self.np,) + array.shape)
+        out[self.tls.rank] = array
+        self.barrier()
+        # a private copy, not a shared memory array
+        return numpy.array(out)
+
+    def allreduce(self, array, op=numpy.add):
+        """ returns op.reduce of the arrays of all ranks, in the order of the ranks.
+            The arrays shall be of the same shape and dtype on all ranks. """
+        array = numpy.asarray(array)
+        np, rank, size = self.np, self.tls.rank, array.size
+        buffer = self._half(array.nbytes * (np + 1))
+        out = buffer[:array.nbytes * (np + 1)].view(array.dtype).reshape(np + 1, size)
+        out[rank] = array.reshape(-1)
+        self.barrier()
+        start, end = size * rank // np, size * (rank + 1) // np
+        op.reduce(out[:np, start:end], axis=0, out=out[np, start:end])
+        self.barrier()
+        return numpy.array(out[np].reshape(array.shape))
+
+class MapStats(object):
+    """ Performance statistics of a :py:meth:`MapReduce.map` call.
+
+        The slaves write the records directly to shared memory, without
+        locks; each slave only writes to the records of its own rank and
+        of the items it runs.
+
+        Attributes
+        ----------
+        tasks : structured array, one record per item of the sequence
+            - rank : rank of the slave that ran the item.
+            - queue_wait : seconds between the item being queued by the master
+              and started by the slave.
+            - start : seconds from the start of map to the start of the item.
+            - wall : wall clock time of the work function, in seconds.
+              With map(chunksize=...), the items of a chunk share
+              the measurements of the chunk, divided evenly.
+            - cpu : cpu time of the work function, in seconds.
+            - maxrss : peak resident memory of the slave up to the end of
+              the item, in bytes.
+            - minflt, majflt : minor and major page faults of the slave
+              during the item.
+
+        workers : structured array, one record per rank
+            - ntasks : number of items the slave ran.
+            - busy : seconds in the work function.
+            - idle : seconds waiting for items.
+            - critical : seconds blocked in :code:`pool.critical`.
+            - ordered : seconds blocked in :code:`pool.ordered`.
+            - maxrss : peak resident memory of the slave, in bytes.
+            - private_dirty : private dirty memory of the slave when it
+              exits, in bytes; this includes the pages copied on write.
+            - minflt, majflt : minor and major page faults of the slave.
+
+            With HybridBackend, the memory and the faults are of the slave
+            process, shared by its threads.
+
+        wall_time : float
+            seconds in map, including forking and joining the slaves.
+
+        reduce_time : float
+            seconds in the reduce function, on the master.
+
+        speculated : int
+            items run a second time by map(speculative=True).
+
+        speculative_wins : int
+            speculated items whose second run finished first.
+
+    """
+    def __init__(self, size, np):
+        self.tasks = empty(size, dtype=[
+            ('rank', 'i4'),
+            ('queue_wait', 'f8'),
+            ('start', 'f8'),
+            ('wall', 'f8'),
+            ('cpu', 'f8'),
+            ('maxrss', 'i8'),
+            ('minflt', 'i8'),
+            ('majflt', 'i8'),
+            ])
+        self.workers = empty(np, dtype=[
+            ('ntasks', 'i8'),
+            ('busy', 'f8'),
+            ('idle', 'f8'),
+            ('critical', 'f8'),
+            ('ordered', 'f8'),
+            ('maxrss', 'i8'),
+            ('private_dirty', 'i8'),
+            ('minflt', 'i8'),
+            ('majflt', 'i8'),
+            ])
+        self.tasks['rank'] = -1
+        self._queued = empty(size, dtype='f8')
+        self.wall_time = 0.0
+        self.reduce_time = 0.0
+        self.speculated = 0
+        self.speculative_wins = 0
+        self._t0 = time.time()
+
+    def _queue(self, i):
+        self._queued[i] = time.time()
+
+    def _task(self, i, rank, t0, wall, cpu, maxrss, minflt, majflt):
+        self.tasks[i] = (rank, t0 - self._queued[i], t0 - self._t0, wall, cpu,
+                maxrss, minflt, majflt)
+
+    def _chunk(self, i, n, rank, t0, wall, cpu, maxrss, minflt, majflt):
+        # the items of a chunk share the measurements of the chunk
+        tasks = self.tasks[i:i + n]
+        tasks['rank'] = rank
+        tasks['queue_wait'] = t0 - self._queued[i:i + n]
+        tasks['start'] = t0 - self._t0
+        tasks['wall'] = wall / n
+        tasks['cpu'] = cpu / n
+        tasks['maxrss'] = maxrss
+        tasks['minflt'] = minflt // n
+        tasks['majflt'] = majflt // n
+
+    def _killed(self, rank):
+        # a killed slave did not write its record; rebuild it
+        # from the items it finished.
+        tasks = self.tasks[self.tasks['rank'] == rank]
+        workers = self.workers
+        workers['ntasks'][rank] = len(tasks)
+        workers['busy'][rank] = tasks['wall'].sum()
+        workers['idle'][rank] = 0
+        workers['maxrss'][rank] = tasks['maxrss'].max() if len(tasks) else 0
+        workers['private_dirty'][rank] = 0
+        workers['minflt'][rank] = tasks['minflt'].sum()
+        workers['majflt'][rank] = tasks['majflt'].sum()
+
+    def _finish(self):
+        self.wall_time = time.time() - self._t0
+        self._queued = None
+
+    def __str__(self):
+        index = numpy.flatnonzero(self.tasks['rank'] >= 0)
+        tasks = self.tasks[index]
+        workers = self.workers
+        lines = ["%d items on %d slaves in %.3g s; reduce %.3g s" % (
+            len(tasks), len(workers), self.wall_time, self.reduce_time)]
+        if len(tasks) == 0:
+            return lines[0]
+        def minmeanmax(name, a):
+            return "%-10s min %.3g mean %.3g max %.3g s" % (name,
+                    a.min(), a.mean(), a.max())
+        lines.append(minmeanmax("wall", tasks['wall']))
+        lines.append(minmeanmax("cpu", tasks['cpu']))
+        lines.append(minmeanmax("queue wait", tasks['queue_wait']))
+        slowest = tasks['wall'].argmax()
+        lines.append("slowest item %d: %.3g s on rank %d" % (
+            index[slowest], tasks['wall'][slowest], tasks['rank'][slowest]))
+        for name in ['busy', 'idle', 'critical', 'ordered']:
+            lines.append(minmeanmax(name, workers[name]))
+        lines.append("%-10s max %.3g MB, private dirty max %.3g MB" % ("memory",
+            workers['maxrss'].max() / 2.0 ** 20,
+            workers['private_dirty'].max() / 2.0 ** 20))
+        lines.append("%-10s minor %d major %d" % ("faults",
+            workers['minflt'].sum(), workers['majflt'].sum()))
+        busy = workers['busy']
+        if busy.mean() > 0:
+            lines.append("imbalance (max / mean busy) %.3g" % (busy.max() / busy.mean()))
+        if self.speculated > 0:
+            lines.append("speculated %d items, %d finished first" % (
+                self.speculated, self.speculative_wins))
+        return '\n'.join(lines)
+
+class ReductionBuffer(object):
+    """ Private buffers of the ranks for a reduction, e.g. a histogram,
+        accumulated without locks. Create it with :py:meth:`MapReduce.reduction`.
+
+        Each rank accumulates into :py:attr:`local`, its own buffer in
+        shared memory. At the end of :py:meth:`MapReduce.map`, the slaves
+        merge the buffers of all ranks into :py:attr:`value`, each slave
+        merging a share of the elements, before they exit.
+        The buffers keep accumulating over the map calls in the with block,
+        until :py:meth:`reset`.
+
+        Parameters
+        ----------
+        pool : MapReduce
+            the pool.
+        shape : int or tuple
+            shape of the reduction.
+        dtype : dtype
+            dtype of the reduction.
+        op : ufunc
+            the reduction operator, applied to the buffers in the order of the ranks.
+        initial : scalar or None
+            the initial value of the buffers; default is the identity of op.
+
+        Attributes
+        ----------
+        value : array_like
+            the reduction of the buffers of all ranks, after map.
+        buffers : array_like
+            the buffers of all ranks.
+    """
+    def __init__(self, pool, shape, dtype='f8', op=numpy.add, initial=None):
+        if initial is None:
+            initial = op.identity
+        if initial is None:
+            raise ValueError("%s has no identity; provide initial" % op.__name__)
+        try:
+            shape = tuple(shape)
+        except TypeError:
+            shape = (shape, )
+        self.pool = pool
+        self.op = op
+        self.initial = initial
+        self.buffers = empty((max(pool.np, 1), ) + shape, dtype=dtype)
+        self.value = empty(shape, dtype=dtype)
+        self.reset()
+
+    def reset(self):
+        """ set the buffers of all ranks and the value to initial. """
+        self.buffers[...] = self.initial
+        self.value[...] = self.initial
+
+    @property
+    def local(self):
+        """ the buffer of the current rank; only in the work function. """
+        return self.buffers[self.pool.local.rank, ...]
+
+    def _merge(self, k, n):
+        """ merge the k-th of n shares of the elements. """
+        buffers = self.buffers.reshape(len(self.buffers), -1)
+        size = buffers.shape[1]
+        start, end = size * k // n, size * (k + 1) // n
+        self.op.reduce(buffers[:, start:end], axis=0,
+                out=self.value.reshape(-1)[start:end])
+
+class Speculation(object):
+    """ Speculative re-execution of the straggling items of a
+        :py:meth:`MapReduce.map` call; see the speculative argument.
+
+        Once all items have been started, an item running longer than the
+        median of the finished items is queued once more for an idle slave.
+        The first result of an item is used and the other is dropped.
+        When all results have arrived, slave processes still running
+        are killed; the idle slaves and slave threads exit normally.
+        The locks of :py:attr:`MapReduce.critical` are replaced after
+        a kill, since a killed slave may hold one.
+
+        The slaves record the items they run in shared memory; the master
+        decides what to queue again.
+
+        Attributes
+        ----------
+        speculated : int
+            items queued a second time.
+        wins : int
+            items whose second run finished first.
+        killed : list
+            ranks killed when the map ended.
+    """
+    def __init__(self, size, np):
+        self.started = empty(size, dtype='f8')
+        self.started[...] = 0
+        # 1 if the item is queued a second time
+        self.attempt = empty(size, dtype='i1')
+        self.attempt[...] = 0
+        self.done = empty(size, dtype='i1')
+        self.done[...] = 0
+        # the item each rank is running; -1 if idle
+        self.current = empty(np, dtype='i8')
+        self.current[...] = -1
+        self.durations = []
+        self.speculated = 0
+        self.wins = 0
+        self.killed = []
+        # set by _start
+        self.Q = None
+        self.works = None
+
+    def _begin(self, rank, i):
+        """ on the slave; returns the attempt, or None if the
+            item is already done. """
+        attempt = self.attempt[i]
+        if attempt == 0:
+            self.started[i] = time.time()
+        elif self.done[i]:
+            return None
+        self.current[rank] = i
+        return attempt
+
+    def _end(self, rank):
+        """ on the slave """
+        self.current[rank] = -1
+
+    def _finish(self, i, attempt):
+        """ on the master; True for the first result of item i. """
+        if self.done[i]:
+            return False
+        self.done[i] = 1
+        self.durations.append(time.time() - self.started[i])
+        if attempt:
+            self.wins += 1
+        return True
+
+    def _speculate(self, pg):
+        """ on the master; queue the stragglers again for the idle slaves. """
+        if len(self.durations) == 0 or (self.started == 0).any():
+            return
+        idle = (self.current < 0).sum()
+        if idle == 0:
+            return
+        now = time.time()
+        threshold = numpy.median(self.durations)
+        running = numpy.unique(self.current[self.current >= 0])
+        running = running[(self.done[running] == 0) & (self.attempt[running] == 0)]
+        running = running[now - self.started[running] > threshold]
+        # the slowest first
+        running = running[numpy.argsort(self.started[running], kind='mergesort')]
+        for i in running[:idle]:
+            self.attempt[i] = 1
+            self.speculated += 1
+            if self.works is None:
+                pg.put(self.Q, (int(i), ))
+            else:
+                pg.put(self.Q, (int(i), self.works[i]))
+
+    def _stop(self, pg):
+        """ on the master; end the slaves once all results have arrived.
+            Returns the ranks killed. """
+        for i in range(len(self.current)):
+            pg.put(self.Q, None)
+        if isinstance(pg.P[0], threading.Thread):
+            return []
+        # the busy slaves would run a straggler to the end.
+        self.killed = pg.kill(numpy.flatnonzero(self.current >= 0))
+        return self.killed
+
+class ChunkTuner(object):
+    """ Chunk sizes for :code:`MapReduce.map(chunksize=...)` and
+        :py:meth:`MapReduce.mapslices`.
+
+        With chunksize='auto' the size of the next chunk is chosen such that
+        a chunk runs for about the geometric mean of the target window,
+        from the time per item measured by the slaves on the latest chunks.
+        Until a measurement is available the chunk size starts from the
+        time per item remembered from previous calls with the same
+        key (usually the work function), or doubles from 1.
+        No chunk is larger than a 1 / (2 np) share of the remaining items,
+        such that all slaves stay busy to the end; nor smaller than the
+        lower end of the window, if the remaining items allow.
+
+        Parameters
+        ----------
+        size : int
+            number of items.
+        np : int
+            number of slaves.
+        chunksize : int or 'auto'
+        key : hashable or None
+            the key of the time per item in :py:attr:`cache`.
+        target : tuple
+            the window of seconds per chunk.
+        slices : boolean
+            if True, the work function is called once per chunk with
+            a slice; otherwise once per item.
+
+        Attributes
+        ----------
+        cache : OrderedDict
+            the time per item of previous calls, by key, the most recently
+            used last. Shared by all instances; holds at most
+            :code:`CACHESIZE` keys.
+        sizes : list
+            the sizes of the chunks fed so far.
+    """
+    cache = OrderedDict()
+    CACHESIZE = 256
+
+    def __init__(self, size, np, chunksize='auto', key=None, target=(0.005, 0.05),
+            slices=False):
+        self.size = size
+        self.np = np
+        self.key = key
+        self.target = target
+        self.slices = slices
+        if chunksize == 'auto':
+            self.chunksize = None
+        else:
+            self.chunksize = int(chunksize)
+            if self.chunksize <= 0:
+                raise ValueError("chunksize must be positive or 'auto'")
+        # the latest chunk of each rank
+        self.items = empty(np, dtype='i8')
+        self.items[...] = 0
+        self.elapsed = empty(np, dtype='f8')
+        self.elapsed[...] = 0
+        self.sizes = []
+
+    def _record(self, rank, n, elapsed):
+        """ on the slave """
+        self.items[rank] = n
+        self.elapsed[rank] = elapsed
+
+    def peritem(self):
+        """ the estimated seconds per item; None if unknown. """
+        measured = self.items > 0
+        if measured.any():
+            # the larger the chunk the less the overhead biases the estimate
+            best = numpy.argmax(self.items * measured)
+            return self.elapsed[best] / self.items[best]
+        if self.key is None or self.key not in self.cache:
+            return None
+        t = self.cache.pop(self.key)
+        self.cache[self.key] = t
+        return t
+
+    def next(self, start):
+        """ the size of the chunk starting at item start. """
+        remaining = self.size - start
+        if self.chunksize is not None:
+            n = self.chunksize
+        else:
+            t = self.peritem()
+            if t is None:
+                if len(self.sizes) == 0:
+                    n = 1
+                else:
+                    n = 2 * self.sizes[-1]
+            elif t <= 0:
+                n = remaining
+            else:
+                lo, hi = self.target
+                n = int((lo * hi) ** 0.5 / t)
+                share = -(-remaining // (2 * self.np))
+                n = max(min(n, share), int(lo / t))
+        n = max(min(n, remaining), 1)
+        self.sizes.append(n)
+        return n
+
+    def _finish(self):
+        """ remember the time per item for the next call with the key. """
+        if self.key is not None and (self.items > 0).any():
+            t = self.peritem()
+            self.cache.pop(self.key, None)
+            self.cache[self.key] = t
+            while len(self.cache) > self.CACHESIZE:
+                self.cache.popitem(last=False)
+
+class Progress(object):
+    """ Live progress of the slaves.
+
+        Each slave counts the items it has done in its own element of a
+        shared memory array, without locks; the counts can be read at any
+        time from the master or from a monitoring thread.
+
+        :py:meth:`MapReduce.map` counts an item after the work function
+        returns; :py:meth:`Parallel.forloop` counts an iteration after
+        the body of the loop. The work function may count other units
+        of work with :py:meth:`add`.
+
+        Parameters
+        ----------
+        np : int
+            number of slaves.
+        backend : ProcessBackend, ThreadBackend or HybridBackend
+
+        Attributes
+        ----------
+        counts : array_like
+            items done by each rank.
+        total : int
+            items to do.
+    """
+    def __init__(self, np, backend=None):
+        if backend is None:
+            backend = ProcessBackend
+        self.counts = empty(np, dtype='i8')
+        self._counts = _scalars(self.counts)
+        self.tls = backend.StorageFactory()
+        self.tls.rank = 0
+        self.start(0)
+
+    def start(self, total):
+        """ zero the counts and start the clock for total items. """
+        self.counts[...] = 0
+        self.total = total
+        self.t0 = time.time()
+
+    def add(self, n=1):
+        """ count n items done by the calling slave. """
+        self._counts[self.tls.rank] += n
+
+    @property
+    def done(self):
+        """ items done by all slaves. """
+        return int(self.counts.sum())
+
+    @property
+    def elapsed(self):
+        """ seconds since :py:meth:`start`. """
+        return time.time() - self.t0
+
+    @property
+    def rate(self):
+        """ items per second. """
+        elapsed = self.elapsed
+        if elapsed <= 0:
+            return 0.0
+        return self.done / elapsed
+
+    @property
+    def eta(self):
+        """ estimated seconds to finish, or None if unknown. """
+        rate = self.rate
+        if rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def watch(self, callback, interval=1.0):
+        """ Call callback(self) every interval seconds from a thread.
+
+            Returns a function that stops the thread; callback is called
+            once more when the thread stops.
+        """
+        stopped = threading.Event()
+        def main():
+            while not stopped.wait(interval):
+                callback(self)
+            callback(self)
+        thread = threading.Thread(target=main)
+        thread.daemon = True
+        thread.start()
+        def stop():
+            stopped.set()
+            thread.join()
+        return stop
+
+    def __str__(self):
+        eta = self.eta
+        if eta is None:
+            eta = '?'
+        else:
+            eta = '%.0fs' % eta
+        return '%d / %d items, %.1f items/s, ETA %s' % (
+            self.done, self.total, self.rate, eta)
+
+def _loadprofiles(dirname, profiles, merged=None):
+    """ Load the profiles dumped as rank-%d.prof to dirname by the slaves.
+
+        The profile of each rank is added to the dict profiles;
+        returns the merge of merged and all the profiles. The files are removed.
+    """
+    for name in sorted(os.listdir(dirname)):
+        if not name.startswith('rank-') or not name.endswith('.prof'):
+            continue
+        filename = os.path.join(dirname, name)
+        rank = int(name[5:-5])
+        if rank in profiles:
+            profiles[rank].add(filename)
+        else:
+            profiles[rank] = pstats.Stats(filename)
+        if merged is None:
+            merged = pstats.Stats(filename)
+        else:
+            merged.add(filename)
+        os.unlink(filename)
+    return merged
+
+def _printprogress(progress):
+    sys.stderr.write('\r' + str(progress))
+    if progress.done >= progress.total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+class Tracer(object):
+    """ Records a timeline of events of the slaves, for load imbalance and
+        lock convoys.
+
+        Each rank writes into its own row of preallocated shared memory
+        arrays; recording an event takes no locks, no pickling and no I/O.
+        Events beyond the capacity of a row are counted and dropped.
+
+        The timeline is exported in the Chrome trace event format,
+        viewable with chrome://tracing or https://ui.perfetto.dev .
+
+        Use :code:`MapReduce(trace=...)` or :code:`Parallel(trace=...)`
+        instead of creating a Tracer directly.
+
+        Parameters
+        ----------
+        nranks : int
+            number of slaves.
+        capacity : int
+            number of events per rank.
+
+        Attributes
+        ----------
+        MASTER, FEEDER : int
+            ranks of the master thread and of the thread feeding
+            the work items to the slaves.
+        KINDS : list
+            kinds of events; each kind is recorded as a begin and an end.
+    """
+    KINDS = ['task', 'get', 'put',
+             'critical.wait', 'critical',
+             'ordered.wait', 'ordered',
+             'barrier', 'fork', 'join', 'reduce']
+    MASTER = -1
+    FEEDER = -2
+
+    def __init__(self, nranks, capacity=65536):
+        self.nranks = nranks
+        self.capacity = capacity
+        self.codes = dict((kind, i) for i, kind in enumerate(self.KINDS))
+        self.time = empty((nranks + 2, capacity), dtype='f8')
+        self.code = empty((nranks + 2, capacity), dtype='i2')
+        self.arg = empty((nranks + 2, capacity), dtype='i8')
+        self.count = empty(nranks + 2, dtype='i8')
+        self.count[...] = 0
+        self.t0 = time.time()
+        self._rows = [(_scalars(t), _scalars(c), _scalars(a))
+                for t, c, a in zip(self.time, self.code, self.arg)]
+        self._count = _scalars(self.count)
+
+    def _record(self, rank, code, arg):
+        n = self._count[rank]
+        if n < self.capacity:
+            t, c, a = self._rows[rank]
+            t[n] = time.time()
+            c[n] = code
+            a[n] = arg
+        self._count[rank] = n + 1
+
+    def begin(self, rank, kind, arg=-1):
+        """ record the beginning of an event of kind on rank. """
+        self._record(rank, self.codes[kind] * 2, arg)
+
+    def end(self, rank, kind, arg=-1):
+        """ record the end of an event of kind on rank. """
+        self._record(rank, self.codes[kind] * 2 + 1, arg)
+
+    @property
+    def dropped(self):
+        """ number of events dropped because a row is full. """
+        return int(numpy.maximum(self.count - self.capacity, 0).sum())
+
+    def events(self):
+        """ the events as a list of dicts in the Chrome trace event format. """
+        events = []
+        names = [(rank, 'rank %d' % rank) for rank in range(self.nranks)]
+        names += [(self.MASTER, 'master'), (self.FEEDER, 'feeder')]
+        for rank, name in names:
+            tid = rank % (self.nranks + 2)
+            events.append(dict(ph='M', name='thread_name', pid=0, tid=tid,
+                    args=dict(name=name)))
+            events.append(dict(ph='M', name='thread_sort_index', pid=0, tid=tid,
+                    args=dict(sort_index=tid)))
+            n = min(self.count[rank], self.capacity)
+            for t, code, arg in zip(self.time[rank, :n],
+                    self.code[rank, :n], self.arg[rank, :n]):
+                e = dict(name=self.KINDS[code // 2], ph='BE'[code % 2],
+                        ts=(t - self.t0) * 1e6, pid=0, tid=tid)
+                if arg >= 0:
+                    e['args'] = dict(item=int(arg))
+                events.append(e)
+        return events
+
+    def save(self, filename):
+        """ write the timeline to filename as a Chrome trace JSON file. """
+        import json
+        with open(filename, 'w') as f:
+            json.dump(dict(traceEvents=self.events(),
+                displayTimeUnit='ms',
+                otherData=dict(dropped=self.dropped)), f)
 
 class ThreadBackend:
       QueueFactory = staticmethod(queue.Queue)
       EventFactory = staticmethod(threading.Event)
       LockFactory = staticmethod(threading.Lock)
+      SemaphoreFactory = staticmethod(threading.Semaphore)
       StorageFactory = staticmethod(threading.local)
       @staticmethod
       def SlaveFactory(*args, **kwargs):
@@ -497,6 +1669,7 @@ class ProcessBackend:
       QueueFactory = staticmethod(multiprocessing.Queue)
       EventFactory = staticmethod(multiprocessing.Event)
       LockFactory = staticmethod(multiprocessing.Lock)
+      SemaphoreFactory = staticmethod(multiprocessing.Semaphore)
 
       @staticmethod
       def SlaveFactory(*args, **kwargs):
@@ -507,6 +1680,54 @@ class ProcessBackend:
       def StorageFactory():
           return lambda:None
 
+class HybridBackend(object):
+    """ A backend of slave processes, each running several threads.
+
+        Use it when the work function spends most of its time in code that
+        releases the GIL (e.g. numpy); for example, one process per NUMA node
+        with a thread per core.
+
+        All threads of all processes take work from the same queue;
+        critical and ordered sections are shared by all threads of all
+        processes. In the work function, :code:`pool.local.process_rank` and
+        :code:`pool.local.thread_rank` are the rank of the process and of the
+        thread in the process; :code:`pool.local.rank` is the rank of the
+        thread among all threads.
+
+        Parameters
+        ----------
+        processes : int or None
+            Number of processes. Default (None) is :py:func:`cpu_count` // threads.
+        threads : int
+            Number of threads per process.
+
+        Examples
+        --------
+
+        >>> with sharedmem.MapReduce(backend=sharedmem.HybridBackend(2, 8)) as pool:
+        >>>     def work(i):
+        >>>         return pool.local.process_rank, pool.local.thread_rank
+        >>>     pool.map(work, range(100))
+
+    """
+    QueueFactory = staticmethod(multiprocessing.Queue)
+    EventFactory = staticmethod(multiprocessing.Event)
+    LockFactory = staticmethod(multiprocessing.Lock)
+    SemaphoreFactory = staticmethod(multiprocessing.Semaphore)
+    StorageFactory = staticmethod(threading.local)
+    SlaveFactory = staticmethod(ProcessBackend.SlaveFactory)
+
+    def __init__(self, processes=None, threads=1):
+        if processes is None:
+            processes = max(cpu_count() // threads, 1)
+        self.processes = processes
+        self.threads = threads
+
+    @property
+    def np(self):
+        """ total number of threads """
+        return self.processes * self.threads
+
 class background(object):
     """ Asyncrhonized function call via a background process.
 
@@ -549,6 +1770,9 @@ class background(object):
             If any exception occurred it is wrapped and raised.
         """
         e, r = self.result.get()
+        return self._join(e, r)
+
+    def _join(self, e, r):
         self.slave.join()
         self.slave = None
         self.result = None
@@ -556,6 +1780,298 @@ class background(object):
             raise SlaveException(e, r)
         return r
 
+class Executor(futures.Executor if futures is not None else object):
+    """ A :py:class:`concurrent.futures.Executor` over a fixed group of slaves.
+
+        Unlike :py:class:`background`, which forks a process per call,
+        the slaves of an Executor are forked once and reused for all
+        submitted calls.
+
+        The function submitted needs not to be picklable: all functions
+        submitted before the slaves are forked are inherited by the slaves.
+        The slaves are forked lazily, right before the first call is
+        dispatched. When a function unknown to the running slaves is
+        seen, the slaves are retired after the calls in flight finish,
+        and a new group of slaves is forked. Submitting a fresh closure
+        per call thus forks per call; define the work function once and
+        submit it many times. Bound methods of the same object are the
+        same function, no matter how often :code:`obj.method` is evaluated.
+        The executor remembers the latest :code:`MAXFUNCTIONS` functions.
+
+        The arguments and the return value are sent via pickle.
+
+        Parameters
+        ----------
+        np   : int or None
+            Number of slaves. Default (None) is from :py:func:`cpu_count`.
+
+        backend : ProcessBackend or ThreadBackend
+
+        Notes
+        -----
+        A pending call can be cancelled with :py:meth:`Future.cancel`;
+        at most 2 * np calls are dispatched to the slaves at any time.
+
+        Exceptions raised by the function are wrapped in a
+        :py:class:`SlaveException`. If a slave dies unexpectedly, all
+        outstanding futures fail and the executor is broken.
+
+        Examples
+        --------
+
+        >>> with sharedmem.Executor() as executor:
+        >>>     def work(i):
+        >>>         return i * 2
+        >>>     f = executor.submit(work, 10)
+        >>>     print(f.result(), list(executor.map(work, range(10))))
+
+    """
+    MAXFUNCTIONS = 256
+
+    def __init__(self, np=None, backend=ProcessBackend):
+        if futures is None:
+            raise RuntimeError("Executor requires concurrent.futures")
+
+        self.backend = backend
+        if np is None:
+            self.np = getattr(backend, 'np', None) or cpu_count()
+        else:
+            self.np = np
+
+        # registry of submitted functions, by function id; the ids
+        # by _funckey, the most recently submitted last.
+        self._functions = {}
+        self._funcids = OrderedDict()
+        self._nfunctions = 0
+        # functions with id below _nforked are known to the slaves
+        self._nforked = 0
+
+        self._pending = deque()
+        self._running = {}
+        self._ntasks = 0
+
+        self._pg = None
+        self._threads = False
+        self._shutdown = False
+        self._broken = None
+        self._cond = threading.Condition()
+        self._manager = None
+
+    def _main(self, pg, Q, R):
+        while True:
+            capsule = pg.get(Q)
+            if capsule is None:
+                return
+            taskid, func, args, kwargs = capsule
+            if isinstance(func, int):
+                func = self._functions[func]
+            try:
+                r = func(*args, **kwargs)
+            except Exception as e:
+                try:
+                    pickle.dumps(e)
+                except Exception as ee:
+                    e = str(e)
+                pg.put(R, (taskid, e, traceback.format_exc()))
+            else:
+                pg.put(R, (taskid, None, r))
+
+    def _register(self, function):
+        key = _funckey(function)
+        funcid = self._funcids.pop(key, None)
+        if funcid is None:
+            # the registry holds a reference, such that the key
+            # is never reused.
+            funcid = self._nfunctions
+            self._nfunctions = funcid + 1
+            self._functions[funcid] = function
+        self._funcids[key] = funcid
+        while len(self._funcids) > self.MAXFUNCTIONS:
+            key, old = self._funcids.popitem(last=False)
+            del self._functions[old]
+        return funcid
+
+    def _reference(self, funcid, function):
+        """ returns how to refer to a function in the capsule sent to
+            the slaves; None if the slaves can not see the function.
+        """
+        if self._pg is None:
+            return None
+        if self._threads:
+            return function
+        if funcid < self._nforked:
+            return funcid
+        # functions pickle by name, and a name defined after
+        # the fork can not be resolved by the slaves.
+        return None
+
+    def _respawn(self):
+        """ replace the slaves by a fresh fork; shall have no calls in flight. """
+        self._stop()
+        if self._broken is not None:
+            return
+        self._Q = self.backend.QueueFactory(2 * self.np)
+        self._R = self.backend.QueueFactory(2 * self.np)
+        # pending functions may have left the registry; the slaves
+        # shall see them.
+        evicted = []
+        for future, funcid, function, args, kwargs in self._pending:
+            if funcid not in self._functions:
+                self._functions[funcid] = function
+                evicted.append(funcid)
+        self._nforked = self._nfunctions
+        self._pg = ProcessGroup(main=self._main, np=self.np,
+                backend=self.backend,
+                args=(self._Q, self._R))
+        self._pg.start()
+        self._threads = isinstance(self._pg.P[0], threading.Thread)
+        # the slaves have their copy of the registry; slave threads
+        # are sent the functions themselves.
+        for funcid in evicted:
+            del self._functions[funcid]
+
+    def _stop(self):
+        pg = self._pg
+        if pg is None:
+            return
+        self._pg = None
+        try:
+            for i in range(self.np):
+                pg.put(self._Q, None)
+        except StopProcessGroup:
+            pass
+        try:
+            pg.join()
+        except SlaveException as e:
+            self._break(e)
+
+    def _break(self, e):
+        """ fail all outstanding futures with e. """
+        self._broken = e
+        for future in self._running.values():
+            future.set_exception(e)
+        self._running.clear()
+        while self._pending:
+            future = self._pending.popleft()[0]
+            if future.set_running_or_notify_cancel():
+                future.set_exception(e)
+        pg = self._pg
+        if pg is not None:
+            self._pg = None
+            pg.killall()
+            try:
+                pg.join()
+            except SlaveException:
+                pass
+
+    def _dispatch(self, respawn=False):
+        """ send pending calls to the slaves. Shall hold self._cond.
+
+            If respawn is True and the slaves can not see the next
+            function, the slaves are replaced once all calls in flight are done.
+        """
+        while self._pending and len(self._running) < 2 * self.np:
+            future, funcid, function, args, kwargs = self._pending[0]
+            func = self._reference(funcid, function)
+            if func is None:
+                if not respawn or len(self._running) > 0:
+                    break
+                self._respawn()
+                if self._broken is not None:
+                    break
+                continue
+
+            self._pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            taskid = self._ntasks
+            self._ntasks = self._ntasks + 1
+            self._running[taskid] = future
+            try:
+                self._pg.put(self._Q, (taskid, func, args, kwargs))
+            except StopProcessGroup:
+                # the manager will see the error from the process group.
+                break
+
+    def _manage(self):
+        # the manager collects the results, and forks the slaves
+        # whenever a function unknown to the slaves is seen.
+        while True:
+            with self._cond:
+                while not self._running:
+                    if self._broken is not None:
+                        return
+                    self._dispatch(respawn=True)
+                    if self._running:
+                        break
+                    if self._shutdown and not self._pending:
+                        self._stop()
+                        return
+                    self._cond.wait()
+                pg, R = self._pg, self._R
+            try:
+                taskid, e, r = pg.get(R)
+            except StopProcessGroup:
+                with self._cond:
+                    try:
+                        e = pg.get_exception()
+                    except queue.Empty:
+                        e = SlaveException(
+                            Exception("slaves exited unexpectedly"), "")
+                    self._break(e)
+                return
+
+            with self._cond:
+                future = self._running.pop(taskid)
+                self._dispatch(respawn=True)
+
+            if e is not None:
+                future.set_exception(SlaveException(e, r))
+            else:
+                future.set_result(r)
+
+    def submit(self, fn, *args, **kwargs):
+        """ Schedule fn(*args, **kwargs) to run on a slave.
+
+            Returns
+            -------
+            future : concurrent.futures.Future
+        """
+        with self._cond:
+            if self._broken is not None:
+                raise RuntimeError("the executor is broken: %s" % str(self._broken))
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = futures.Future()
+            self._pending.append((future, self._register(fn), fn, args, kwargs))
+            self._dispatch()
+            if self._manager is None:
+                self._manager = threading.Thread(target=self._manage)
+                self._manager.daemon = True
+                self._manager.start()
+            self._cond.notify()
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """ Stop accepting calls; the slaves exit once all pending calls are done.
+
+            Parameters
+            ----------
+            wait : boolean
+                if True, block until the slaves are joined.
+            cancel_futures : boolean
+                if True, cancel all calls that are not yet dispatched.
+        """
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                while self._pending:
+                    self._pending.popleft()[0].cancel()
+            self._cond.notify()
+            manager = self._manager
+        if wait and manager is not None:
+            manager.join()
+
 def MapReduceByThread(np=None):
     """ Creates a MapReduce object but with the Thread backend.
 
@@ -569,15 +2085,39 @@ class MapReduce(object):
 
         Parameters
         ----------
-        backend : ProcessBackend or ThreadBackend
+        backend : ProcessBackend, ThreadBackend or a HybridBackend
             ProcessBackend is preferred. ThreadBackend can be used in cases where
-            processes creation is not allowed.
+            processes creation is not allowed. :py:class:`HybridBackend`
+            runs several threads in each slave process.
 
         np   : int or None
             Number of processes to use. Default (None) is from OMP_NUM_THREADS or
-            the number of available cores on the computer. If np is 0, all operations
+            the number of available cores on the computer; or the total number
+            of threads of a HybridBackend. If np is 0, all operations
             are performed on the master process -- no child processes are created.
 
+        trace : boolean or str
+            If True, record a timeline of the slaves into :py:attr:`tracer`,
+            a :py:class:`Tracer`. If a file name, also write the timeline
+            to the file as a Chrome trace when the with block exits.
+
+        stripes : int
+            Number of lock stripes of :py:attr:`critical`, for
+            :code:`pool.critical[key]` and :py:meth:`lock`.
+
+        memory_limit : int or None
+            Soft limit of the resident memory of each slave process, in bytes.
+            A slave above the limit is stopped and :py:meth:`map` raises
+            a :py:class:`SlaveException` with a MemoryError as the reason,
+            before the OOM killer of the kernel intervenes. The memory
+            is sampled every 0.1 seconds. Not enforced with ThreadBackend.
+
+        profile : boolean
+            If True, run the work functions in the slaves under cProfile,
+            and collect the profiles into :py:attr:`profile` and
+            :py:attr:`profiles`. Nothing is collected if :py:meth:`map`
+            runs on the master (np=0 or debug mode).
+
         Attributes
         ----------
         np   : int
@@ -590,6 +2130,36 @@ class MapReduce(object):
         local.rank : int
             The rank of the current worker. (`omp_get_thread_num()`)
 
+        local.process_rank, local.thread_rank : int
+            With HybridBackend, the rank of the slave process and the rank
+            of the thread in the process. Otherwise process_rank is the rank,
+            and thread_rank is 0.
+
+        critical : Critical
+            The critical section and the lock stripes. After :py:meth:`map`,
+            print it for the acquisition counts and waits of the locks.
+
+        tracer : Tracer or None
+            The timeline of all :py:meth:`map` calls in the with block,
+            if trace is enabled.
+
+        stats : MapStats or None
+            The performance statistics of the last :py:meth:`map` call,
+            if it was called with stats=True.
+
+        progress : Progress
+            The live progress of the current (or the last) :py:meth:`map` call.
+
+        profile : pstats.Stats or None
+            With profile=True, the profile of all slaves in all
+            :py:meth:`map` calls in the with block.
+
+        profiles : dict
+            With profile=True, the profile of each rank, a pstats.Stats.
+
+        collectives : Collectives or None
+            The collective operations, during :py:meth:`spmd`.
+
         Notes
         -----
         Always wrap the call to :py:meth:`map` in a context manager ('with') block.
@@ -602,45 +2172,241 @@ class MapReduce(object):
         >>>         return i + pool.local.rank
         >>>     pool.map(work, range(10))
     """
-    def __init__(self, backend=ProcessBackend, np=None):
+    def __init__(self, backend=ProcessBackend, np=None, trace=False, stripes=16,
+            memory_limit=None, profile=False):
         self.backend = backend
         if np is None:
-            self.np = cpu_count()
+            self.np = getattr(backend, 'np', None) or cpu_count()
         else:
             self.np = np
-
-    def _main(self, pg, Q, R, sequence, realfunc):
+        self.trace = trace
+        self.stripes = stripes
+        self.memory_limit = memory_limit
+        self.profiling = profile
+        self.profile = None
+        self.profiles = {}
+        self.tracer = None
+
+    def _main(self, pg, Q, R, sequence, realfunc, stats, speculation, chunks):
         # get and put will raise SlaveException
         # and terminate the process.
         # the exception is muted in ProcessGroup,
         # as it will only be dispatched from master.
         self.local = pg._tls
-        while True:
-            capsule = pg.get(Q)
-            if capsule is None:
-                return
-            if len(capsule) == 1:
-                i, = capsule
-                work = sequence[i]
-            else:
-                i, work = capsule
-            self.ordered.move(i)
-            r = realfunc(work)
-            pg.put(R, (i, r))
+        rank = self.local.rank
+        self.critical.tls.rank = rank
+        self.ordered.tls.rank = rank
+        self.progress.tls.rank = rank
+        counts = self.progress._counts
+        tracer = self.tracer
+        busy, idle, ntasks = 0.0, 0.0, 0
+        if stats is not None:
+            f0 = _rusage()
+        if self.profiling:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            while True:
+                t0 = time.time()
+                if tracer is not None: tracer.begin(rank, 'get')
+                capsule = pg.get(Q)
+                if tracer is not None: tracer.end(rank, 'get')
+                if capsule is None:
+                    return
+                if capsule[0] is None:
+                    # (None, k, n): merge a share of the reductions
+                    if tracer is not None: tracer.begin(rank, 'reduce', capsule[1])
+                    self._merge(capsule[1], capsule[2])
+                    if tracer is not None: tracer.end(rank, 'reduce', capsule[1])
+                    pg.put(R, capsule)
+                    continue
+                if chunks is not None:
+                    t1 = self._chunk(pg, R, rank, capsule, sequence, realfunc, stats, chunks)
+                    if stats is not None:
+                        t2 = time.time()
+                        idle += t1 - t0
+                        busy += t2 - t1
+                        ntasks += capsule[1]
+                    continue
+                if len(capsule) == 1:
+                    i, = capsule
+                    work = sequence[i]
+                else:
+                    i, work = capsule
+                self.ordered.move(i)
+                if speculation is not None:
+                    attempt = speculation._begin(rank, i)
+                    if attempt is None:
+                        continue
+                if tracer is not None: tracer.begin(rank, 'task', i)
+                if stats is None:
+                    r = realfunc(work)
+                else:
+                    t1, c1, f1 = time.time(), _cputime(), _rusage()
+                    r = realfunc(work)
+                    t2, c2, f2 = time.time(), _cputime(), _rusage()
+                    stats._task(i, rank, t1, t2 - t1, c2 - c1,
+                            f2[2], f2[0] - f1[0], f2[1] - f1[1])
+                    idle += t1 - t0
+                    busy += t2 - t1
+                    ntasks += 1
+                if tracer is not None: tracer.end(rank, 'task', i)
+                counts[rank] += 1
+                if tracer is not None: tracer.begin(rank, 'put', i)
+                if speculation is None:
+                    pg.put(R, (i, r))
+                else:
+                    pg.put(R, (i, r, attempt))
+                    speculation._end(rank)
+                if tracer is not None: tracer.end(rank, 'put', i)
+        finally:
+            if stats is not None:
+                stats.workers['ntasks'][rank] = ntasks
+                stats.workers['busy'][rank] = busy
+                stats.workers['idle'][rank] = idle + time.time() - t0
+                f = _rusage()
+                stats.workers['minflt'][rank] = f[0] - f0[0]
+                stats.workers['majflt'][rank] = f[1] - f0[1]
+                stats.workers['maxrss'][rank], stats.workers['private_dirty'][rank] = _memory()
+            if self.profiling:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self._profiledir, 'rank-%d.prof' % rank))
+        self.local = None
+
+    def _chunk(self, pg, R, rank, capsule, sequence, realfunc, stats, chunks):
+        """ run a chunk of items on a slave; returns the starting time. """
+        tracer = self.tracer
+        # (start, n) or (start, n, works)
+        i, n = capsule[0], capsule[1]
+        if tracer is not None: tracer.begin(rank, 'task', i)
+        if stats is not None:
+            c1, f1 = _cputime(), _rusage()
+        t1 = time.time()
+        if chunks.slices:
+            r = realfunc(slice(i, i + n))
+        else:
+            r = []
+            for j in range(n):
+                if len(capsule) == 2:
+                    work = sequence[i + j]
+                else:
+                    work = capsule[2][j]
+                self.ordered.move(i + j)
+                r.append(realfunc(work))
+        t2 = time.time()
+        chunks._record(rank, n, t2 - t1)
+        if stats is not None:
+            c2, f2 = _cputime(), _rusage()
+            stats._chunk(i, n, rank, t1, t2 - t1, c2 - c1,
+                    f2[2], f2[0] - f1[0], f2[1] - f1[1])
+        if tracer is not None: tracer.end(rank, 'task', i)
+        self.progress._counts[rank] += n
+        if tracer is not None: tracer.begin(rank, 'put', i)
+        pg.put(R, (i, n, r))
+        if tracer is not None: tracer.end(rank, 'put', i)
+        return t1
+
+    def _spmdmain(self, pg, R, func):
+        self.local = pg._tls
+        rank = self.local.rank
+        self.critical.tls.rank = rank
+        self.collectives._start(rank)
+        tracer = self.tracer
+        if self.profiling:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            if tracer is not None: tracer.begin(rank, 'task', rank)
+            r = func(rank)
+            if tracer is not None: tracer.end(rank, 'task', rank)
+            pg.put(R, (rank, r))
+        finally:
+            if self.profiling:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self._profiledir, 'rank-%d.prof' % rank))
         self.local = None
 
     def __enter__(self):
-        self.critical = self.backend.LockFactory()
+        self.critical = Critical(self.backend, self.stripes)
         self.ordered = Ordered(self.backend)
+        self.progress = Progress(max(self.np, 1), self.backend)
+        self.stats = None
+        self.collectives = None
+        self._reductions = []
+        if self.trace:
+            self.tracer = Tracer(self.np)
+        else:
+            self.tracer = None
+        if self.profiling:
+            self._profiledir = tempfile.mkdtemp(prefix='sharedmem-profile-')
+            self.profile = None
+            self.profiles = {}
         self.local = None # will be set during _main
         return self
 
     def __exit__(self, *args):
         self.ordered = None
         self.local = None
+        if self.tracer is not None and not isinstance(self.trace, bool):
+            self.tracer.save(self.trace)
+        if self.profiling:
+            shutil.rmtree(self._profiledir, ignore_errors=True)
         pass
 
-    def map(self, func, sequence, reduce=None, star=False, minlength=0):
+    def lock(self, key):
+        """ The lock stripe of key; same as :code:`pool.critical[key]`.
+
+            Examples
+            --------
+
+            >>> with sharedmem.MapReduce() as pool:
+            >>>     def work(i):
+            >>>         with pool.lock('histogram'):
+            >>>             histogram[...] += numpy.bincount(data[i], minlength=10)
+            >>>         with pool.lock('total'):
+            >>>             total[...] += data[i].sum()
+            >>>     pool.map(work, range(len(data)))
+            >>> print(pool.critical)
+
+        """
+        return self.critical[key]
+
+    def reduction(self, shape, dtype='f8', op=numpy.add, initial=None):
+        """ A reduction with a private buffer on each rank, merged after map.
+
+            Accumulating into a shared array under :py:attr:`critical`
+            serializes the slaves; instead, each rank accumulates into its own
+            buffer, :code:`r.local`, and the slaves merge the buffers into
+            :code:`r.value` in parallel at the end of :py:meth:`map` and
+            :py:meth:`mapslices`. See :py:class:`ReductionBuffer`.
+
+            Returns
+            -------
+            r : ReductionBuffer
+
+            Examples
+            --------
+
+            >>> with sharedmem.MapReduce() as pool:
+            >>>     hist = pool.reduction(nbins, dtype='i8')
+            >>>     def work(i):
+            >>>         hist.local[...] += numpy.bincount(data[i], minlength=nbins)
+            >>>     pool.map(work, range(len(data)))
+            >>> print(hist.value)
+
+        """
+        r = ReductionBuffer(self, shape, dtype, op, initial)
+        self._reductions.append(r)
+        return r
+
+    def _merge(self, k=0, n=1):
+        """ merge the k-th of n shares of the elements of all reductions. """
+        for r in self._reductions:
+            r._merge(k, n)
+
+    def map(self, func, sequence, reduce=None, star=False, minlength=0, stats=False,
+            progress=None, interval=1.0, speculative=False, chunksize=None,
+            chunkkey=None):
         """ Map-reduce with multile processes.
 
             Apply func to each item on the sequence, in parallel. 
@@ -676,6 +2442,42 @@ class MapReduce(object):
                 if len(sequence) < minlength, fall back to sequential
                 processing. This can be used to avoid the overhead of starting
                 the worker processes when there is little work.
+
+            stats: boolean
+                If True, collect the performance statistics of the call
+                into :py:attr:`stats`, a :py:class:`MapStats` object.
+                The overhead is a few microseconds per item. With np=0
+                or in debug mode, the items run on the master as rank 0.
+
+            progress: callable, boolean or None
+                If callable, progress(pool.progress) is called every interval seconds
+                from a thread on the master, and once when map finishes.
+                If True, print :py:attr:`progress` to stderr every interval seconds.
+
+            interval: float
+                Seconds between the calls to progress.
+
+            speculative: boolean
+                If True, once all items have been started, run the straggling
+                items once more on idle slaves and use the first result;
+                see :py:class:`Speculation`. func must be idempotent, and
+                must not use :py:attr:`ordered`. A straggler still running
+                when the results are in is killed; if it was in a
+                :py:attr:`critical` section, the section is left half done,
+                and :py:attr:`critical` gets new locks for the next map.
+                The stats of a killed slave are rebuilt from its finished
+                items; it has no profile.
+
+            chunksize: int, 'auto' or None
+                Number of items sent to a slave at a time; None is one item.
+                Chunks reduce the overhead of dispatching short items.
+                With 'auto', the chunk sizes adapt such that a chunk runs
+                for 5 to 50 ms; see :py:class:`ChunkTuner`.
+
+            chunkkey: hashable or None
+                The key of the time per item remembered for the next call
+                with chunksize='auto'; None is func. Pass a key if func is
+                a new closure on each call.
                 
             Returns
             -------
@@ -690,6 +2492,357 @@ class MapReduce(object):
                 an exception. Inspect :py:attr:`SlaveException.reason` for the underlying exception.
         
         """ 
+        realfunc, realreduce = self._prepare(func, reduce, star)
+        self.stats = None
+
+        if progress is True:
+            progress = _printprogress
+
+        if len(sequence) <= 0 or self.np == 0 or get_debug():
+            # Do this in serial
+            return self._serial(realfunc, realreduce, sequence, stats,
+                    progress, interval)
+
+        if stats:
+            stats = MapStats(len(sequence), min([self.np, len(sequence)]))
+        else:
+            stats = None
+
+        if speculative:
+            if chunksize is not None:
+                raise ValueError("speculative does not support chunksize")
+            if len(self._reductions) > 0:
+                raise ValueError("speculative does not support reductions")
+            speculation = Speculation(len(sequence), min([self.np, len(sequence)]))
+        else:
+            speculation = None
+
+        if chunksize is not None:
+            chunks = ChunkTuner(len(sequence), min([self.np, len(sequence)]),
+                    chunksize, key=_funckey(func) if chunkkey is None else chunkkey)
+        else:
+            chunks = None
+
+        if len(self._reductions) > 0:
+            merging = threading.Event()
+        else:
+            merging = None
+
+        args = self._start(realfunc, sequence, stats, speculation, chunks, merging)
+        if progress:
+            stop = self.progress.watch(progress, interval)
+        try:
+            rt = self._collect(realreduce, len(sequence), *args, stats=stats,
+                    speculation=speculation, chunks=chunks, merging=merging)
+        finally:
+            if progress:
+                stop()
+        self.stats = stats
+        return rt
+
+    def _serial(self, realfunc, realreduce, sequence, stats, progress, interval):
+        """ map on the master, as rank 0; for np=0 and debugging.
+
+            The progress callback and the stats are as of a single slave.
+        """
+        self.local = lambda : None
+        self.local.rank = 0
+        self.local.process_rank = 0
+        self.local.thread_rank = 0
+        self.critical.reset()
+        self.critical.tls.rank = 0
+        self.ordered.tls.rank = 0
+        self.progress.start(len(sequence))
+        self.progress.tls.rank = 0
+
+        if stats:
+            stats = MapStats(len(sequence), 1)
+            stats.workers[...] = 0
+            self.critical.waits = stats.workers['critical']
+            self.ordered.waits = stats.workers['ordered']
+            f0 = _rusage()
+        else:
+            stats = None
+
+        if progress:
+            stop = self.progress.watch(progress, interval)
+        rt = []
+        try:
+            for i, work in enumerate(sequence):
+                if stats is None:
+                    rt.append(realreduce(realfunc(work)))
+                else:
+                    stats._queue(i)
+                    t1, c1, f1 = time.time(), _cputime(), _rusage()
+                    r = realfunc(work)
+                    t2, c2, f2 = time.time(), _cputime(), _rusage()
+                    stats._task(i, 0, t1, t2 - t1, c2 - c1,
+                            f2[2], f2[0] - f1[0], f2[1] - f1[1])
+                    stats.workers['busy'][0] += t2 - t1
+                    rt.append(realreduce(r))
+                    stats.reduce_time += time.time() - t2
+                self.progress.add()
+        finally:
+            if progress:
+                stop()
+            self.local = None
+            self.critical.waits = None
+            self.ordered.waits = None
+
+        if stats is not None:
+            stats.workers['ntasks'][0] = len(rt)
+            f = _rusage()
+            stats.workers['minflt'][0] = f[0] - f0[0]
+            stats.workers['majflt'][0] = f[1] - f0[1]
+            stats.workers['maxrss'][0], stats.workers['private_dirty'][0] = _memory()
+            stats._finish()
+        self._merge()
+        self.stats = stats
+        return rt
+
+    def mapslices(self, func, size, reduce=None, chunksize='auto', chunkkey=None):
+        """ Map-reduce over slices of range(size), e.g. of the elements of arrays.
+
+            func is called with a slice of range(size) and shall work
+            on the items in the slice. With chunksize='auto', the lengths
+            of the slices adapt such that a call runs for 5 to 50 ms;
+            see :py:class:`ChunkTuner`.
+
+            Parameters
+            ----------
+            func : callable
+                The function to call with a slice.
+            size : int
+                Number of items.
+            reduce : callable, optional
+                Apply a reduction operation on the return values of func.
+            chunksize : int or 'auto'
+                Length of the slices.
+            chunkkey : hashable or None
+                The key of the time per item remembered for the next call;
+                None is func. See :py:meth:`map`.
+
+            Returns
+            -------
+            results : list
+                The list of reduced results, one per slice, in the order
+                of the slices.
+
+            Examples
+            --------
+
+            >>> with sharedmem.MapReduce() as pool:
+            >>>     def work(sl):
+            >>>         out[sl] = numpy.sin(x[sl])
+            >>>     pool.mapslices(work, len(x))
+
+        """
+        realfunc, realreduce = self._prepare(func, reduce, False)
+        self.stats = None
+
+        if size <= 0 or self.np == 0 or get_debug():
+            # Do this in serial
+            self.local = lambda : None
+            self.local.rank = 0
+            self.local.process_rank = 0
+            self.local.thread_rank = 0
+            if chunksize == 'auto':
+                chunksize = max(size, 1)
+            rt = [realreduce(realfunc(slice(i, i + chunksize)))
+                    for i in range(0, size, chunksize)]
+            self.local = None
+            self._merge()
+            return rt
+
+        chunks = ChunkTuner(size, min([self.np, size]), chunksize,
+                key=_funckey(func) if chunkkey is None else chunkkey,
+                slices=True)
+        if len(self._reductions) > 0:
+            merging = threading.Event()
+        else:
+            merging = None
+        return self._collect(realreduce, size,
+                *self._start(realfunc, range(size), chunks=chunks, merging=merging),
+                chunks=chunks, merging=merging)
+
+    def spmd(self, func, buffersize=2**24):
+        """ Run func once on each rank, in parallel (single program, multiple data).
+
+            func is called with the rank, and may communicate with the other
+            ranks with :py:meth:`barrier`, :py:meth:`bcast`,
+            :py:meth:`allreduce` and :py:meth:`allgather`. All ranks shall
+            call the same collectives in the same order. Unlike calling
+            :py:meth:`map` once per step, the slaves are forked once and
+            keep their state across the steps of e.g. an iterative solver.
+
+            Parameters
+            ----------
+            func : callable
+                The function to call with the rank.
+            buffersize : int
+                The size of the largest message of the collectives, in bytes;
+                see :py:class:`Collectives`.
+
+            Returns
+            -------
+            results : list
+                The return values of func, in the order of the ranks.
+
+            Raises
+            ------
+            SlaveException
+                If any of the ranks encounters an exception; the other ranks
+                are stopped, even if they are waiting in a collective.
+
+            Examples
+            --------
+
+            >>> with sharedmem.MapReduce() as pool:
+            >>>     def work(rank):
+            >>>         x = pool.bcast(x0)
+            >>>         for step in range(100):
+            >>>             local = residual(x, rank, pool.np)
+            >>>             r = pool.allreduce(local)
+            >>>             x = update(x, r)
+            >>>         return x
+            >>>     x = pool.spmd(work)[0]
+
+        """
+        if self.np == 0 or get_debug():
+            # Do this in serial
+            self.local = lambda : None
+            self.local.rank = 0
+            self.local.process_rank = 0
+            self.local.thread_rank = 0
+            self.collectives = Collectives(ThreadBackend, 1, buffersize)
+            self.collectives._start(0)
+            self.critical.reset()
+            try:
+                return [func(0)]
+            finally:
+                self.collectives = None
+                self.local = None
+
+        np = self.np
+        R = self.backend.QueueFactory(np)
+        self.critical.reset()
+        self.collectives = Collectives(self.backend, np, buffersize)
+        tracer = self.tracer
+        self.critical.tracer = tracer
+        self.collectives.tracer = tracer
+
+        pg = ProcessGroup(main=self._spmdmain, np=np,
+                backend=self.backend,
+                args=(R, func),
+                memory_limit=self.memory_limit)
+        self.collectives.pg = pg
+
+        if tracer is not None: tracer.begin(Tracer.MASTER, 'fork')
+        pg.start()
+        if tracer is not None: tracer.end(Tracer.MASTER, 'fork')
+
+        rt = [None] * np
+        try:
+            for i in range(np):
+                try:
+                    rank, r = pg.get(R)
+                except StopProcessGroup:
+                    raise pg.get_exception()
+                rt[rank] = r
+            if tracer is not None: tracer.begin(Tracer.MASTER, 'join')
+            pg.join()
+            if tracer is not None: tracer.end(Tracer.MASTER, 'join')
+            return rt
+        except BaseException as e:
+            self.collectives.abort()
+            pg.killall()
+            pg.join()
+            raise
+        finally:
+            self.critical.tracer = None
+            self.collectives = None
+            if self.profiling:
+                self.profile = _loadprofiles(self._profiledir, self.profiles,
+                        self.profile)
+
+    def barrier(self):
+        """ Wait until all ranks of :py:meth:`spmd` reach the barrier. """
+        self.collectives.barrier()
+
+    def bcast(self, obj, root=0):
+        """ Broadcast obj from the root rank of :py:meth:`spmd`.
+
+            obj is pickled; it can be an array or any other picklable object.
+
+            Returns
+            -------
+            obj : object
+                obj of the root rank, on all ranks.
+        """
+        return self.collectives.bcast(obj, root)
+
+    def allreduce(self, array, op=numpy.add):
+        """ Reduce the arrays of all ranks of :py:meth:`spmd` with a ufunc.
+
+            The arrays shall be of the same shape and dtype on all ranks.
+            The elements are reduced in the order of the ranks, thus all
+            ranks obtain the same result, even for floating point numbers.
+
+            Returns
+            -------
+            result : array_like
+                op.reduce of the arrays, on all ranks.
+        """
+        return self.collectives.allreduce(array, op)
+
+    def allgather(self, array):
+        """ Gather the arrays of all ranks of :py:meth:`spmd`.
+
+            The arrays shall be of the same shape and dtype on all ranks.
+
+            Returns
+            -------
+            result : array_like
+                the arrays stacked in the order of the ranks, on all ranks.
+        """
+        return self.collectives.allgather(array)
+
+    def amap(self, func, sequence, reduce=None, star=False):
+        """ Awaitable version of :py:meth:`map`, for asyncio.
+
+            The event loop keeps running while the slaves work.
+            See :py:mod:`sharedmem.aio`.
+
+            Examples
+            --------
+
+            >>> r = await pool.amap(work, range(10))
+
+        """
+        from .aio import amap
+        return amap(self, func, sequence, reduce=reduce, star=star)
+
+    def aimap(self, func, sequence, reduce=None, star=False):
+        """ Asynchronous iterator version of :py:meth:`map`, for asyncio.
+
+            The reduced results are yielded in the order of sequence,
+            as soon as they are available.
+            See :py:mod:`sharedmem.aio`.
+
+            Examples
+            --------
+
+            >>> async for r in pool.aimap(work, range(10)):
+            >>>     print(r)
+
+        """
+        from .aio import aimap
+        return aimap(self, func, sequence, reduce=reduce, star=star)
+
+    def _prepare(self, func, reduce, star):
+        """ returns the function applied to items and the reduction
+            applied to the return values.
+        """
         def realreduce(r):
             if reduce:
                 if isinstance(r, tuple):
@@ -702,84 +2855,233 @@ class MapReduce(object):
             if star: return func(*i)
             else: return func(i)
 
-        if len(sequence) <= 0 or self.np == 0 or get_debug():
-            # Do this in serial
-            self.local = lambda : None
-            self.local.rank = 0
+        return realfunc, realreduce
 
-            rt = [realreduce(realfunc(i)) for i in sequence]
+    def _start(self, realfunc, sequence, stats=None, speculation=None, chunks=None,
+            merging=None):
+        """ fork the slaves and start feeding the sequence to them.
 
-            self.local = None
-            return rt
+            Returns the process group, the result queue, the list
+            that receives the number of items fed, and the feeder thread.
+
+            With speculation, the master sends the sentinels
+            to the slaves; see :py:meth:`Speculation._stop`.
+
+            With chunks, the items are fed in chunks; sequence is only
+            used for its length if chunks.slices.
 
+            With merging, once _collect sets the event, each slave
+            is sent a share of the reductions to merge, before the sentinels.
+        """
         # never use more than len(sequence) processes
         np = min([self.np, len(sequence)])
 
-        Q = self.backend.QueueFactory(64)
+        if chunks is None:
+            Q = self.backend.QueueFactory(64)
+        else:
+            # a short queue, such that the sizes of the chunks
+            # follow the measurements closely.
+            Q = self.backend.QueueFactory(2 * np)
         R = self.backend.QueueFactory(64)
         self.ordered.reset()
+        self.critical.reset()
+        self.progress.start(len(sequence))
+        if stats is not None:
+            self.critical.waits = stats.workers['critical']
+            self.ordered.waits = stats.workers['ordered']
+        tracer = self.tracer
+        self.critical.tracer = tracer
+        self.ordered.tracer = tracer
 
         pg = ProcessGroup(main=self._main, np=np,
                 backend=self.backend,
-                args=(Q, R, sequence, realfunc))
-
+                args=(Q, R, sequence, realfunc, stats, speculation, chunks),
+                memory_limit=self.memory_limit, sample=stats is not None)
+        if speculation is not None:
+            speculation.Q = Q
+            if not hasattr(sequence, '__getitem__'):
+                speculation.works = []
+
+        if tracer is not None: tracer.begin(Tracer.MASTER, 'fork')
         pg.start()
+        if tracer is not None: tracer.end(Tracer.MASTER, 'fork')
 
-        L = []
         N = []
+        def feeditems():
+            j = 0
+            for i, work in enumerate(sequence):
+                if stats is not None:
+                    stats._queue(i)
+                if tracer is not None: tracer.begin(Tracer.FEEDER, 'put', i)
+                if not hasattr(sequence, '__getitem__'):
+                    if speculation is not None:
+                        speculation.works.append(work)
+                    pg.put(Q, (i, work))
+                else:
+                    pg.put(Q, (i, ))
+                if tracer is not None: tracer.end(Tracer.FEEDER, 'put', i)
+                j = j + 1
+            return j
+
+        def feedchunks():
+            if not chunks.slices and not hasattr(sequence, '__getitem__'):
+                works = iter(sequence)
+            else:
+                works = None
+            j = 0
+            while j < len(sequence):
+                n = chunks.next(j)
+                if stats is not None:
+                    stats._queue(slice(j, j + n))
+                if tracer is not None: tracer.begin(Tracer.FEEDER, 'put', j)
+                if works is None:
+                    pg.put(Q, (j, n))
+                else:
+                    pg.put(Q, (j, n, [next(works) for k in range(n)]))
+                if tracer is not None: tracer.end(Tracer.FEEDER, 'put', j)
+                j = j + n
+            return j
+
         def feeder(pg, Q, N):
             #   will fail silently if any error occurs.
-            j = 0
             try:
-                for i, work in enumerate(sequence):
-                    if not hasattr(sequence, '__getitem__'):
-                        pg.put(Q, (i, work))
-                    else:
-                        pg.put(Q, (i, ))
-                    j = j + 1
-                N.append(j)
-
-                for i in range(np):
-                    pg.put(Q, None)
+                if chunks is None:
+                    N.append(feeditems())
+                else:
+                    N.append(feedchunks())
+
+                if merging is not None:
+                    # wait for all results; the slaves are waiting for more work.
+                    while not merging.wait(timeout=1):
+                        if not pg.is_alive():
+                            return
+                    for k in range(np):
+                        pg.put(Q, (None, k, np))
+
+                if speculation is None:
+                    for i in range(np):
+                        pg.put(Q, None)
             except StopProcessGroup:
                 return
             finally:
                 pass
         feeder = threading.Thread(None, feeder, args=(pg, Q, N))
+        # for _abort
+        feeder.Q = Q
         feeder.start() 
+        return pg, R, N, feeder
+
+    def _abort(self, pg, feeder):
+        """ kill the slaves started by _start and join the feeder; blocking. """
+        pg.killall()
+        pg.join()
+        # wake up the feeder if it waits for room in the work queue;
+        # it stops at the next put, since the slaves are dead.
+        try:
+            while True:
+                feeder.Q.get_nowait()
+        except queue.Empty:
+            pass
+        feeder.join()
 
+    def _collect(self, realreduce, size, pg, R, N, feeder, stats=None, speculation=None,
+            chunks=None, merging=None):
+        """ collect the size results from the slaves started by _start;
+            blocking.
+
+            With merging, the slaves merge the reductions after the last result.
+
+            With chunks, returns a result per item, or
+            a result per chunk if chunks.slices.
+        """
+        if speculation is None:
+            timeout = None
+        else:
+            timeout = 0.1
+        L = []
+        tracer = self.tracer
         # we run fetcher on main thread to catch exceptions
         # raised by reduce 
         count = 0
         try:
-            while True:
+            # do not wait for N; the feeder may not have
+            # finished appending to it when the last result arrives.
+            while count < size:
                 try:
-                    capsule = pg.get(R)
+                    capsule = pg.get(R, timeout=timeout)
                 except queue.Empty:
+                    if speculation is not None and len(N) > 0:
+                        speculation._speculate(pg)
                     continue
                 except StopProcessGroup:
                     raise pg.get_exception()
-                capsule = capsule[0], realreduce(capsule[1])
+                if speculation is not None:
+                    if not speculation._finish(capsule[0], capsule[2]):
+                        continue
+                if tracer is not None: tracer.begin(Tracer.MASTER, 'reduce', capsule[0])
+                if stats is not None:
+                    t0 = time.time()
+                if chunks is None:
+                    n = 1
+                    capsule = capsule[0], realreduce(capsule[1])
+                elif chunks.slices:
+                    n = capsule[1]
+                    capsule = capsule[0], realreduce(capsule[2])
+                else:
+                    n = capsule[1]
+                    capsule = capsule[0], [realreduce(r) for r in capsule[2]]
+                if stats is not None:
+                    stats.reduce_time += time.time() - t0
+                if tracer is not None: tracer.end(Tracer.MASTER, 'reduce', capsule[0])
                 heapq.heappush(L, capsule)
-                count = count + 1
-                if len(N) > 0 and count == N[0]: 
-                    # if finished feeding see if all
-                    # results have been obtained
-                    break
+                count = count + n
+            if merging is not None:
+                merging.set()
+                if tracer is not None: tracer.begin(Tracer.MASTER, 'reduce')
+                for k in range(min([self.np, size])):
+                    try:
+                        pg.get(R)
+                    except StopProcessGroup:
+                        raise pg.get_exception()
+                if tracer is not None: tracer.end(Tracer.MASTER, 'reduce')
             rt = []
 #            R.close()
 #            R.join_thread()
             while len(L) > 0:
-                rt.append(heapq.heappop(L)[1])
+                if chunks is None or chunks.slices:
+                    rt.append(heapq.heappop(L)[1])
+                else:
+                    rt.extend(heapq.heappop(L)[1])
+            if speculation is not None:
+                speculation._stop(pg)
+            if tracer is not None: tracer.begin(Tracer.MASTER, 'join')
             pg.join()
+            if tracer is not None: tracer.end(Tracer.MASTER, 'join')
+            if speculation is not None and len(speculation.killed) > 0:
+                self.critical = self.critical.renew()
             feeder.join()
-            assert N[0] == len(rt)
+            assert N[0] == count
             return rt
         except BaseException as e:
-            pg.killall()
-            pg.join()
-            feeder.join()
+            self._abort(pg, feeder)
             raise 
+        finally:
+            self.critical.waits = None
+            self.ordered.waits = None
+            self.critical.tracer = None
+            self.ordered.tracer = None
+            if chunks is not None:
+                chunks._finish()
+            if self.profiling:
+                self.profile = _loadprofiles(self._profiledir, self.profiles,
+                        self.profile)
+            if stats is not None:
+                if speculation is not None:
+                    stats.speculated = speculation.speculated
+                    stats.speculative_wins = speculation.wins
+                    for rank in speculation.killed:
+                        stats._killed(rank)
+                stats._finish()
 
 
 def empty_like(array, dtype=None):
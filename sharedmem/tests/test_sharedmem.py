@@ -3,7 +3,7 @@ import sharedmem
 import time
 
 from numpy.testing import (assert_equal, assert_array_equal,
-    assert_almost_equal, assert_array_almost_equal, assert_, run_module_suite)
+    assert_almost_equal, assert_array_almost_equal, assert_, assert_raises, run_module_suite)
 import sys
 
 def test_create():
@@ -50,6 +50,35 @@ def test_parallel_thread():
     pool = sharedmem.MapReduceByThread(np=4) 
     assert run_idle(pool) < 3.0
 
+def test_teardown():
+    # slaves exit one after another; waiting for the exit token
+    # shall not burn the cpu.
+    with sharedmem.MapReduce(np=64) as pool:
+        def work(i):
+            return i
+        now = time.time()
+        pool.map(work, range(pool.np))
+        assert time.time() - now < 5.0
+
+def test_hybrid():
+    import os
+    t = sharedmem.empty((), dtype='i8')
+    t[...] = 0
+    backend = sharedmem.HybridBackend(processes=2, threads=2)
+    with sharedmem.MapReduce(backend=backend) as pool:
+        assert pool.np == 4
+        def work(i):
+            time.sleep(0.01)
+            with pool.critical:
+                t[...] += 1
+            return (pool.local.rank, pool.local.process_rank,
+                    pool.local.thread_rank, os.getpid())
+        r = pool.map(work, range(40))
+    assert_equal(t, 40)
+    ranks = set([rank[:3] for rank in r])
+    assert_equal(sorted(ranks), [(0, 0, 0), (1, 0, 1), (2, 1, 0), (3, 1, 1)])
+    assert len(set([rank[3] for rank in r])) == 2
+
 from sharedmem import background
 
 
@@ -76,6 +105,112 @@ def test_background_raise():
 
     raise AssertionError("Shall not reach here")
 
+def test_executor():
+    with sharedmem.Executor(np=2) as executor:
+        def work(i):
+            return i * 2
+        f = executor.submit(work, 10)
+        assert f.result() == 20
+        assert_equal(list(executor.map(work, range(10))), list(range(0, 20, 2)))
+
+        # a function defined after the slaves are forked
+        def work2(i):
+            return -i
+        assert_equal(list(executor.map(work2, range(10))), list(range(0, -10, -1)))
+
+def test_executor_registry():
+    class A(object):
+        def work(self, i):
+            return i + 1
+    a = A()
+    with sharedmem.Executor(np=2) as executor:
+        assert executor.submit(a.work, 1).result() == 2
+        pg = executor._pg
+        # a.work evaluates to a new bound method each time; no new fork.
+        assert_equal([executor.submit(a.work, i).result() for i in range(4)],
+                [1, 2, 3, 4])
+        assert executor._pg is pg
+
+    with sharedmem.Executor(np=2) as executor:
+        executor.MAXFUNCTIONS = 4
+        def closure(j):
+            def work(i):
+                return i * j
+            return work
+        fs = [executor.submit(closure(j), 2) for j in range(10)]
+        assert_equal([f.result() for f in fs], list(range(0, 20, 2)))
+        assert len(executor._functions) <= 4
+        assert len(executor._funcids) <= 4
+
+def test_executor_raise():
+    with sharedmem.Executor(np=2) as executor:
+        def work():
+            raise PicklableException("Raise an exception")
+        f = executor.submit(work)
+        try:
+            f.result()
+        except sharedmem.SlaveException as e:
+            assert isinstance(e.reason, PicklableException)
+            return
+    raise AssertionError("Shall not reach here")
+
+def test_executor_cancel():
+    with sharedmem.Executor(np=1) as executor:
+        def work():
+            time.sleep(0.1)
+        fs = [executor.submit(work) for i in range(10)]
+        assert fs[-1].cancel()
+        assert fs[-1].cancelled()
+        fs[-2].result()
+    assert not any(f.cancelled() for f in fs[:-1])
+
+def test_amap():
+    if sys.version_info < (3, 6): return
+    import asyncio
+    loop = asyncio.new_event_loop()
+    with sharedmem.MapReduce(np=2) as pool:
+        def work(i):
+            return i * 2
+        r = loop.run_until_complete(pool.amap(work, range(10)))
+        assert_equal(r, list(range(0, 20, 2)))
+
+        def work(i):
+            if i == 5:
+                raise PicklableException("Raise an exception")
+        try:
+            loop.run_until_complete(pool.amap(work, range(10)))
+        except sharedmem.SlaveException as e:
+            assert isinstance(e.reason, PicklableException)
+        else:
+            raise AssertionError("Shall not reach here")
+
+        # the feeder waits for room in the full work queue when amap
+        # is cancelled; the loop keeps running during the teardown.
+        def work(i):
+            time.sleep(0.01)
+        ticks = []
+        async def ticker():
+            while True:
+                ticks.append(time.time())
+                await asyncio.sleep(0.01)
+        async def cancelled():
+            t = loop.create_task(ticker())
+            try:
+                await asyncio.wait_for(pool.amap(work, range(10000)), 0.2)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                raise AssertionError("Shall not reach here")
+            await asyncio.sleep(0.05)
+            t.cancel()
+        loop.run_until_complete(cancelled())
+        assert numpy.diff(ticks).max() < 0.5
+
+    def function():
+        return True
+    assert loop.run_until_complete(sharedmem.abackground(function))
+    loop.close()
+
 def test_killed():
     import os
     import signal
@@ -92,6 +227,27 @@ def test_killed():
 
     raise AssertionError("Shall not reach here")
 
+def test_exit_token():
+    import os
+    import signal
+    from sharedmem.sharedmem import ProcessGroup, ProcessBackend
+
+    def main(pg):
+        if pg._tls.rank == 0:
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    pg = ProcessGroup(ProcessBackend, main, np=4)
+    pg.start()
+    try:
+        pg.join()
+    except sharedmem.SlaveException:
+        pass
+    # the killed slave never took the token; the others may also be
+    # killed by killall before taking it. No token is passed on twice.
+    assert_equal(pg.tokens[0], 0)
+    assert pg.ExitToken.acquire(False)
+    assert not pg.ExitToken.acquire(False)
+
 class UnpicklableException(Exception):
     def __reduce__(self):
         raise Exception("This pickle is not supposed to be pickled")
@@ -217,6 +373,530 @@ def test_critical():
             return 
     raise AssertionError("Shall not reach here.")
 
+def test_stats():
+    with sharedmem.MapReduce(np=4) as pool:
+        def work(i):
+            with pool.critical:
+                time.sleep(0.01)
+            return i
+        pool.map(work, range(16), stats=True)
+        stats = pool.stats
+        assert_equal(len(stats.tasks), 16)
+        assert_equal(len(stats.workers), 4)
+        assert_equal(stats.workers['ntasks'].sum(), 16)
+        assert (stats.tasks['rank'] >= 0).all()
+        assert (stats.tasks['wall'] >= 0.01).all()
+        # someone must have waited for the lock
+        assert stats.workers['critical'].sum() > 0
+        assert stats.wall_time > 0
+        assert 'imbalance' in str(stats)
+        assert (stats.tasks['maxrss'] > 0).all()
+        assert (stats.workers['maxrss'] > 0).all()
+        assert (stats.workers['minflt'] >= stats.tasks['minflt'].min()).all()
+
+        pool.map(work, range(4))
+        assert pool.stats is None
+
+def test_serial_stats():
+    calls = []
+    with sharedmem.MapReduce(np=0) as pool:
+        def work(i):
+            with pool.critical:
+                time.sleep(0.001)
+            return i
+        r = pool.map(work, range(16), stats=True, progress=lambda p: calls.append(p.done))
+        assert_equal(r, list(range(16)))
+        stats = pool.stats
+        assert_equal(len(stats.workers), 1)
+        assert_equal(stats.workers['ntasks'], 16)
+        assert (stats.tasks['rank'] == 0).all()
+        assert (stats.tasks['wall'] >= 0.001).all()
+        assert stats.wall_time > 0
+        assert 'imbalance' in str(stats)
+        # called at least once, when map finishes
+        assert_equal(calls[-1], 16)
+
+        pool.map(work, range(4))
+        assert pool.stats is None
+
+def test_striped():
+    counters = sharedmem.empty(4, dtype='i8')
+    counters[...] = 0
+    with sharedmem.MapReduce(np=4, stripes=4) as pool:
+        def work(i):
+            for j in range(4):
+                with pool.critical[j]:
+                    counters[j] += 1
+            with pool.lock('total'):
+                pass
+            with pool.critical:
+                pass
+        pool.map(work, range(100))
+        assert_array_equal(counters, 100)
+        critical = pool.critical
+        assert_equal(critical.count[0], 100)
+        assert_equal(critical.count.sum(), 600)
+        assert_equal(critical.count[critical.index('total')] % 100, 0)
+        assert_array_equal(critical.histogram.sum(axis=-1), critical.count)
+        assert 'stripe' in str(critical)
+
+        pool.map(work, range(10))
+        assert_equal(critical.count.sum(), 60)
+
+def test_critical_nonblocking():
+    # one slave, such that no one else holds the lock
+    with sharedmem.MapReduce(np=1) as pool:
+        def work(i):
+            with pool.critical:
+                # held by us; a non-blocking acquire fails
+                r1 = pool.critical.acquire(False)
+                r2 = pool.critical.acquire(timeout=0.01)
+            assert pool.critical.acquire(False)
+            pool.critical.release()
+            assert pool.critical[i].acquire(False)
+            pool.critical[i].release()
+            return r1, r2
+        r = pool.map(work, range(4))
+        assert_equal(r, [(False, False)] * 4)
+        # only the successful acquisitions are counted
+        assert_equal(pool.critical.count[0], 8)
+        assert_equal(pool.critical.count.sum(), 12)
+
+def test_chunksize():
+    with sharedmem.MapReduce(np=4) as pool:
+        def work(i):
+            return i * 2
+        def reduce(r):
+            return r + 1
+        for chunksize in [1, 7, 'auto']:
+            r = pool.map(work, range(1000), reduce=reduce, chunksize=chunksize,
+                    stats=True)
+            assert_equal(r, [i * 2 + 1 for i in range(1000)])
+            assert (pool.stats.tasks['rank'] >= 0).all()
+        assert sharedmem.sharedmem._funckey(work) in sharedmem.ChunkTuner.cache
+
+        def work(sl):
+            return sl.start, sl.stop
+        r = pool.mapslices(work, 1000)
+        assert_equal(r[0][0], 0)
+        assert_equal(r[-1][1], 1000)
+        for a, b in zip(r[:-1], r[1:]):
+            assert_equal(a[1], b[0])
+        r = pool.mapslices(work, 1000, chunksize=300)
+        assert_equal(r, [(0, 300), (300, 600), (600, 900), (900, 1000)])
+
+def test_chunktuner():
+    chunks = sharedmem.ChunkTuner(10000, 2)
+    assert_equal([chunks.next(0) for i in range(4)], [1, 2, 4, 8])
+    # 1 ms per item; 16 ms per chunk
+    chunks._record(0, 10, 0.01)
+    assert_equal(chunks.next(0), 15)
+    # no more than a quarter of the remaining items
+    chunks._record(0, 10, 0.0001)
+    assert_equal(chunks.next(6000), 1000)
+    # but no less than 5 ms, if there are enough items left
+    assert_equal(chunks.next(9900), 100)
+
+def test_chunktuner_cache():
+    from sharedmem.sharedmem import _funckey
+    def closure(x):
+        def work(i):
+            return x
+        return work
+    # closures of the same def are timed apart
+    assert _funckey(closure(1)) != _funckey(closure(2))
+    f = closure(1)
+    assert_equal(_funckey(f), _funckey(f))
+
+    class A(object):
+        def work(self, i):
+            return i
+    a = A()
+    assert_equal(_funckey(a.work), _funckey(a.work))
+    assert _funckey(a.work) != _funckey(A().work)
+
+    cache = sharedmem.ChunkTuner.cache
+    for i in range(sharedmem.ChunkTuner.CACHESIZE + 10):
+        chunks = sharedmem.ChunkTuner(100, 2, key=('test', i))
+        chunks._record(0, 10, 0.01)
+        chunks._finish()
+    assert len(cache) <= sharedmem.ChunkTuner.CACHESIZE
+    assert ('test', 0) not in cache
+    assert_almost_equal(cache[('test', i)], 0.001)
+
+def test_memory_limit():
+    with sharedmem.MapReduce(np=2, memory_limit=64 * 1024 ** 2) as pool:
+        def work(i):
+            a = numpy.ones(128 * 1024 ** 2 // 8)
+            time.sleep(2)
+        try:
+            pool.map(work, range(4))
+            raise AssertionError("MemoryError not raised")
+        except sharedmem.SlaveException as e:
+            assert isinstance(e.reason, MemoryError)
+
+    backend = sharedmem.HybridBackend(processes=2, threads=2)
+    with sharedmem.MapReduce(backend=backend,
+            memory_limit=64 * 1024 ** 2) as pool:
+        def work(i):
+            # the other thread of the slave keeps posting errors
+            if pool.local.thread_rank == 0:
+                a = numpy.ones(128 * 1024 ** 2 // 8)
+                time.sleep(2)
+            else:
+                raise ValueError("an error while the memory is sampled")
+        try:
+            pool.map(work, range(4))
+            raise AssertionError("no error raised")
+        except sharedmem.SlaveException as e:
+            assert isinstance(e.reason, (MemoryError, ValueError))
+
+def test_memory_sampling():
+    from sharedmem.sharedmem import ProcessGroup, ProcessBackend
+
+    def main(pg):
+        time.sleep(3 * pg.MEMORY_INTERVAL)
+
+    pg = ProcessGroup(ProcessBackend, main, np=2)
+    pg.start()
+    pg.join()
+    # no thread samples the memory unless asked to
+    assert_equal(pg.rss, 0)
+
+    pg = ProcessGroup(ProcessBackend, main, np=2, sample=True)
+    pg.start()
+    pg.join()
+    assert (pg.rss > 0).all()
+
+def test_speculative():
+    first = sharedmem.empty(1, dtype='i8')
+    first[...] = 0
+    with sharedmem.MapReduce(np=4) as pool:
+        def work(i):
+            if i == 3 and first[0] == 0:
+                # only the first run of item 3 straggles
+                first[0] = 1
+                time.sleep(30)
+            time.sleep(0.01)
+            return i
+        t0 = time.time()
+        r = pool.map(work, range(40), speculative=True, stats=True)
+        assert time.time() - t0 < 20
+        assert_equal(r, list(range(40)))
+        assert_equal(pool.stats.speculated, 1)
+        assert_equal(pool.stats.speculative_wins, 1)
+        assert 'speculated' in str(pool.stats)
+        assert_equal(pool.stats.workers['ntasks'].sum(), 40)
+
+        # the straggler is killed in a critical section
+        first[0] = 0
+        def work(i):
+            if i == 3 and first[0] == 0:
+                first[0] = 1
+                with pool.critical:
+                    time.sleep(30)
+            time.sleep(0.01)
+            return i
+        t0 = time.time()
+        r = pool.map(work, range(40), speculative=True)
+        assert time.time() - t0 < 20
+        assert_equal(r, list(range(40)))
+        # no deadlock in the next map
+        critical = pool.critical
+        def work(i):
+            with pool.critical:
+                return i
+        assert_equal(pool.map(work, range(10)), list(range(10)))
+        assert critical is pool.critical
+
+def test_progress():
+    seen = []
+    with sharedmem.MapReduce(np=4) as pool:
+        def work(i):
+            time.sleep(0.001)
+            return i
+        pool.map(work, range(100),
+                progress=lambda progress: seen.append(progress.done),
+                interval=0.01)
+        assert_equal(seen[-1], 100)
+        assert_equal(pool.progress.total, 100)
+        assert_equal(pool.progress.counts.sum(), 100)
+        assert '100 / 100' in str(pool.progress)
+
+def _profiled(i):
+    return i * 2
+
+def test_profile():
+    with sharedmem.MapReduce(np=2, profile=True) as pool:
+        def work(i):
+            return _profiled(i)
+        pool.map(work, range(10))
+        pool.map(work, range(10))
+    assert_equal(sorted(pool.profiles), [0, 1])
+    calls = [key for key in pool.profile.stats if key[2] == '_profiled']
+    assert_equal(len(calls), 1)
+    # primitive calls of _profiled
+    assert_equal(pool.profile.stats[calls[0]][0], 20)
+
+def test_trace():
+    import json
+    import tempfile
+    import os
+    fd, filename = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        with sharedmem.MapReduce(np=2, trace=filename) as pool:
+            def work(i):
+                with pool.critical:
+                    pass
+                return i
+            pool.map(work, range(10))
+        tracer = pool.tracer
+        assert_equal(tracer.dropped, 0)
+        events = [e for e in tracer.events() if e['ph'] == 'B']
+        names = [e['name'] for e in events]
+        assert_equal(names.count('task'), 10)
+        assert_equal(names.count('critical'), 10)
+        assert_equal(names.count('fork'), 1)
+        assert_equal(names.count('join'), 1)
+        items = sorted(e['args']['item'] for e in events if e['name'] == 'task')
+        assert_equal(items, list(range(10)))
+        with open(filename) as f:
+            saved = json.load(f)
+        assert_equal(len(saved['traceEvents']), len(tracer.events()))
+    finally:
+        os.unlink(filename)
+
+def _atomic(lockfree):
+    from sharedmem import atomic
+    lib = atomic._lib
+    if not lockfree:
+        atomic._lib = None
+    try:
+        a = sharedmem.AtomicInt64Array(4)
+    finally:
+        atomic._lib = lib
+    with sharedmem.MapReduce(np=4) as pool:
+        def work(i):
+            a.fetch_add(0)
+            a.min(1, -i)
+            a.max(2, i)
+            a.add_at([3, 3], [i, 1])
+        pool.map(work, range(100))
+    assert_array_equal(a, [100, -99, 99, 4950 + 100])
+
+    assert_equal(a.fetch_add(0, 5), 100)
+    assert_equal(a.load(0), 105)
+    assert_equal(a.compare_exchange(0, 0, 7), 105)
+    assert_equal(a.compare_exchange(0, 105, 7), 105)
+    assert_equal(a.load(0), 7)
+    assert_equal(a.min(1, 0), -99)
+    assert_equal(a.max(2, 0), 99)
+    a.store(-1, 3)
+    assert_equal(a[3], 3)
+    assert_raises(IndexError, a.fetch_add, 4)
+    assert_raises(IndexError, a.add_at, [0, 4])
+    return a
+
+def test_atomic():
+    from sharedmem import atomic
+    if atomic._lib is not None:
+        assert _atomic(True).lockfree
+    assert not _atomic(False).lockfree
+
+def test_rwlock():
+    table = sharedmem.empty(2, dtype='i8')
+    table[...] = 0
+    rwlock = sharedmem.RWLock()
+    seqlock = sharedmem.SeqLock(2, dtype='i8')
+    for MapReduce in [sharedmem.MapReduce, sharedmem.MapReduceByThread]:
+        with MapReduce(np=4) as pool:
+            def work(i):
+                if i % 4 == 0:
+                    with rwlock.write:
+                        table[0] += 1
+                        time.sleep(0.001)
+                        table[1] -= 1
+                    with seqlock as data:
+                        data[0] += 1
+                        time.sleep(0.001)
+                        data[1] -= 1
+                else:
+                    with rwlock.read:
+                        assert_equal(table.sum(), 0)
+                    assert_equal(seqlock.read().sum(), 0)
+            pool.map(work, range(100))
+    assert_array_equal(table, [50, -50])
+    assert_array_equal(seqlock.read(), [50, -50])
+    seqlock.write([1, 2])
+    assert_array_equal(seqlock.data, [1, 2])
+
+def test_spmd():
+    for MapReduce in [sharedmem.MapReduce, sharedmem.MapReduceByThread]:
+        with MapReduce(np=4) as pool:
+            def work(rank):
+                config = pool.bcast({'n': 10} if rank == 0 else None)
+                x = numpy.zeros(config['n'])
+                for step in range(10):
+                    x = x + pool.allreduce(numpy.arange(config['n']) * rank)
+                    pool.barrier()
+                assert_array_equal(pool.allreduce([rank], numpy.maximum), [3])
+                assert_array_equal(pool.allgather([rank, -rank]),
+                        [[0, 0], [1, -1], [2, -2], [3, -3]])
+                return x
+            for x in pool.spmd(work):
+                assert_array_equal(x, numpy.arange(10) * 60)
+
+            def work(rank):
+                pool.barrier()
+                if rank == 1:
+                    raise ValueError("rank 1")
+                pool.barrier()
+            try:
+                pool.spmd(work)
+                assert False
+            except sharedmem.SlaveException as e:
+                assert isinstance(e.reason, ValueError)
+
+    with sharedmem.MapReduce(np=0) as pool:
+        def work(rank):
+            return pool.allreduce(pool.bcast(numpy.ones(3)))
+        assert_array_equal(pool.spmd(work), [[1, 1, 1]])
+
+def test_reduction():
+    data = numpy.random.randint(10, size=(100, 50))
+    for np in [0, 4]:
+        with sharedmem.MapReduce(np=np) as pool:
+            hist = pool.reduction(10, dtype='i8')
+            top = pool.reduction((), dtype='i8', op=numpy.maximum, initial=-1)
+            def work(i):
+                hist.local[...] += numpy.bincount(data[i], minlength=10)
+                top.local[...] = max(top.local, data[i].max())
+            pool.map(work, range(100))
+            assert_array_equal(hist.value, numpy.bincount(data.ravel(), minlength=10))
+            assert_equal(top.value, 9)
+
+            # the buffers accumulate until reset
+            pool.mapslices(lambda sl: work(sl.start), 100, chunksize=1)
+            assert_array_equal(hist.value, 2 * numpy.bincount(data.ravel(), minlength=10))
+            hist.reset()
+            pool.map(work, range(10), chunksize='auto')
+            assert_array_equal(hist.value, numpy.bincount(data[:10].ravel(), minlength=10))
+
+    assert_raises(ValueError, sharedmem.ReductionBuffer, pool, 10, op=numpy.maximum)
+
+def test_ops_call():
+    from sharedmem.ops import pufunc
+    a = numpy.random.random(1000)
+    b = numpy.random.random((30, 70))
+    # small blocks, such that the calls are split
+    sin = pufunc(numpy.sin, cachebytes=512)
+    add = pufunc(numpy.add, cachebytes=512)
+    assert_array_equal(sin(a), numpy.sin(a))
+    assert_array_equal(add(b, b[0]), b + b[0])
+    assert_equal(add(numpy.arange(1000, dtype='f4'), 1.0).dtype, numpy.dtype('f4'))
+
+    out = sharedmem.empty_like(a)
+    out[...] = 0
+    assert add(a, 1.0, out=out, where=a > 0.5) is out
+    assert_array_equal(out, numpy.where(a > 0.5, a + 1.0, 0))
+
+    m, e = pufunc(numpy.frexp, cachebytes=512)(a)
+    assert_array_equal(m, numpy.frexp(a)[0])
+    assert_array_equal(e, numpy.frexp(a)[1])
+    assert_array_equal(sharedmem.ops.sqrt(a), numpy.sqrt(a))
+
+def test_ops_reduce():
+    from sharedmem.ops import pufunc
+    a = numpy.random.random(1000)
+    c = numpy.random.random((3, 5, 200))
+    add = pufunc(numpy.add, cachebytes=512)
+    maximum = pufunc(numpy.maximum, cachebytes=512)
+    subtract = pufunc(numpy.subtract, cachebytes=512)
+    for axis in [0, 2, None, (0, 2)]:
+        for keepdims in [False, True]:
+            r = add.reduce(c, axis=axis, keepdims=keepdims)
+            assert_equal(numpy.shape(r), numpy.add.reduce(c, axis=axis, keepdims=keepdims).shape)
+            assert_array_almost_equal(r, numpy.add.reduce(c, axis=axis, keepdims=keepdims))
+            assert_array_equal(maximum.reduce(c, axis=axis, keepdims=keepdims),
+                    numpy.maximum.reduce(c, axis=axis, keepdims=keepdims))
+    assert_array_equal(subtract.reduce(c, axis=2), numpy.subtract.reduce(c, axis=2))
+    assert_almost_equal(add.reduce(a, initial=5.0), a.sum() + 5.0)
+    assert_almost_equal(add.reduce(a, where=a > 0.5), a[a > 0.5].sum())
+
+    for axis in [0, 2]:
+        assert_array_almost_equal(add.accumulate(c, axis=axis), numpy.add.accumulate(c, axis=axis))
+    assert_array_almost_equal(add.accumulate(a), numpy.add.accumulate(a))
+    assert_array_equal(maximum.accumulate(a), numpy.maximum.accumulate(a))
+
+    for indices in [[0, 10, 10, 500, 999], numpy.arange(0, 1000, 7), [5, 3, 900]]:
+        assert_array_almost_equal(add.reduceat(a, indices), numpy.add.reduceat(a, indices))
+
+def test_ops_reductions():
+    from sharedmem import ops
+    c = numpy.random.random((3, 7, 9000))
+    for axis in [None, 0, 2, (0, 2)]:
+        for keepdims in [False, True]:
+            for name in ['sum', 'mean', 'var', 'min', 'max']:
+                r = getattr(ops, name)(c, axis=axis, keepdims=keepdims)
+                r0 = getattr(numpy, name)(c, axis=axis, keepdims=keepdims)
+                assert_equal(numpy.shape(r), numpy.shape(r0))
+                assert_array_almost_equal(r, r0)
+    for axis in [None, 0, 2]:
+        assert_array_equal(ops.argmin(c, axis=axis), numpy.argmin(c, axis=axis))
+        assert_array_equal(ops.argmax(c, axis=axis), numpy.argmax(c, axis=axis))
+    assert_array_equal(ops.argmin(c, axis=(0, 2)),
+            c.transpose(1, 0, 2).reshape(7, -1).argmin(axis=1))
+
+    # the first occurrence, NaN first
+    a = numpy.zeros(100000)
+    assert_equal(ops.argmax(a), 0)
+    a[70000] = numpy.nan
+    assert_equal(ops.argmin(a), 70000)
+
+    # deterministic: the pool gives the bits of a serial run
+    a = numpy.random.normal(size=100000) * 1e8
+    b = numpy.random.normal(size=(3, 100000))
+    def run():
+        return [ops.sum(a), ops.mean(a), ops.var(a), ops.sum(b, axis=1),
+                ops.add.reduce(a), ops.add.reduce(b, axis=1),
+                ops.add.accumulate(a), ops.add.accumulate(b, axis=1)]
+    pooled = run()
+    sharedmem.set_debug(True)
+    try:
+        serial = run()
+    finally:
+        sharedmem.set_debug(False)
+    for r, r0 in zip(pooled, serial):
+        assert_array_equal(r, r0)
+
+    # compensated
+    a = numpy.tile([1.0, 1e100, 1.0, -1e100], 25000)
+    assert_equal(ops.sum(a, compensated=True), 50000)
+    assert_equal(ops.mean(a, compensated=True), 0.5)
+
+def test_ops_sort():
+    from sharedmem import ops
+    n = 200000
+    a = numpy.random.random(n)
+    a[::10] = numpy.nan
+    for x in [a, numpy.random.zipf(1.5, n), numpy.arange(n), numpy.ones(n)]:
+        assert_array_equal(ops.sort(x), numpy.sort(x))
+        assert_array_equal(ops.argsort(x, kind='stable'), numpy.argsort(x, kind='mergesort'))
+        assert_array_equal(x[ops.argsort(x)], numpy.sort(x))
+
+    s = numpy.empty(n, dtype=[('a', 'i4'), ('b', 'f8')])
+    s['a'] = numpy.random.randint(5, size=n)
+    s['b'] = numpy.random.randint(100, size=n)
+    for order in [None, 'b', ['b', 'a']]:
+        assert_array_equal(ops.sort(s, order=order), numpy.sort(s, order=order))
+        assert_array_equal(ops.argsort(s, order=order, kind='mergesort'),
+                numpy.argsort(s, order=order, kind='mergesort'))
+
+    m = numpy.random.random((3, n))
+    assert_array_equal(ops.sort(m), numpy.sort(m))
+    assert_array_equal(ops.argsort(m, axis=0), numpy.argsort(m, axis=0))
+
 def test_sum():
     """ 
         Integrate [0, ... 1.0) with rectangle rule. 
@@ -307,6 +987,21 @@ def test_wordcount():
     for word in word_count:
         assert word_count[word] == parallel_result[word]
 
+def test_contrib_bincount():
+    import os
+    filename = os.path.join(os.path.dirname(__file__),
+            '..', '..', 'contrib', 'array.py')
+    if not os.path.exists(filename) or sys.version_info < (3, 5): return
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('contrib_array', filename)
+    array = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(array)
+
+    # the first chunks are short and see fewer bins
+    d = numpy.array([0] + [2] * 10 + [0, 1] * 5 + [2] * 200000)
+    assert_array_equal(array.bincount(d), [6, 5, 200010])
+    d = numpy.random.randint(0, 100, size=300000)
+    assert_array_equal(array.bincount(d), numpy.bincount(d))
 
 if __name__ == "__main__":
     import sys